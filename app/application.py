@@ -7,47 +7,89 @@ Email:      dave@djrogers.net.au
 Path:       /path/to/project/app/application.py
 
 Purpose:    Initializes and configures the Flask application, including setting up extensions,
-            database models, routes, and scheduled tasks like daily medication reminders and SMS alerts.
+            database models, routes, and scheduled tasks like daily medication reminders sent by SMS, email and browser notification.
 """
 
 from flask import Flask, current_app, render_template
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_mail import Mail, Message
 from flask_login import current_user
 from flask_wtf.csrf import CSRFProtect
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.colors import HexColor
-from app.models import User, UserMedicine, Medicine, MedicationReminder
+from app.models import User, UserMedicine, Medicine, MedicationReminder, DoseHistory
 from app.extensions import db, bcrypt
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from apscheduler.triggers.interval import IntervalTrigger
-from twilio.rest import Client
+from app.compression import init_compression
+from app.assets import init_assets
+from app.passwords import init_password_pool
+from app.ratelimit import init_rate_limiter
+from app.mailqueue import mail_queue
+from app.reportjobs import report_jobs
+from app.batchreports import init_batch_reports
+from app.wikicache import init_wiki_cache
+from app.druginfo import init_drug_info
+from app.catalogindex import init_medicine_index
+from app.catalogmerge import init_catalog_merge
+from app.dispatcher import reminder_dispatcher
+from app.notifiers import Recipient, init_notifiers, notify
+from app.profiling import init_profiling
+from app.metrics import init_metrics
+from app.querybudget import init_query_debug
+from app.cache import TieredCache
 from datetime import datetime, timedelta
+import os
 import time
-from pytz import timezone
+
+# Heavy dependencies - Alembic (via Flask-Migrate), APScheduler, Twilio and ReportLab - are
+# imported where they are first used, so workers that never need them don't pay to load them.
 
 
 # Initialize extensions
-migrate = Migrate()
 login_manager = LoginManager()
 
 # Set the login_view to point to the login route
 login_manager.login_view = "auth.login"
 
-# Initialize the scheduler
-scheduler = BackgroundScheduler(timezone=timezone("Australia/Brisbane"))
+# The scheduler is created by get_scheduler() on first use
+scheduler = None
 
 # Initialise Mail
 mail = Mail()
 
 
+def get_scheduler():
+    """
+    Name:       get_scheduler()
+    Purpose:    Returns the application's APScheduler instance, creating it on first use.
+    Parameters: None
+    Returns:    BackgroundScheduler: The shared scheduler.
+    """
+    global scheduler
+
+    if scheduler is None:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from pytz import timezone
+
+        scheduler = BackgroundScheduler(timezone=timezone("Australia/Brisbane"))
+    return scheduler
+
+
+def init_migrate(app):
+    """
+    Name:       init_migrate(app)
+    Purpose:    Initialises Flask-Migrate when running under the `flask` command line, which is
+                the only place the `flask db` commands are used. Flask-Migrate imports Alembic,
+                which on its own takes longer to load than the rest of the application.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        from flask_migrate import Migrate
+
+        Migrate(app, db)
+
+
 def create_app():
     """
     Name:       create_app()
@@ -63,9 +105,16 @@ def create_app():
     # App configuration
     app.config.from_object("config.Config")
 
-    # Configure Flask-Mail
-    app.config["MAIL_SERVER"] = "mx3594.syd1.mymailhosting.com"
-    app.config["MAIL_PORT"] = 587
+    # Behind PROXY_FIX_HOPS reverse proxies, take the client's address and scheme from their
+    # X-Forwarded-* headers (rate limiting and the metrics allowlist key on request.remote_addr).
+    # With no proxies configured the headers are ignored, as any client could send them
+    hops = app.config["PROXY_FIX_HOPS"]
+    if hops:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # Configure Flask-Mail (MAIL_SERVER and MAIL_PORT come from Config)
     app.config["MAIL_USE_TLS"] = False
     app.config["MAIL_USE_SSL"] = False
     app.config["MAIL_USERNAME"] = "dave@djrogers.net.au"
@@ -74,10 +123,24 @@ def create_app():
 
     # Initialise extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_migrate(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    mail_queue.init_app(app, mail)
+
+    # Generated PDF reports, keyed by (user_id, schedule_version)
+    app.extensions["report_cache"] = TieredCache(
+        max_entries=app.config["REPORT_CACHE_SIZE"],
+        max_bytes=app.config["REPORT_CACHE_MAX_BYTES"],
+        directory=app.config["REPORT_CACHE_DIR"],
+    )
+    report_jobs.init_app(app)
+    init_wiki_cache(app)
+    init_drug_info(app)
+    init_medicine_index(app)
+    init_notifiers(app, mail)
+    init_rate_limiter(app)
 
     # Import models and routes after extensions are initialized
     with app.app_context():
@@ -85,6 +148,7 @@ def create_app():
         from .auth.routes import auth_bp
         from .main.routes import main_bp
         from .medicines.routes import medicines
+        from .internal.routes import internal_bp
 
     # Initialise CSRF instance
     csrf = CSRFProtect(app)
@@ -98,16 +162,35 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(main_bp)
     app.register_blueprint(medicines, url_prefix="/medicines")
+    app.register_blueprint(internal_bp, url_prefix="/_internal")
+
+    # Request metrics (registered first so their after_request hook sees the final,
+    # compressed response), fingerprinted static assets, compression, profiling and
+    # N+1 query detection
+    init_metrics(app)
+    init_assets(app)
+    init_compression(app)
+    init_profiling(app)
+    init_query_debug(app)
+    init_batch_reports(app)
+    init_catalog_merge(app)
+
+    # Start the password hashing workers before the scheduler starts its threads
+    init_password_pool(app)
+
+    # Web-only workers can leave the reminder jobs to a dedicated scheduler process
+    if app.config["SCHEDULER_ENABLED"]:
+        from apscheduler.triggers.interval import IntervalTrigger
+
+        # Create daily job-creation job
+        get_scheduler().add_job(
+            schedule_daily_reminders,
+            IntervalTrigger(minutes=1),  # Trigger each minute
+            args=[app, mail],
+        )
 
-    # Create daily job-creation job
-    scheduler.add_job(
-        schedule_daily_reminders,
-        IntervalTrigger(minutes=1),  # Trigger each minute
-        args=[app, mail],
-    )
-
-    # Start APScheduler
-    scheduler.start()
+        # Start APScheduler
+        get_scheduler().start()
 
     return app
 
@@ -115,13 +198,17 @@ def create_app():
 def schedule_daily_reminders(app, mail):
     """
     Name:       schedule_daily_reminders(app, mail)
-    Purpose:    Resets the status of all medication reminders to 'pending', groups reminders by time,
-                and schedules SMS reminders for each user at the appropriate time using APScheduler.
+    Purpose:    Runs every minute. At 1am it resets the status of all medication reminders to
+                'pending' and emails the day's plan. Each run sends the reminders that have come
+                due since the previous one, one message per user per reminder time on each of
+                the user's channels, on the scheduler's worker threads.
     Parameters: app (Flask): The Flask application instance.
-                mail (Mail): The Flask-Mail instance used to send email notifications.
+                mail (Mail): The Flask-Mail instance (summary emails go through the mail queue).
     Returns:    None
     """
 
+    scheduler = get_scheduler()
+
     with app.app_context():
         # When this job runs at 1am reset all reminders to 'pending' and send out info email
         target_hour=1
@@ -136,225 +223,217 @@ def schedule_daily_reminders(app, mail):
             db.session.query(MedicationReminder).update(
                 {MedicationReminder.status: "Pending"}
             )
+            User.bump_data_version(status_only=True)
             db.session.commit()
             print("All jobs set to pending")
 
-        # Query all reminders for rest of today that need to be sent
-        meds_today = (
-            db.session.query(MedicationReminder)
-            .filter(MedicationReminder.reminder_time >= datetime.now().time())
-            .all()
-        )
-
-        # Group reminders by their reminder time
-        reminders_by_time = {}
-        for med in meds_today:
-            reminder_time = med.reminder_time
-            if reminder_time not in reminders_by_time:
-                reminders_by_time[reminder_time] = []
-            reminders_by_time[reminder_time].append(med)
-
-        # For each unique reminder time, schedule an SMS job
-        for reminder_time, meds in reminders_by_time.items():
-            for med in meds:
-                user = med.user
-                # Skip users who opted out of SMS reminders
-                if not user.receive_sms_reminders:
-                    continue
-
-                # Schedule a job to send the SMS for that reminder time
-                job = scheduler.add_job(
-                    send_sms,
-                    CronTrigger(hour=reminder_time.hour, minute=reminder_time.minute),
-                    args=[(reminder_time, meds, app)],
-                    id=f"send_sms_{reminder_time.hour}_{reminder_time.minute}",
-                    name=user.email,
-                    replace_existing=True,
+        # Send the reminders that have come due since the last tick. The dispatcher holds
+        # today's compiled plan, so this only queries the reminders that are actually due.
+        due = reminder_dispatcher.due(current_time)
+        due_ids = [
+            reminder_id
+            for _, users in due
+            for entries in users.values()
+            for reminder_id, _ in entries
+        ]
+        if due_ids:
+            reminders = {
+                reminder.id: reminder
+                for reminder in MedicationReminder.query.filter(
+                    MedicationReminder.id.in_(due_ids)
                 )
-                # print(f"Created Job {job.id} for {job.name} - It will run at {job.next_run_time}")
+            }
+            for reminder_time, users in due:
+                for user_id, entries in users.items():
+                    meds = [
+                        reminders[reminder_id]
+                        for reminder_id, _ in entries
+                        if reminder_id in reminders
+                    ]
+                    if not meds:
+                        continue
+                    doses = {reminder_id: dose for reminder_id, dose in entries if dose}
+
+                    # Run the send on the scheduler's worker threads
+                    scheduler.add_job(
+                        send_reminders,
+                        args=[(reminder_time, meds, app)],
+                        kwargs={"doses": doses},
+                        name=f"user-{user_id}",
+                    )
 
         # When run at 1:00am send an email with what has been scheduled
         if time_window_start <= current_time <= time_window_end:
-            # Collect job information to send in an email
-            job_info = []
-            jobs = scheduler.get_jobs()
-            for job in jobs:
-                trigger = job.trigger
-                if isinstance(trigger, CronTrigger):
-                    job_info.append(
-                        f"Name: {job.name}, Job ID: {job.id}, Next Run Time: {job.next_run_time} \n"
-                    )
-
-            # Format the job information into a string
-            job_info_str = "\n".join(job_info)
-
-            # Send the job info via email
+            # Send today's plan via email
             try:
                 msg = Message(
                     "Scheduled Daily Reminders", recipients=["dave@djrogers.net.au"]
                 )
-                msg.body = f"The following jobs were scheduled for today:\n\n{job_info_str}"
-                mail.send(msg)
-                print("Job information sent via email.")
+                msg.body = (
+                    f"The following reminders are scheduled for today:\n\n"
+                    f"{reminder_dispatcher.summary()}"
+                )
+                mail_queue.send(msg)
+                print("Job information queued for email.")
             except Exception as e:
                 print(f"Error sending email: {e}")
 
 
-def send_sms(job_data):
+def send_reminders(job_data, doses=None):
     """
-    Name:       send_sms(job_data)
-    Purpose:    Sends an SMS reminder to the user for a scheduled medication reminder using the Twilio API.
-                Updates the status of the medication reminders to 'sent' once the SMS is successfully delivered.
+    Name:       send_reminders(job_data, doses)
+    Purpose:    Sends a user's due medication reminders on every channel the user has chosen -
+                SMS, email and/or browser notifications - at once, each on its own channel's
+                pool (see notifiers.py). Once any channel has delivered them, the reminders'
+                status is set to 'sent' and each one is recorded in the user's dose history,
+                once per channel it was delivered on.
     Parameters: job_data (tuple): A tuple containing the reminder time, list of medications, and Flask app instance.
+                doses (dict): Doses from the medicines' schedules, keyed by reminder id, added to
+                              the reminders' messages.
     Returns:    None
     """
+
     reminder_time, meds, app = job_data
+    doses = doses or {}
 
     with app.app_context():
-        # Initialise Twilio client
-        twilio_client = Client(Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN)
-
-        message_body = "DoseTracker Reminder: "
+        messages = {}
         for med in meds:
-            message_body += f"{med.reminder_message}\n"
+            messages[med.id] = med.reminder_message
+            if doses.get(med.id):
+                messages[med.id] = f"{med.reminder_message} ({doses[med.id]})"
+        message_body = "\n".join(messages.values())
 
-        # Retrieve the user's phone number from the database
+        # Copy what the channels need out of the session, for their worker threads
         user = User.query.get(meds[0].user_id)
-        if user and user.phone_number:
-            # remove the leading '0' in the mobile number
-            if user.phone_number.startswith("0"):
-                user_phone_number = user.phone_number[1:]
-            # add +61 country code
-            user_phone_number = f"+61 {user_phone_number}"
-        else:
-            print("User phone number is missing.")
+        if user is None:
+            print(f"User for reminder {meds[0].id} no longer exists.")
             return
+        recipient = Recipient(
+            user_id=user.id,
+            phone_number=user.phone_number,
+            email=user.email,
+            push_subscriptions=[
+                subscription.subscription_info() for subscription in user.push_subscriptions
+            ],
+        )
+        channels = user.get_reminder_channels()
+
+        # Send on every channel at once
+        delivered = notify(
+            app.extensions["notifiers"],
+            recipient,
+            channels,
+            "DoseTracker Reminder",
+            message_body,
+            app.config["NOTIFY_TIMEOUT"],
+        )
+        if not delivered:
+            print(
+                f"Reminder for {reminder_time} not delivered to user {user.id} "
+                f"(channels: {', '.join(channels) or 'none'})"
+            )
+            return
+        print(
+            f"Sent reminder ({message_body}) for {reminder_time} to user {user.id} "
+            f"by {', '.join(delivered)}"
+        )
 
-        # Send the reminder via Twilio SMS
+        # Set the medication status to 'sent' and record it in the dose history
         try:
-            if message_body:
-                twilio_client.messages.create(
-                    body=message_body,
-                    from_=Config.TWILIO_PHONE_NUMBER,
-                    to=user_phone_number,
-                )
-
-            print(f"Sent reminder ({message_body}) for {reminder_time} to {user_phone_number}")
-
-            # Set the medication status to 'sent'
-            try:
-                for med in meds:
-                    med = db.session.merge(med)
-                    med.status = "sent"
-                db.session.flush()
-                db.session.commit()
-                print(f"Updated status to 'sent' for {len(meds)} medications.")
-                
-            except Exception as e:
-                print(f"Error updating status: {e}")
-
+            sent_at = datetime.now().replace(microsecond=0)
+            catalogue = current_app.extensions["medicine_index"]
+            for med in meds:
+                med = db.session.merge(med)
+                med.status = "sent"
+                medicine_name = catalogue.name(med.user_medicine.medicine_id)
+                for channel in delivered:
+                    db.session.add(
+                        DoseHistory(
+                            user_id=med.user_id,
+                            user_medicine_id=med.user_medicine_id,
+                            medicine_name=medicine_name,
+                            reminder_time=reminder_time,
+                            reminder_message=messages[med.id],
+                            channel=channel,
+                            sent_at=sent_at,
+                        )
+                    )
+            User.bump_data_version([user.id], status_only=True)
+            db.session.commit()
+            print(f"Updated status to 'sent' for {len(meds)} medications.")
         except Exception as e:
-            print(f"Error sending SMS for {reminder_time} to {user_phone_number}: {e}")
+            db.session.rollback()
+            print(f"Error updating status: {e}")
 
 
-def generate_pdf():
+def get_report_pdf(user):
     """
-    Name:       generate_pdf()
-    Purpose:    Generates a PDF report for the logged-in user, including a list of their medications,
-                using the ReportLab library. The PDF includes a title, user's email, and a table of medication details.
-    Parameters: None
-    Returns:    pdf_data (bytes): The generated PDF content as bytes.
+    Name:       get_report_pdf(user)
+    Purpose:    Returns a user's PDF medicines report, serving it from the report cache when the
+                user's data hasn't changed since it was last generated. The cache is keyed by
+                (user_id, schedule_version), so any medicine or reminder edit produces a new
+                report, but sending reminders (which only changes their status) doesn't.
+    Parameters: user (User): The user the report is for.
+    Returns:    bytes: The PDF content.
     """
 
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
+    cache = current_app.extensions["report_cache"]
+    cache_key = (user.id, user.schedule_version)
 
-    # Title and logo area
-    title_height = 720
-    title_margin = 20
+    pdf_data = cache.get(cache_key)
+    if pdf_data is None:
+        pdf_data = generate_pdf(user.id)
+        cache.set(cache_key, pdf_data)
+    return pdf_data
 
-    # Set title background colour (mauve)
-    c.setFillColor("#9b4d96")
-    c.rect(0, title_height, 600, 80, fill=1)
 
-    # Add the logo
-    logo_path = Config.DT_SERVER_LOGO_PATH + "app/static/img/logo.png"
-    c.drawImage(logo_path, 30, title_height + 10, width=55, height=50)
+def generate_pdf(user_id=None):
+    """
+    Name:       generate_pdf(user_id)
+    Purpose:    Generates a PDF report for a user, including a list of their medications,
+                using the ReportLab library. The PDF includes a title, user's email, and a table of medication details.
+                Most callers should use get_report_pdf(), which caches the result.
+    Parameters: user_id (int): The user to report on. Defaults to the logged-in user.
+    Returns:    pdf_data (bytes): The generated PDF content as bytes.
+    """
+    from app.pdfreport import render_pdf
 
-    # Set title text colour to white for contrast
-    c.setFillColor("#FFFFFF")
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(100, title_height + 25, "Dose Tracker")
+    if user_id is None:
+        user_id = current_user.id
 
     # Query the user's email from the Users table
-    user = User.query.get(current_user.id)
+    user = User.query.get(user_id)
     user_email = user.email if user else "Unknown"
 
-    # Subtitle: User's Email (Dark grey)
-    c.setFillColor("#333333")
-    c.setFont("Helvetica", 12)
-    c.drawString(100, title_height - title_margin, f"Report for: {user_email}")
-
-    # Set up the table header with a background colour (Mauve)
-    c.setFillColor("#9b4d96")
-    c.rect(30, 670, 540, 20, fill=1)
-
-    # Table header text (white)
-    c.setFillColor("#FFFFFF")
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(30, 675, "Name")
-    c.drawString(150, 675, "Dosage")
-    c.drawString(250, 675, "Frequency")
-    c.drawString(350, 675, "Notes")
-
-    # Set the font for table content (Black)
-    c.setFillColor("#000000")
-    c.setFont("Helvetica", 10)
-
-    # Query medicines associated with the current user
-    user_medicines = UserMedicine.query.filter_by(user_id=current_user.id).all()
-    medicines = []
-
-    # Fetching associated medicine names for each user_medicine entry
-    y_position = 650
-    for user_medicine in user_medicines:
-        medicine = Medicine.query.get(user_medicine.medicine_id)
-        medicines.append(
-            {
-                "name": medicine.name,
-                "dosage": user_medicine.dosage,
-                "frequency": user_medicine.frequency,
-                "notes": user_medicine.notes or "N/A",
-            }
-        )
+    # Query medicines associated with the user, with their names, in one query
+    user_medicines = (
+        db.session.query(UserMedicine, Medicine)
+        .join(Medicine, UserMedicine.medicine_id == Medicine.id)
+        .filter(UserMedicine.user_id == user_id)
+        .order_by(UserMedicine.id)
+        .all()
+    )
+    medicines = [
+        report_row(medicine, user_medicine) for user_medicine, medicine in user_medicines
+    ]
 
-        # Add medicine data to the table
-        c.drawString(30, y_position, medicine.name)
-        c.drawString(150, y_position, user_medicine.dosage)
-        c.drawString(250, y_position, user_medicine.frequency)
-        c.drawString(350, y_position, user_medicine.notes or "N/A")
-
-        y_position -= 20  # Move to the next row
-
-        # Check if the y_position is too low, and create a new page if necessary
-        if y_position < 100:
-            c.showPage()
-            c.setFont("Helvetica-Bold", 12)
-            c.setFillColor("#9b4d96")
-            c.rect(30, 670, 540, 20, fill=1)
-            c.setFillColor("#FFFFFF")
-            c.drawString(30, 675, "Name")
-            c.drawString(150, 675, "Dosage")
-            c.drawString(250, 675, "Frequency")
-            c.drawString(350, 675, "Notes")
-            c.setFont("Helvetica", 10)
-            y_position = 650  # Reset the y_position for the new page
-
-    # Save the PDF to the buffer
-    c.save()
-
-    # Get the PDF content as bytes
-    pdf_data = buffer.getvalue()
-    buffer.close()
+    return render_pdf(user_email, medicines)
 
-    return pdf_data
+
+def report_row(medicine, user_medicine):
+    """
+    Name:       report_row(medicine, user_medicine)
+    Purpose:    Converts a user's medicine into the plain dict that pdfreport.render_pdf() draws
+                as a row.
+    Parameters: medicine (Medicine): The catalogue medicine.
+                user_medicine (UserMedicine): The user's dosage, frequency and notes for it.
+    Returns:    dict: The row's name, dosage, frequency and notes.
+    """
+
+    return {
+        "name": medicine.name,
+        "dosage": user_medicine.dosage,
+        "frequency": user_medicine.frequency,
+        "notes": user_medicine.notes or "N/A",
+    }
@@ -0,0 +1,215 @@
+"""
+assets.py
+---------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/assets.py
+
+Purpose:    Fingerprints static files (CSS, JavaScript, images) into content-hashed copies and
+            records them in a manifest, so templates can reference them through `asset_url()` and
+            browsers can cache them forever with `Cache-Control: immutable`. The manifest is
+            built ahead of time with `flask assets build` and loaded once at startup.
+
+            Static files are sent as files rather than buffered, so the response compression hook
+            passes them by. Instead the build also writes Brotli (.br) and gzip (.gz) copies of
+            each fingerprinted text asset, at the highest levels as they are only compressed
+            once, and those are served to clients that accept them.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import click
+import brotli
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+from app.compression import COMPRESSIBLE_MIMETYPES, choose_encoding
+
+
+# Fingerprinted copies and the manifest are written to static/<ASSETS_DIST_DIR>
+ASSETS_DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Static files that get fingerprinted by the build step
+ASSET_EXTENSIONS = (".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".woff", ".woff2")
+
+# Pre-compressed copies written next to each fingerprinted text asset, by content coding
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+PRECOMPRESSED_EXTENSIONS = (".css", ".js", ".svg", ".ico")
+
+# One year - the longest lifetime caches honour
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+assets_cli = AppGroup("assets", help="Build fingerprinted static assets.")
+
+
+def init_assets(app):
+    """
+    Name:       init_assets(app)
+    Purpose:    Loads the asset manifest (if one has been built), exposes `asset_url()` to Jinja
+                templates, sets long-lived cache headers on fingerprinted files and registers the
+                `flask assets build` command.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    app.extensions["asset_manifest"] = load_manifest(app.static_folder)
+    app.jinja_env.globals["asset_url"] = asset_url
+    app.cli.add_command(assets_cli)
+
+    # Fingerprinted file names, used to recognise immutable responses
+    fingerprinted = {
+        f"{ASSETS_DIST_DIR}/{path}" for path in app.extensions["asset_manifest"].values()
+    }
+
+    @app.after_request
+    def set_static_cache_headers(response):
+        if request.endpoint != "static" or response.status_code != 200:
+            return response
+        filename = (request.view_args or {}).get("filename", "")
+        if filename in fingerprinted:
+            if app.config.get("COMPRESS_ENABLED", True):
+                response = precompressed_response(response, app.static_folder, filename)
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def precompressed_response(response, static_folder, filename):
+    """
+    Name:       precompressed_response(response, static_folder, filename)
+    Purpose:    Swaps a static file response for its pre-compressed copy when the client accepts
+                an encoding the build wrote one for.
+    Parameters: response (Response): The static file response.
+                static_folder (str): The application's static folder.
+                filename (str): The requested file, relative to the static folder.
+    Returns:    Response: The pre-compressed copy's response, or the original response.
+    """
+
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return response
+    compressed_name = filename + PRECOMPRESSED_SUFFIXES[encoding]
+    if not os.path.isfile(os.path.join(static_folder, compressed_name)):
+        return response
+
+    compressed = send_from_directory(static_folder, compressed_name, mimetype=response.mimetype)
+    compressed.headers["Content-Encoding"] = encoding
+    compressed.vary.add("Accept-Encoding")
+    return compressed
+
+
+def load_manifest(static_folder):
+    """
+    Name:       load_manifest(static_folder)
+    Purpose:    Reads the asset manifest produced by `build_manifest()`.
+    Parameters: static_folder (str): The application's static folder.
+    Returns:    dict: Mapping of logical file name to fingerprinted file name, or an empty dict
+                if no manifest has been built.
+    """
+
+    manifest_path = os.path.join(static_folder, ASSETS_DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename):
+    """
+    Name:       asset_url(filename)
+    Purpose:    Returns the URL for a static file, pointing at its fingerprinted copy when the
+                manifest knows about it and falling back to the plain static URL otherwise.
+    Parameters: filename (str): The logical static file name (e.g. 'css/style.css').
+    Returns:    str: The URL to use in templates.
+    """
+
+    manifest = current_app.extensions.get("asset_manifest", {})
+    fingerprinted = manifest.get(filename)
+    if fingerprinted:
+        return url_for("static", filename=f"{ASSETS_DIST_DIR}/{fingerprinted}")
+    return url_for("static", filename=filename)
+
+
+def build_manifest(static_folder):
+    """
+    Name:       build_manifest(static_folder)
+    Purpose:    Copies every static asset to `<name>.<hash>.<ext>` under the dist directory,
+                with pre-compressed copies of the text assets, and writes a manifest mapping
+                logical names to the fingerprinted copies. Stale copies from previous builds are
+                removed.
+    Parameters: static_folder (str): The application's static folder.
+    Returns:    dict: The manifest that was written.
+    """
+
+    dist_folder = os.path.join(static_folder, ASSETS_DIST_DIR)
+    if os.path.isdir(dist_folder):
+        shutil.rmtree(dist_folder)
+    os.makedirs(dist_folder)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        # Never fingerprint the output of a previous build
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder]
+
+        for name in sorted(files):
+            if not name.lower().endswith(ASSET_EXTENSIONS):
+                continue
+
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, "/")
+
+            with open(source, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+
+            stem, ext = os.path.splitext(logical)
+            fingerprinted = f"{stem}.{digest}{ext}"
+
+            target = os.path.join(dist_folder, fingerprinted)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            if ext.lower() in PRECOMPRESSED_EXTENSIONS:
+                write_precompressed(target)
+            manifest[logical] = fingerprinted
+
+    with open(os.path.join(dist_folder, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def write_precompressed(path):
+    """
+    Name:       write_precompressed(path)
+    Purpose:    Writes Brotli and gzip copies of a file next to it, skipping an encoding that
+                doesn't make the file smaller.
+    Parameters: path (str): The file to compress.
+    Returns:    None
+    """
+
+    with open(path, "rb") as f:
+        data = f.read()
+    copies = {
+        "br": brotli.compress(data, quality=11),
+        "gzip": gzip.compress(data, compresslevel=9, mtime=0),
+    }
+    for encoding, compressed in copies.items():
+        if len(compressed) < len(data):
+            with open(path + PRECOMPRESSED_SUFFIXES[encoding], "wb") as f:
+                f.write(compressed)
+
+
+@assets_cli.command("build")
+def build_command():
+    """Fingerprint static files and write the asset manifest."""
+    manifest = build_manifest(current_app.static_folder)
+    for logical, fingerprinted in sorted(manifest.items()):
+        click.echo(f"{logical} -> {ASSETS_DIST_DIR}/{fingerprinted}")
+    click.echo(f"Wrote {len(manifest)} assets to the manifest.")
@@ -8,7 +8,9 @@ Path:       /path/to/project/app/auth/routes.py
 
 Purpose:    Contains routes related to user authentication, registration, password reset,
             and account management. Handles user login, logout, sign-up, password recovery,
-            and the user admin page for updating user information and preferences like SMS reminders.
+            and the user admin page for updating user information and reminder preferences: whether
+            to receive reminders, and whether by SMS, email or browser notification. Browsers post
+            their push subscriptions to /push-subscription.
 """
 
 from flask import (
@@ -19,12 +21,15 @@ from flask import (
     url_for,
     flash,
     current_app,
+    jsonify,
 )
 from app.application import db
-from flask_bcrypt import Bcrypt
 from flask_mail import Message
 from flask_login import login_user, login_required, current_user, logout_user
-from app.models import User
+from app.models import User, PushSubscription
+from app.passwords import hash_password, needs_rehash, PasswordHasherBusy
+from app.ratelimit import rate_limited
+from app.mailqueue import mail_queue
 from app.forms import (
     LoginForm,
     SignUpForm,
@@ -42,10 +47,11 @@ auth_bp = Blueprint("auth", __name__)
 SECRET_KEY = current_app.config["SECRET_KEY"]
 s = Serializer(SECRET_KEY)
 
-bcrypt = Bcrypt()
+BUSY_MESSAGE = "The server is busy right now, please try again in a moment."
 
 
 @auth_bp.route("/login", methods=["GET", "POST"])
+@rate_limited
 def login():
     """
     Name:       login()
@@ -69,7 +75,17 @@ def login():
         # Find the user by email
         user = User.query.filter_by(email=email).first()
 
-        if user and user.check_password(password):  # Check credentials
+        try:
+            valid = user is not None and user.check_password(password)  # Check credentials
+            # Upgrade the stored hash if the configured bcrypt cost has changed
+            if valid and needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash(BUSY_MESSAGE, "warning")
+            return render_template("index.html", form=form, page_class="index_page"), 503
+
+        if valid:
             login_user(user, remember=True)
             flash("You have been logged in!", "success")
             return redirect(
@@ -102,6 +118,7 @@ def logout():
 
 
 @auth_bp.route("/sign-up", methods=["GET", "POST"])
+@rate_limited
 def sign_up():
     """
     Name:       sign_up()
@@ -129,7 +146,11 @@ def sign_up():
             return redirect(url_for("auth.sign_up"))
 
         # Hash the password
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
+        try:
+            hashed_password = hash_password(password)
+        except PasswordHasherBusy:
+            flash(BUSY_MESSAGE, "warning")
+            return render_template("sign_up.html", form=form, page_class="sign_up_page"), 503
 
         # Create new user
         new_user = User(
@@ -151,6 +172,7 @@ def sign_up():
 
 
 @auth_bp.route("/forgot_password", methods=["GET", "POST"])
+@rate_limited
 def forgot_password():
     """
     Name:       forgot_password()
@@ -178,7 +200,7 @@ def forgot_password():
             # Send the reset password link via email
             msg = Message("Password Reset Request", recipients=[email])
             msg.body = f"Click the link to reset your password: {reset_link}"
-            current_app.extensions["mail"].send(msg)
+            mail_queue.send(msg)
 
             flash("Check your email for a password reset link!", "info")
             return redirect(url_for("auth.login"))
@@ -223,7 +245,11 @@ def reset_password(token):
     if form.validate_on_submit():
         new_password = form.password.data
         # Hash the new password using bcrypt
-        hashed_password = bcrypt.generate_password_hash(new_password).decode("utf-8")
+        try:
+            hashed_password = hash_password(new_password)
+        except PasswordHasherBusy:
+            flash(BUSY_MESSAGE, "warning")
+            return render_template("reset_password.html", form=form, token=token), 503
 
         # Update the user's password in the database
         user.password_hash = hashed_password
@@ -241,10 +267,11 @@ def user_admin():
     """
     Name:       user_admin()
     Purpose:    Provides the user with the ability to update their phone number
-                and SMS reminder preferences. It pre-fills the form with the
-                current user's information and allows them to submit changes.
-                Updates are committed to the database, and any errors during the
-                process are handled appropriately.
+                and reminder preferences: whether to receive reminders, and the
+                channels (SMS, email, browser notifications) they are sent on. It
+                pre-fills the form with the current user's information and allows
+                them to submit changes. Updates are committed to the database, and
+                any errors during the process are handled appropriately.
     Parameters: None
     Returns:    Response: Renders the user admin page with the form, or redirects
                            the user with a flash message indicating the success or failure
@@ -257,11 +284,17 @@ def user_admin():
     if request.method == "GET":
         form.phone_number.data = current_user.phone_number
         form.receive_sms_reminders.data = current_user.receive_sms_reminders
+        form.reminder_channels.data = current_user.get_reminder_channels()
 
     if form.validate_on_submit():
+        # The reminder dispatcher only notices users whose schedule_version has moved
+        if form.receive_sms_reminders.data != current_user.receive_sms_reminders:
+            User.bump_data_version([current_user.id])
+
         # Update user information
         current_user.phone_number = form.phone_number.data
         current_user.receive_sms_reminders = form.receive_sms_reminders.data
+        current_user.reminder_channels = ",".join(form.reminder_channels.data)
 
         try:
             db.session.commit()
@@ -272,4 +305,51 @@ def user_admin():
             flash(f"Error: {e}", "error")
             return redirect(url_for("auth.user_admin"))  # Redirect to the same page
 
-    return render_template("user_admin.html", form=form)
+    return render_template(
+        "user_admin.html",
+        form=form,
+        vapid_public_key=current_app.config["VAPID_PUBLIC_KEY"],
+        push_enabled="push" in current_app.extensions["notifiers"],
+    )
+
+
+@auth_bp.route("/push-subscription", methods=["POST"])
+@login_required
+def push_subscription():
+    """
+    Name:       push_subscription()
+    Purpose:    Stores the Web Push subscription the user's browser created on the user admin
+                page, so browser notification reminders can be sent to it. A browser that
+                subscribes again (or for another user) replaces its old subscription.
+    Parameters: None (JSON body: the browser's PushSubscription, with endpoint and keys)
+    Returns:    JSON: {"status": "subscribed"}, or 400 if the subscription is malformed.
+    """
+
+    subscription = request.get_json(silent=True) or {}
+    endpoint = subscription.get("endpoint")
+    keys = subscription.get("keys") or {}
+    if (
+        not isinstance(endpoint, str)
+        or not endpoint.startswith("https://")
+        or len(endpoint) > 500
+        or not keys.get("p256dh")
+        or not keys.get("auth")
+    ):
+        return jsonify({"error": "Invalid push subscription"}), 400
+
+    try:
+        PushSubscription.query.filter_by(endpoint=endpoint).delete()
+        db.session.add(
+            PushSubscription(
+                user_id=current_user.id,
+                endpoint=endpoint,
+                p256dh=keys["p256dh"][:255],
+                auth=keys["auth"][:255],
+            )
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving push subscription: {e}")
+        return jsonify({"error": "Could not save the subscription"}), 500
+    return jsonify({"status": "subscribed"})
@@ -0,0 +1,200 @@
+"""
+batchreports.py
+---------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/batchreports.py
+
+Purpose:    Generates PDF medicine reports for many users at once, e.g. weekly summaries for every
+            patient of a care facility. Rather than going through the web route one user at a
+            time, users are processed in chunks of REPORT_BATCH_CHUNK: each chunk's users and
+            medicines are loaded with two bulk queries, and the PDFs are rendered in parallel in a
+            pool of REPORT_BATCH_WORKERS processes. Finished reports are written to a directory,
+            queued on the mail queue, or both. Emailing waits for each chunk's reports to be
+            delivered before queueing the next chunk's, so a run over every user never holds more
+            than two chunks of attachments in memory.
+
+            Run it from cron with, for example:
+
+                flask reports batch --all --output /var/reports/weekly
+                flask reports batch --user-id 12 --user-id 15 --email
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app.extensions import db
+from app.models import User, UserMedicine, Medicine
+from app.mailqueue import mail_queue
+from app.reportjobs import build_report_message
+
+
+reports_cli = AppGroup("reports", help="Generate PDF medicine reports in bulk.")
+
+
+def init_batch_reports(app):
+    """
+    Name:       init_batch_reports(app)
+    Purpose:    Registers the `flask reports batch` command.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    app.cli.add_command(reports_cli)
+
+
+def load_report_data(user_ids):
+    """
+    Name:       load_report_data(user_ids)
+    Purpose:    Loads everything needed to render the reports of a set of users in two queries:
+                one for the users and one for all of their medicines.
+    Parameters: user_ids (list): The users to load.
+    Returns:    dict: Maps user_id to (email, list of row dicts for render_pdf()), in user_id
+                order. Ids with no matching user are left out.
+    """
+    from app.application import report_row
+
+    users = (
+        db.session.query(User.id, User.email)
+        .filter(User.id.in_(user_ids))
+        .order_by(User.id)
+        .all()
+    )
+    data = {user_id: (email, []) for user_id, email in users}
+
+    rows = (
+        db.session.query(UserMedicine, Medicine)
+        .join(Medicine, UserMedicine.medicine_id == Medicine.id)
+        .filter(UserMedicine.user_id.in_(list(data)))
+        .order_by(UserMedicine.user_id, UserMedicine.id)
+    )
+    for user_medicine, medicine in rows:
+        data[user_medicine.user_id][1].append(report_row(medicine, user_medicine))
+
+    return data
+
+
+def _render(job):
+    # Runs in a worker process: job is (user_id, email, medicines, logo_path)
+    from app.pdfreport import render_pdf
+
+    user_id, email, medicines, logo_path = job
+    return user_id, email, render_pdf(email, medicines, logo_path)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def run_batch(user_ids, output_dir=None, send_email=False, workers=None, chunk_size=None):
+    """
+    Name:       run_batch(user_ids, output_dir, send_email, workers, chunk_size)
+    Purpose:    Renders the PDF reports of the given users in a process pool, writing each one to
+                output_dir as report-<user_id>-<date>.pdf and/or queueing it for email to the
+                user. With send_email, each chunk's reports are only queued once the previous
+                chunk's have been delivered. Must be called inside an application context.
+    Parameters: user_ids (list): The users to report on.
+                output_dir (str): Directory to write the PDFs to, or None.
+                send_email (bool): Whether to email each report to its user.
+                workers (int): Number of worker processes. Defaults to REPORT_BATCH_WORKERS;
+                               0 renders in this process.
+                chunk_size (int): Users loaded and rendered per chunk. Defaults to
+                                  REPORT_BATCH_CHUNK.
+    Returns:    dict: documents, bytes, seconds and docs_per_second for the run.
+    """
+    from app.pdfreport import default_logo_path
+
+    config = current_app.config
+    workers = config["REPORT_BATCH_WORKERS"] if workers is None else workers
+    chunk_size = chunk_size or config["REPORT_BATCH_CHUNK"]
+    logo_path = default_logo_path()
+    today = date.today().isoformat()
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    pool = None
+    if workers > 0:
+        # Forked like the password pool, so workers don't re-import run.py
+        pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        )
+
+    documents = 0
+    total_bytes = 0
+    started = time.perf_counter()
+    try:
+        for chunk in _chunks(sorted(set(user_ids)), chunk_size):
+            data = load_report_data(chunk)
+            jobs = [
+                (user_id, email, medicines, logo_path)
+                for user_id, (email, medicines) in data.items()
+            ]
+            # Release the chunk's ORM state before rendering the next one
+            db.session.expunge_all()
+
+            if pool is None:
+                results = list(map(_render, jobs))
+            else:
+                results = list(
+                    pool.map(_render, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+                )
+
+            # The mail queue holds its messages in memory, so wait for the previous chunk's
+            # reports to be delivered before queueing this one's: at most two chunks of PDFs are
+            # held at once, while the next chunk still renders as the previous one sends
+            if send_email:
+                mail_queue.flush()
+
+            for user_id, email, pdf_data in results:
+                if output_dir:
+                    path = os.path.join(output_dir, f"report-{user_id}-{today}.pdf")
+                    with open(path, "wb") as f:
+                        f.write(pdf_data)
+                if send_email:
+                    mail_queue.send(build_report_message(email, pdf_data))
+                documents += 1
+                total_bytes += len(pdf_data)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    seconds = time.perf_counter() - started
+    return {
+        "documents": documents,
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "docs_per_second": documents / seconds if seconds > 0 else 0.0,
+    }
+
+
+@reports_cli.command("batch")
+@click.option("--user-id", "user_ids", multiple=True, type=int, help="User to report on (repeatable).")
+@click.option("--all", "all_users", is_flag=True, help="Report on every user.")
+@click.option("--output", "output_dir", type=click.Path(file_okay=False), help="Directory to write PDFs to.")
+@click.option("--email", "send_email", is_flag=True, help="Email each report to its user.")
+@click.option("--workers", type=int, default=None, help="Worker processes (0 renders inline).")
+def batch_command(user_ids, all_users, output_dir, send_email, workers):
+    """Render PDF reports for many users in parallel."""
+    if not output_dir and not send_email:
+        raise click.UsageError("Give --output, --email or both.")
+    if all_users:
+        user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    if not user_ids:
+        raise click.UsageError("Give --user-id or --all.")
+
+    stats = run_batch(user_ids, output_dir=output_dir, send_email=send_email, workers=workers)
+    if send_email:
+        click.echo("Waiting for the mail queue to drain...")
+        mail_queue.flush()
+    click.echo(
+        f"Rendered {stats['documents']} reports ({stats['bytes'] / 1024:.0f} KiB) in "
+        f"{stats['seconds']:.2f}s - {stats['docs_per_second']:.1f} docs/sec"
+    )
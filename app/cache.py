@@ -0,0 +1,227 @@
+"""
+cache.py
+--------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/cache.py
+
+Purpose:    Provides small in-process caches used to avoid re-querying and re-rendering data that
+            only changes when a user edits it. Entries are keyed by (user_id, data_version), so a
+            write that bumps `User.data_version` makes every older entry unreachable; stale
+            entries then age out of the LRU rather than needing explicit deletes.
+
+            - LRUCache:     thread-safe in-memory LRU with an entry and byte-size cap.
+            - DiskCache:    optional second tier of pickled entries in a directory, shared by
+                            every worker process on the host.
+            - TieredCache:  LRUCache in front of an optional DiskCache.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with an entry-count and an optional byte-size cap.
+
+    Attributes:
+        max_entries (int): Maximum number of entries held before the oldest is evicted.
+        max_bytes (int): Maximum total size of `bytes`/`str` values, or None for no limit.
+        hits (int): Number of successful lookups.
+        misses (int): Number of failed lookups.
+
+    Methods:
+        get(key): Returns the cached value or None, marking the entry as recently used.
+        set(key, value): Stores a value, evicting the least recently used entries if needed.
+        delete(key): Removes an entry if present.
+        clear(): Removes every entry.
+        stats(): Returns a dict of hit/miss counters and current size.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = len(value) if isinstance(value, (bytes, str)) else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Never cache something bigger than the whole cache
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._total_bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._total_bytes -= self._sizes.pop(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    Directory-backed cache of pickled values, intended as a second tier behind an LRUCache so
+    entries survive restarts and are shared between worker processes.
+
+    Each key is stored in its own file named after a hash of the key, written to a temporary
+    file and atomically renamed so readers never see a partial entry. When the number of files
+    exceeds `max_entries`, the least recently written files are removed.
+
+    Attributes:
+        directory (str): Directory the cache files live in.
+        max_entries (int): Maximum number of files kept on disk.
+
+    Methods:
+        get(key): Returns the cached value or None.
+        set(key, value): Stores a value on disk.
+        delete(key): Removes an entry if present.
+    """
+
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.cache")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # Guard against (astronomically unlikely) hash collisions
+        return value if stored_key == key else None
+
+    def set(self, key, value):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Error writing cache entry: {e}")
+            return
+        self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _prune(self):
+        try:
+            entries = [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".cache")
+            ]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class TieredCache:
+    """
+    An in-memory LRUCache in front of an optional DiskCache. Disk hits are promoted into memory.
+
+    Attributes:
+        memory (LRUCache): The in-process tier.
+        disk (DiskCache): The on-disk tier, or None if disabled.
+
+    Methods:
+        get(key): Returns the cached value from memory, then disk, or None.
+        set(key, value): Stores a value in both tiers.
+        delete(key): Removes a value from both tiers.
+        stats(): Returns the memory tier's statistics.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None, directory=None, disk_max_entries=1024):
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.disk = DiskCache(directory, disk_max_entries) if directory else None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self):
+        return self.memory.stats()
@@ -0,0 +1,347 @@
+"""
+catalogindex.py
+---------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/catalogindex.py
+
+Purpose:    A process-wide, in-memory copy of the medicines catalogue. The catalogue is small
+            and rarely changes, but nearly every page resolves medicine ids to names, so routes
+            look medicines up here (name(), find()) instead of querying for each one. It also
+            suggests existing medicine names while a user types in the add-medicine form, so they
+            pick the catalogue entry instead of creating a near-duplicate.
+
+            Names are case-folded and kept in one sorted list, so the suggestions for a prefix are
+            a contiguous run found with a binary search - no database query and no LIKE scan per
+            keystroke. The index is loaded from the catalogue on first use and then kept current
+            incrementally: this process updates medicines it creates or renames straight away,
+            and at most every CATALOG_INDEX_REFRESH seconds it checks the catalogue's version -
+            its row count, highest id and latest updated_at, in one aggregate query. If that has
+            changed, only the medicines inserted or renamed since are fetched, and if medicines
+            were removed (e.g. by `flask catalog merge`) the index is reloaded.
+
+            The index also keeps a trigram index of the names, so a name typed in the form can be
+            checked against the catalogue for likely misspellings ("Paracetmol") before it is
+            added as a new medicine. Similarity is the Jaccard index of the two names' trigram
+            sets, as in PostgreSQL's pg_trgm, and only medicines sharing at least one trigram
+            with the name are scored.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from app.extensions import db
+from app.models import Medicine
+from app.wikicache import normalize_name
+
+
+def trigrams(name):
+    """
+    Name:       trigrams(name)
+    Purpose:    Returns the set of trigrams of a normalised name, with each word padded so that
+                word starts and ends count.
+    Parameters: name (str): The medicine name.
+    Returns:    set: Three-character strings.
+    """
+
+    grams = set()
+    for word in normalize_name(name).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """
+    Name:       similarity(a, b)
+    Purpose:    Trigram similarity of two names: shared trigrams over all distinct trigrams.
+    Parameters: a, b (str): The names to compare.
+    Returns:    float: From 0 (nothing in common) to 1 (the same once normalised).
+    """
+
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+class MedicineNameIndex:
+    """
+    In-memory catalogue of medicine ids and names, with a sorted, case-folded prefix index.
+
+    Attributes:
+        refresh_interval (int): Seconds between catalogue version checks.
+        hits (int): Lookups answered from memory.
+        misses (int): Lookups that weren't in memory.
+
+    Methods:
+        name(medicine_id): A medicine's name, from memory or else the database.
+        suggest(prefix, limit): The first `limit` medicines whose names start with prefix.
+        find(name): The medicine with this name, ignoring case and spacing.
+        similar(name, threshold, limit): Medicines with names similar to name.
+        add(medicine_id, name): Adds a medicine, or updates it if it was renamed.
+        remove(medicine_id): Removes a medicine.
+        refresh(): Loads the catalogue, or the changes since the last refresh.
+        stats(): Entry count, hit rate and lookup timing.
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._entries = []  # sorted (folded name, name, id) tuples
+        self._by_id = {}  # id -> entry in _entries
+        self._postings = defaultdict(set)  # trigram -> ids of medicines whose names contain it
+        self._grams = {}  # id -> trigrams of its name
+        self._max_id = 0
+        self._version = None
+        self._loaded = False
+        self._checked = 0.0
+        self._lookups = 0
+        self._lookup_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def name(self, medicine_id):
+        """
+        Name:       name(medicine_id)
+        Purpose:    Returns a catalogue medicine's name. Must be called in an application context.
+        Parameters: medicine_id (int): The medicine's id.
+        Returns:    str: Its name, or None if there is no such medicine.
+        """
+
+        self._maybe_refresh()
+        with self._lock:
+            entry = self._by_id.get(medicine_id)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Added by another worker since the last version check
+        name = db.session.execute(
+            db.select(Medicine.name).where(Medicine.id == medicine_id)
+        ).scalar()
+        if name is not None:
+            self.add(medicine_id, name)
+        return name
+
+    def suggest(self, prefix, limit=10):
+        """
+        Name:       suggest(prefix, limit)
+        Purpose:    Returns catalogue medicines whose names start with prefix, ignoring case and
+                    spacing, in alphabetical order. Must be called in an application context
+                    (the index may refresh from the database first).
+        Parameters: prefix (str): What the user has typed so far.
+                    limit (int): Maximum number of suggestions.
+        Returns:    list: Dicts with the medicine's id and name.
+        """
+
+        self._maybe_refresh()
+        key = normalize_name(prefix)
+        if not key:
+            return []
+
+        start = time.perf_counter()
+        with self._lock:
+            entries = self._entries
+            position = bisect_left(entries, (key,))
+            matches = []
+            while position < len(entries) and len(matches) < limit:
+                folded, name, medicine_id = entries[position]
+                if not folded.startswith(key):
+                    break
+                matches.append({"id": medicine_id, "name": name})
+                position += 1
+            self._lookups += 1
+            self._lookup_seconds += time.perf_counter() - start
+        return matches
+
+    def _maybe_refresh(self):
+        if not self._loaded or time.monotonic() - self._checked >= self.refresh_interval:
+            self.refresh()
+
+    def find(self, name):
+        """
+        Name:       find(name)
+        Purpose:    Looks up a catalogue medicine by name, ignoring case and spacing. Must be
+                    called in an application context.
+        Parameters: name (str): The medicine name.
+        Returns:    int: The medicine's id, or None if it isn't in the catalogue.
+        """
+
+        self._maybe_refresh()
+        key = normalize_name(name)
+        with self._lock:
+            position = bisect_left(self._entries, (key,))
+            if position < len(self._entries) and self._entries[position][0] == key:
+                self.hits += 1
+                return self._entries[position][2]
+            self.misses += 1
+        return None
+
+    def similar(self, name, threshold=0.4, limit=5):
+        """
+        Name:       similar(name, threshold, limit)
+        Purpose:    Finds catalogue medicines whose names are similar to name, most similar first.
+                    Must be called in an application context.
+        Parameters: name (str): The name to match.
+                    threshold (float): Minimum trigram similarity.
+                    limit (int): Maximum number of matches.
+        Returns:    list: Dicts with the medicine's id, name and similarity.
+        """
+
+        self._maybe_refresh()
+        grams = trigrams(name)
+        if not grams:
+            return []
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            matches = []
+            for medicine_id, count in shared.items():
+                score = count / (len(grams) + len(self._grams[medicine_id]) - count)
+                if score >= threshold:
+                    matches.append((score, self._by_id[medicine_id][1], medicine_id))
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [
+            {"id": medicine_id, "name": medicine_name, "similarity": round(score, 3)}
+            for score, medicine_name, medicine_id in matches[:limit]
+        ]
+
+    def add(self, medicine_id, name):
+        """
+        Name:       add(medicine_id, name)
+        Purpose:    Adds a medicine to the index, replacing its old entry if it was renamed.
+        Parameters: medicine_id (int): The medicine's id.
+                    name (str): Its name.
+        Returns:    None
+        """
+
+        with self._lock:
+            self._add(medicine_id, name)
+
+    def _add(self, medicine_id, name):
+        self._remove(medicine_id)
+        entry = (normalize_name(name), name, medicine_id)
+        insort(self._entries, entry)
+        self._by_id[medicine_id] = entry
+        self._index_grams(medicine_id, name)
+        self._max_id = max(self._max_id, medicine_id)
+
+    def _index_grams(self, medicine_id, name):
+        grams = self._grams[medicine_id] = trigrams(name)
+        for gram in grams:
+            self._postings[gram].add(medicine_id)
+
+    def remove(self, medicine_id):
+        """
+        Name:       remove(medicine_id)
+        Purpose:    Removes a medicine from the index, e.g. after it is merged into another.
+        Parameters: medicine_id (int): The medicine's id.
+        Returns:    None
+        """
+
+        with self._lock:
+            self._remove(medicine_id)
+
+    def _remove(self, medicine_id):
+        entry = self._by_id.pop(medicine_id, None)
+        if entry is not None:
+            position = bisect_left(self._entries, entry)
+            del self._entries[position]
+            for gram in self._grams.pop(medicine_id):
+                postings = self._postings[gram]
+                postings.discard(medicine_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def refresh(self):
+        """
+        Name:       refresh()
+        Purpose:    Loads the whole catalogue the first time. After that, checks the catalogue's
+                    version and, if it has changed, fetches the medicines inserted or updated
+                    since the last check; if the catalogue then holds a different number of
+                    medicines than the index (some were removed), the index is reloaded. Must be
+                    called in an application context.
+        Parameters: None
+        Returns:    int: Number of medicines fetched.
+        """
+
+        self._checked = time.monotonic()
+        version = tuple(
+            db.session.execute(
+                db.select(
+                    db.func.count(Medicine.id),
+                    db.func.max(Medicine.id),
+                    db.func.max(Medicine.updated_at),
+                )
+            ).one()
+        )
+        if self._loaded and version == self._version:
+            return 0
+
+        if self._loaded and self._version[2] is not None:
+            # updated_at has one-second resolution, so re-fetch the last second's changes too
+            changed = db.or_(
+                Medicine.id > self._max_id, Medicine.updated_at >= self._version[2]
+            )
+            rows = db.session.execute(db.select(Medicine.id, Medicine.name).where(changed)).all()
+            with self._lock:
+                for medicine_id, name in rows:
+                    self._add(medicine_id, name)
+                complete = len(self._entries) == version[0]
+        else:
+            complete = False
+
+        if not complete:
+            rows = db.session.execute(db.select(Medicine.id, Medicine.name)).all()
+            with self._lock:
+                self._load(rows)
+                self.reloads += 1
+        self._version = version
+        return len(rows)
+
+    def _load(self, rows):
+        self._entries = sorted(
+            (normalize_name(name), name, medicine_id) for medicine_id, name in rows
+        )
+        self._by_id = {entry[2]: entry for entry in self._entries}
+        self._postings = defaultdict(set)
+        self._grams = {}
+        for medicine_id, name in rows:
+            self._index_grams(medicine_id, name)
+        self._max_id = max(self._by_id, default=0)
+        self._loaded = True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "reloads": self.reloads,
+                "prefix_lookups": self._lookups,
+                "mean_lookup_us": round(1e6 * self._lookup_seconds / self._lookups, 2)
+                if self._lookups
+                else 0,
+            }
+
+
+def init_medicine_index(app):
+    """
+    Name:       init_medicine_index(app)
+    Purpose:    Creates the in-memory catalogue and stores it in app.extensions["medicine_index"].
+                The catalogue is loaded on the first lookup, not at start-up.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    MedicineNameIndex: The index.
+    """
+
+    index = MedicineNameIndex(refresh_interval=app.config["CATALOG_INDEX_REFRESH"])
+    app.extensions["medicine_index"] = index
+    return index
@@ -0,0 +1,195 @@
+"""
+catalogmerge.py
+---------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/catalogmerge.py
+
+Purpose:    Finds and merges duplicate medicines in the catalogue - rows that differ only in case
+            or spacing ("Paracetamol", "paracetamol ") or are likely misspellings of each other
+            ("Paracetmol"). Each group of duplicates is merged into its most-used row: the users'
+            medicines are re-pointed to it with one bulk UPDATE per group, and the duplicate rows
+            are deleted, all in one transaction. A user who takes more than one medicine of a
+            group would be left with two entries for the same medicine, so their entries are
+            combined first: the reminders and dose history move to one entry and the others are
+            deleted.
+
+            Groups are built around the most-used medicines first, and a medicine only joins a
+            group if it is similar to that group's canonical row itself, so a chain of small
+            differences can't pull unrelated medicines together. Names like "Prednisone" and
+            "Prednisolone" are genuinely different medicines, so the threshold
+            (CATALOG_MERGE_THRESHOLD) is kept high and the command only lists the groups unless
+            --apply is given:
+
+                flask catalog merge
+                flask catalog merge --threshold 0.9 --apply
+"""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app.extensions import db
+from app.models import User, UserMedicine, Medicine, MedicationReminder, DoseHistory
+from app.catalogindex import MedicineNameIndex
+
+
+catalog_cli = AppGroup("catalog", help="Maintain the medicines catalogue.")
+
+
+def init_catalog_merge(app):
+    """
+    Name:       init_catalog_merge(app)
+    Purpose:    Registers the `flask catalog merge` command.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    app.cli.add_command(catalog_cli)
+
+
+def find_duplicates(threshold):
+    """
+    Name:       find_duplicates(threshold)
+    Purpose:    Groups catalogue medicines whose names are the same or similar. Must be called in
+                an application context.
+    Parameters: threshold (float): Minimum trigram similarity to a group's canonical medicine.
+    Returns:    list: (canonical, duplicates) pairs, where canonical is an (id, name, uses) tuple
+                and duplicates is a list of them.
+    """
+
+    uses = (
+        db.select(UserMedicine.medicine_id, db.func.count().label("uses"))
+        .group_by(UserMedicine.medicine_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        db.select(Medicine.id, Medicine.name, db.func.coalesce(uses.c.uses, 0))
+        .outerjoin(uses, uses.c.medicine_id == Medicine.id)
+        .order_by(db.func.coalesce(uses.c.uses, 0).desc(), Medicine.id)
+    ).all()
+    by_id = {row[0]: tuple(row) for row in rows}
+
+    index = MedicineNameIndex()
+    index.refresh()
+
+    grouped = set()
+    groups = []
+    for medicine_id, name, _ in rows:
+        if medicine_id in grouped:
+            continue
+        grouped.add(medicine_id)
+        duplicates = [
+            by_id[match["id"]]
+            for match in index.similar(name, threshold=threshold, limit=len(rows))
+            if match["id"] not in grouped and match["id"] in by_id
+        ]
+        if duplicates:
+            grouped.update(duplicate[0] for duplicate in duplicates)
+            groups.append((by_id[medicine_id], duplicates))
+    return groups
+
+
+def combine_user_medicines(canonical_id, duplicate_ids):
+    """
+    Name:       combine_user_medicines(canonical_id, duplicate_ids)
+    Purpose:    For each user with more than one medicine in a group, keeps one of their entries
+                (the canonical medicine's, if they have it) and moves the other entries'
+                reminders and dose history onto it before deleting them. Runs in the caller's
+                transaction.
+    Parameters: canonical_id (int): The group's canonical medicine ID.
+                duplicate_ids (list): The group's duplicate medicine IDs.
+    Returns:    int: The number of user medicines deleted.
+    """
+
+    rows = db.session.execute(
+        db.select(UserMedicine.user_id, UserMedicine.id)
+        .where(UserMedicine.medicine_id.in_([canonical_id, *duplicate_ids]))
+        .order_by(UserMedicine.user_id, UserMedicine.medicine_id != canonical_id, UserMedicine.id)
+    ).all()
+
+    kept = {}
+    combined = {}
+    for user_id, user_medicine_id in rows:
+        if user_id in kept:
+            combined.setdefault(kept[user_id], []).append(user_medicine_id)
+        else:
+            kept[user_id] = user_medicine_id
+
+    for keep_id, combined_ids in combined.items():
+        for model in (MedicationReminder, DoseHistory):
+            db.session.execute(
+                db.update(model)
+                .where(model.user_medicine_id.in_(combined_ids))
+                .values(user_medicine_id=keep_id)
+            )
+    deleted_ids = [user_medicine_id for ids in combined.values() for user_medicine_id in ids]
+    if deleted_ids:
+        db.session.execute(db.delete(UserMedicine).where(UserMedicine.id.in_(deleted_ids)))
+    return len(deleted_ids)
+
+
+def merge_duplicates(groups):
+    """
+    Name:       merge_duplicates(groups)
+    Purpose:    Re-points every user's medicine from the duplicates to their group's canonical
+                medicine and deletes the duplicates, in one transaction. Users with more than one
+                medicine in a group have those entries combined first (see
+                combine_user_medicines()). The affected users' cached pages are invalidated.
+    Parameters: groups (list): Groups from find_duplicates().
+    Returns:    dict: Numbers of medicines removed, user medicines re-pointed, and user medicines
+                combined into another of the same user's.
+    """
+
+    removed = repointed = combined = 0
+    try:
+        for canonical, duplicates in groups:
+            duplicate_ids = [duplicate[0] for duplicate in duplicates]
+            User.bump_data_version(
+                db.select(UserMedicine.user_id).where(UserMedicine.medicine_id.in_(duplicate_ids))
+            )
+            combined += combine_user_medicines(canonical[0], duplicate_ids)
+            repointed += db.session.execute(
+                db.update(UserMedicine)
+                .where(UserMedicine.medicine_id.in_(duplicate_ids))
+                .values(medicine_id=canonical[0])
+            ).rowcount
+            removed += db.session.execute(
+                db.delete(Medicine).where(Medicine.id.in_(duplicate_ids))
+            ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {
+        "medicines_removed": removed,
+        "user_medicines_repointed": repointed,
+        "user_medicines_combined": combined,
+    }
+
+
+@catalog_cli.command("merge")
+@click.option("--threshold", type=float, default=None, help="Minimum name similarity (0-1).")
+@click.option("--apply", "apply_merge", is_flag=True, help="Merge the groups instead of listing them.")
+def merge_command(threshold, apply_merge):
+    """Find duplicate catalogue medicines and merge them into the most-used one."""
+    if threshold is None:
+        threshold = current_app.config["CATALOG_MERGE_THRESHOLD"]
+
+    groups = find_duplicates(threshold)
+    for canonical, duplicates in groups:
+        click.echo(f"{canonical[1]} (#{canonical[0]}, {canonical[2]} uses)")
+        for medicine_id, name, uses in duplicates:
+            click.echo(f"    <- {name} (#{medicine_id}, {uses} uses)")
+
+    if not groups:
+        click.echo("No duplicates found.")
+    elif apply_merge:
+        stats = merge_duplicates(groups)
+        click.echo(
+            f"Merged {stats['medicines_removed']} medicines into {len(groups)}; "
+            f"re-pointed {stats['user_medicines_repointed']} user medicines and combined "
+            f"{stats['user_medicines_combined']} that duplicated another of the same user's."
+        )
+    else:
+        click.echo(f"{len(groups)} groups found. Run again with --apply to merge them.")
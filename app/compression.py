@@ -0,0 +1,142 @@
+"""
+compression.py
+--------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/compression.py
+
+Purpose:    Compresses outgoing HTML, JSON and other text responses with Brotli or gzip,
+            negotiated from the client's Accept-Encoding header. Responses smaller than
+            the configured threshold, streamed responses and responses that already carry
+            a Content-Encoding are passed through untouched. Static files are sent straight
+            from disk, so they are compressed ahead of time by `flask assets build` instead
+            (see assets.py).
+"""
+
+import gzip
+import brotli
+from flask import request
+
+
+# Mimetypes worth compressing - images and PDFs are already compressed
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/calendar",
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "image/svg+xml",
+    "image/x-icon",
+}
+
+
+def init_compression(app):
+    """
+    Name:       init_compression(app)
+    Purpose:    Registers an after_request hook on the application that compresses eligible
+                responses. Behaviour is controlled by the COMPRESS_ENABLED, COMPRESS_MIN_SIZE,
+                COMPRESS_BR_LEVEL and COMPRESS_GZIP_LEVEL configuration values.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config.get("COMPRESS_ENABLED", True):
+            return response
+        return compress(
+            response,
+            request.headers.get("Accept-Encoding", ""),
+            min_size=app.config.get("COMPRESS_MIN_SIZE", 500),
+            br_level=app.config.get("COMPRESS_BR_LEVEL", 5),
+            gzip_level=app.config.get("COMPRESS_GZIP_LEVEL", 6),
+        )
+
+
+def choose_encoding(accept_encoding):
+    """
+    Name:       choose_encoding(accept_encoding)
+    Purpose:    Picks the best supported content coding from an Accept-Encoding header,
+                honouring q-values. Brotli is preferred over gzip when both are acceptable.
+    Parameters: accept_encoding (str): The raw Accept-Encoding request header.
+    Returns:    str: 'br', 'gzip', or None if neither is acceptable.
+    """
+
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    for coding in ("br", "gzip"):
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress(response, accept_encoding, min_size=500, br_level=5, gzip_level=6):
+    """
+    Name:       compress(response, accept_encoding, min_size, br_level, gzip_level)
+    Purpose:    Compresses a response body in place if the client accepts a supported encoding
+                and the response is a buffered, successful, compressible payload of at least
+                min_size bytes. Always adds 'Vary: Accept-Encoding' to compressible responses so
+                shared caches keep the variants apart.
+    Parameters: response (Response): The outgoing Flask response.
+                accept_encoding (str): The client's Accept-Encoding header.
+                min_size (int): Smallest body, in bytes, worth compressing.
+                br_level (int): Brotli quality (0-11).
+                gzip_level (int): gzip compression level (1-9).
+    Returns:    Response: The (possibly compressed) response.
+    """
+
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+        return response
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if "Content-Encoding" in response.headers:
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=br_level)
+    else:
+        compressed = gzip.compress(data, compresslevel=gzip_level)
+
+    # Don't bother if compression didn't actually save anything
+    if len(compressed) >= len(data):
+        return response
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = len(compressed)
+
+    # A strong ETag describes the uncompressed bytes, so weaken it
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
@@ -0,0 +1,232 @@
+"""
+dispatcher.py
+-------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/dispatcher.py
+
+Purpose:    Works out which medication reminders are due each minute. Once a day, and again when
+            reminders change, every reminder is compiled into the minutes it occurs at today -
+            its reminder_time, or the occurrences of its medicine's structured schedule (see
+            schedules.py) - and merged into one sorted array of due minutes, with the reminders
+            due at each minute grouped by user. Each scheduler tick then finds the minutes that
+            have come due since the previous tick with a binary search, without querying
+            reminders or evaluating schedule rules.
+
+            Changes are noticed through the users' schedule_version, which every medicine and
+            reminder edit bumps (sending a reminder doesn't), stamping schedule_changed_at. The
+            dispatcher keeps a watermark - the latest schedule_changed_at it has seen - and each
+            tick asks only for the users stamped since then, an index range scan that is
+            usually empty. Only those users are reloaded, and only their (minute, user) entries
+            in the plan are replaced, so an edit costs work in proportion to the reminders it
+            touches rather than a rebuild of everyone's day or a scan of the user table.
+
+            The query reaches WATERMARK_OVERLAP back past the watermark, so an edit whose
+            transaction committed after a later one is still seen; users in the overlap whose
+            schedule_version hasn't moved are skipped. Users are never deleted by the app, and a
+            deleted user's reminders are deleted with them, so their leftover entries would send
+            nothing.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import time, timedelta
+from app.extensions import db
+from app.models import User, UserMedicine, MedicationReminder
+from app.schedules import compile_day
+
+
+class ReminderDispatcher:
+    """
+    Today's reminder plan, and the position of the last scheduler tick in it.
+
+    Attributes:
+        day (date): The day the plan is for.
+        minutes (list): Sorted minutes since midnight at which reminders are due.
+        slots (dict): minute -> {user_id: [(reminder_id, dose), ...]}.
+        rebuilds (int): Number of times the plan has been built.
+        updates (int): Number of users whose part of the plan has been replaced since.
+
+    Methods:
+        due(now): The reminders that have come due since the previous call.
+        rebuild(day): Builds the plan for a day.
+        update(): Replaces the plan entries of the users whose schedules have changed.
+        summary(): Today's plan as text, for the daily email.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.minutes = []
+        self.slots = {}
+        self.rebuilds = 0
+        self.updates = 0
+        self._watermark = None  # latest schedule_changed_at seen
+        self._user_versions = {}  # user_id -> schedule_version, for users near the watermark
+        self._user_minutes = {}  # user_id -> minutes the user has entries at
+        self._last_minute = None
+        self._lock = threading.Lock()
+
+    def due(self, now):
+        """
+        Name:       due(now)
+        Purpose:    Returns the reminders due after the previous tick, up to and including the
+                    current minute, rebuilding the plan first if the day has changed, or
+                    updating it if any user's reminders have. On the first tick only the current
+                    minute is due, so a restart doesn't resend the day's earlier reminders. Must
+                    be called in an application context.
+        Parameters: now (datetime): The current local time.
+        Returns:    list: (reminder_time, {user_id: [(reminder_id, dose), ...]}) for each due
+                    minute, in time order.
+        """
+
+        minute = now.hour * 60 + now.minute
+        with self._lock:
+            if now.date() != self.day:
+                first_tick = self.day is None
+                self.rebuild(now.date())
+                self._last_minute = minute - 1 if first_tick else -1
+            else:
+                self.update()
+
+            start = bisect_right(self.minutes, self._last_minute)
+            end = bisect_right(self.minutes, minute)
+            self._last_minute = minute
+            return [
+                (time(due_minute // 60, due_minute % 60), self.slots[due_minute])
+                for due_minute in self.minutes[start:end]
+            ]
+
+    def rebuild(self, day):
+        """
+        Name:       rebuild(day)
+        Purpose:    Builds the plan for a day from every reminder of the users who receive
+                    reminders, in one query. Must be called in an application context.
+        Parameters: day (date): The day to plan.
+        Returns:    None
+        """
+
+        # Take the watermark before loading, so an edit made during the load is seen next tick
+        self._watermark = db.session.scalar(db.select(db.func.max(User.schedule_changed_at)))
+        self._user_versions = {
+            user_id: schedule_version for user_id, schedule_version, _ in self._load_changes()
+        }
+        self.day = day
+        self.slots = {}
+        self.minutes = []
+        self._user_minutes = {}
+        self._add_rows(self._load_reminders())
+        self.rebuilds += 1
+
+    def update(self):
+        """
+        Name:       update()
+        Purpose:    Brings the plan up to date with the users whose schedule_version has changed
+                    since the watermark: their entries are removed and their reminders reloaded
+                    in one query, leaving everyone else's untouched. If more than
+                    FULL_REBUILD_FRACTION of the users in the plan have changed, the whole plan
+                    is rebuilt instead. Must be called in an application context.
+        Parameters: None
+        Returns:    int: Number of users whose entries were replaced.
+        """
+
+        rows = self._load_changes()
+        changed = [
+            user_id
+            for user_id, schedule_version, _ in rows
+            if self._user_versions.get(user_id) != schedule_version
+        ]
+        if not changed:
+            return 0
+        if len(changed) > FULL_REBUILD_FRACTION * max(len(self._user_minutes), 1):
+            self.rebuild(self.day)
+            return len(changed)
+
+        for user_id in changed:
+            self._remove_user(user_id)
+        self._add_rows(self._load_reminders(MedicationReminder.user_id.in_(changed)))
+        # Only users inside the overlap can be seen again, so only they need remembering
+        self._watermark = max(changed_at for _, _, changed_at in rows)
+        self._user_versions = {
+            user_id: schedule_version for user_id, schedule_version, _ in rows
+        }
+        self.updates += len(changed)
+        return len(changed)
+
+    def _load_changes(self):
+        # Users stamped since the watermark, less the overlap; an index range scan
+        if self._watermark is None:
+            criterion = User.schedule_changed_at.is_not(None)
+        else:
+            criterion = User.schedule_changed_at >= self._watermark - WATERMARK_OVERLAP
+        return db.session.execute(
+            db.select(User.id, User.schedule_version, User.schedule_changed_at).where(criterion)
+        ).all()
+
+    def _load_reminders(self, *criteria):
+        return db.session.execute(
+            db.select(
+                MedicationReminder.id,
+                MedicationReminder.user_id,
+                MedicationReminder.reminder_time,
+                UserMedicine.schedule,
+            )
+            .join(UserMedicine, MedicationReminder.user_medicine_id == UserMedicine.id)
+            .join(User, MedicationReminder.user_id == User.id)
+            .where(User.receive_sms_reminders.is_(True), *criteria)
+        ).all()
+
+    def _add_rows(self, rows):
+        for reminder_id, user_id, reminder_time, schedule in rows:
+            if schedule:
+                minutes, doses = compile_day(schedule, self.day)
+            elif reminder_time is not None:
+                minutes, doses = (reminder_time.hour * 60 + reminder_time.minute,), (None,)
+            else:
+                continue
+            for minute, dose in zip(minutes, doses):
+                users = self.slots.get(minute)
+                if users is None:
+                    users = self.slots[minute] = {}
+                    insort(self.minutes, minute)
+                users.setdefault(user_id, []).append((reminder_id, dose))
+                self._user_minutes.setdefault(user_id, set()).add(minute)
+
+    def _remove_user(self, user_id):
+        for minute in self._user_minutes.pop(user_id, ()):
+            users = self.slots[minute]
+            del users[user_id]
+            if not users:
+                del self.slots[minute]
+                del self.minutes[bisect_left(self.minutes, minute)]
+
+    def summary(self):
+        """
+        Name:       summary()
+        Purpose:    Describes today's plan, one line per due minute.
+        Parameters: None
+        Returns:    str: Lines like "08:00 - 3 reminders for 2 users".
+        """
+
+        with self._lock:
+            lines = []
+            for minute in self.minutes:
+                users = self.slots[minute]
+                reminders = sum(len(entries) for entries in users.values())
+                lines.append(
+                    f"{minute // 60:02d}:{minute % 60:02d} - {reminders} reminders for "
+                    f"{len(users)} users"
+                )
+            return "\n".join(lines)
+
+
+# Above this share of users changed at once, rebuilding the whole plan is cheaper
+FULL_REBUILD_FRACTION = 0.5
+
+# How far before the watermark each tick looks, for edits whose transactions committed out of
+# order; far longer than any request's transaction
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+
+# The scheduler process's plan (see schedule_daily_reminders() in application.py)
+reminder_dispatcher = ReminderDispatcher()
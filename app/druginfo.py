@@ -0,0 +1,299 @@
+"""
+druginfo.py
+-----------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/druginfo.py
+
+Purpose:    A local drug-information store, so medicine details and search keep working without
+            Wikipedia. Articles are bulk-loaded from a JSON Lines dump into a SQLite database
+            (DRUG_INFO_PATH, default instance/drug_info.sqlite3) with an FTS5 full-text index over
+            medicine names, section titles and section text. Search results are ranked with BM25,
+            weighting a match in the medicine name above one in a section title, and both above
+            one in the body text.
+
+            Each line of the dump is one article:
+
+                {"name": "Aspirin", "sections": [{"title": "Uses", "text": "..."}, ...]}
+
+            Load it with:  flask druginfo load dump.jsonl [--replace]
+
+            The store also acts as an article source for the Wikipedia cache: medicines found in
+            it are served from it, and only the rest are fetched from Wikipedia.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from app.wikicache import normalize_name, make_article
+
+
+# Relative BM25 weights of the name, section title and section text columns
+NAME_WEIGHT = 10.0
+TITLE_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+
+# Articles inserted per transaction while loading
+LOAD_BATCH_SIZE = 500
+
+# Sentinels marking matches in snippets; replaced with <mark> after HTML-escaping
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(text):
+    """
+    Name:       build_match_query(text)
+    Purpose:    Turns free text typed by a user into a safe FTS5 query: every word must match,
+                and the last word also matches as a prefix so results appear while typing.
+    Parameters: text (str): The search text.
+    Returns:    str: The FTS5 MATCH expression, or None if the text contains no words.
+    """
+
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    return Markup(
+        str(escape(snippet))
+        .replace(_MATCH_START, "<mark>")
+        .replace(_MATCH_END, "</mark>")
+    )
+
+
+class DrugInfoStore:
+    """
+    SQLite store of drug articles with an FTS5 search index.
+
+    Attributes:
+        path (str): Path to the SQLite database.
+
+    Methods:
+        load(lines, replace): Bulk-loads articles from JSON Lines.
+        search(text, limit): Ranked full-text search over names and sections.
+        fetch(name): Returns a stored article in the Wikipedia cache's article format.
+        count(): Number of articles stored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS drugs (
+                key TEXT PRIMARY KEY,
+                name TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS drug_sections USING fts5(
+                name, title, text,
+                key UNINDEXED, position UNINDEXED,
+                tokenize = 'porter unicode61'
+            );
+            """
+        )
+        connection.commit()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, lines, replace=False):
+        """
+        Name:       load(lines, replace)
+        Purpose:    Loads articles from JSON Lines, in batches of LOAD_BATCH_SIZE per
+                    transaction. An article already in the store is replaced by the new copy.
+        Parameters: lines (iterable): Lines of JSON, e.g. an open file.
+                    replace (bool): Empty the store before loading.
+        Returns:    int: Number of articles loaded.
+        Raises:     ValueError: If a line isn't a valid article; earlier batches stay loaded.
+        """
+
+        connection = self._connection()
+        if replace:
+            with connection:
+                connection.execute("DELETE FROM drugs")
+                connection.execute("DELETE FROM drug_sections")
+
+        loaded = 0
+        batch = []
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                article = json.loads(line)
+                name = article["name"].strip()
+                sections = [(s["title"], s["text"]) for s in article.get("sections", [])]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ValueError(f"Line {line_number}: not a valid article ({e})") from e
+            batch.append((normalize_name(name), name, sections))
+            if len(batch) >= LOAD_BATCH_SIZE:
+                loaded += self._insert(batch)
+                batch = []
+        if batch:
+            loaded += self._insert(batch)
+
+        with connection:
+            connection.execute("INSERT INTO drug_sections(drug_sections) VALUES ('optimize')")
+        return loaded
+
+    def _insert(self, batch):
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "DELETE FROM drug_sections WHERE key = ?", [(key,) for key, _, _ in batch]
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO drugs (key, name) VALUES (?, ?)",
+                [(key, name) for key, name, _ in batch],
+            )
+            connection.executemany(
+                "INSERT INTO drug_sections (name, title, text, key, position) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (name, title, text, key, position)
+                    for key, name, sections in batch
+                    # An article with no sections still gets a row, so its name is searchable
+                    for position, (title, text) in (enumerate(sections) if sections else [(-1, ("", ""))])
+                ],
+            )
+        return len(batch)
+
+    def search(self, text, limit=20):
+        """
+        Name:       search(text, limit)
+        Purpose:    Full-text search across medicine names, section titles and section text,
+                    best matches first.
+        Parameters: text (str): The search text, as typed by the user.
+                    limit (int): Maximum number of results.
+        Returns:    list: Dicts with name, section, position, snippet (Markup with <mark>ed
+                    matches) and score (lower is better).
+        """
+
+        query = build_match_query(text)
+        if query is None:
+            return []
+        rows = self._connection().execute(
+            "SELECT name, title, position, "
+            "snippet(drug_sections, 2, ?, ?, '...', 24), "
+            "bm25(drug_sections, ?, ?, ?) AS score "
+            "FROM drug_sections WHERE drug_sections MATCH ? "
+            "ORDER BY score LIMIT ?",
+            (_MATCH_START, _MATCH_END, NAME_WEIGHT, TITLE_WEIGHT, TEXT_WEIGHT, query, limit),
+        ).fetchall()
+        return [
+            {
+                "name": name,
+                "section": title,
+                "position": position,
+                "snippet": _highlight(snippet),
+                "score": score,
+            }
+            for name, title, position, snippet, score in rows
+        ]
+
+    def fetch(self, name):
+        key = normalize_name(name)
+        connection = self._connection()
+        row = connection.execute("SELECT name FROM drugs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return make_article(None, [])
+        sections = connection.execute(
+            "SELECT title, text FROM drug_sections WHERE key = ? AND position >= 0 "
+            "ORDER BY position",
+            (key,),
+        ).fetchall()
+        return make_article(row[0], sections)
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM drugs").fetchone()[0]
+
+
+class LocalFirstSource:
+    """
+    Article source for the Wikipedia cache that serves articles from the drug-information store
+    and only asks the fallback source (normally Wikipedia) for medicines the store doesn't have.
+
+    Methods:
+        fetch(name): Returns the stored article, or the fallback's.
+    """
+
+    def __init__(self, store, fallback):
+        self.store = store
+        self.fallback = fallback
+
+    def fetch(self, name):
+        article = self.store.fetch(name)
+        if article["exists"] or self.fallback is None:
+            return article
+        return self.fallback.fetch(name)
+
+
+def init_drug_info(app):
+    """
+    Name:       init_drug_info(app)
+    Purpose:    Opens the drug-information store, puts it in front of the Wikipedia cache's
+                article source and registers the `flask druginfo` commands.
+    Parameters: app (Flask): The Flask application instance. init_wiki_cache() must already
+                             have been called.
+    Returns:    DrugInfoStore: The store.
+    """
+
+    path = app.config["DRUG_INFO_PATH"] or os.path.join(app.instance_path, "drug_info.sqlite3")
+    store = DrugInfoStore(path)
+    app.extensions["drug_info"] = store
+
+    wiki_cache = app.extensions["wiki_cache"]
+    wiki_cache.source = LocalFirstSource(store, wiki_cache.source)
+
+    app.cli.add_command(druginfo_cli)
+    return store
+
+
+druginfo_cli = AppGroup("druginfo", help="Manage the offline drug-information store.")
+
+
+@druginfo_cli.command("load")
+@click.argument("dump", type=click.File("r", encoding="utf-8"))
+@click.option("--replace", is_flag=True, help="Empty the store before loading.")
+def load_command(dump, replace):
+    """Load drug articles from a JSON Lines dump."""
+    store = current_app.extensions["drug_info"]
+    try:
+        loaded = store.load(dump, replace=replace)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Loaded {loaded} articles; the store now holds {store.count()}.")
+
+
+@druginfo_cli.command("search")
+@click.argument("text")
+@click.option("--limit", type=int, default=10)
+def search_command(text, limit):
+    """Search the drug-information store from the command line."""
+    for result in current_app.extensions["drug_info"].search(text, limit):
+        snippet = result["snippet"].striptags()
+        click.echo(f"{result['score']:8.3f}  {result['name']} / {result['section']}: {snippet}")
@@ -0,0 +1,151 @@
+"""
+export.py
+---------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/export.py
+
+Purpose:    Streams a user's medicines, reminders and dose history as CSV or JSON Lines, for
+            clinicians pulling the data into spreadsheets and EHRs. Rows are read with
+            yield_per, which uses a server-side cursor on MySQL, and are encoded into a small
+            buffer that is handed to the response every EXPORT_CHUNK_BYTES, so memory use stays
+            constant however long the history is. CSV cells that a spreadsheet would read as a
+            formula (=, +, -, @) are prefixed with a quote, so a medicine name or note can't run
+            as one when the file is opened.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from sqlalchemy import select
+from app.extensions import db
+from app.models import Medicine, UserMedicine, MedicationReminder, DoseHistory
+
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+# Rows fetched from the cursor at a time
+YIELD_PER = 500
+
+# Bytes of encoded output buffered before they are sent
+EXPORT_CHUNK_BYTES = 16 * 1024
+
+# Leading characters that make a spreadsheet treat a CSV cell as a formula (tab and carriage
+# return are included because some spreadsheets skip them before checking for the others)
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _medicines_query(user_id):
+    return (
+        select(
+            Medicine.name.label("medicine"),
+            UserMedicine.dosage,
+            UserMedicine.frequency,
+            UserMedicine.notes,
+            UserMedicine.created_at.label("added"),
+        )
+        .join(Medicine, UserMedicine.medicine_id == Medicine.id)
+        .where(UserMedicine.user_id == user_id)
+        .order_by(UserMedicine.id)
+    )
+
+
+def _reminders_query(user_id):
+    return (
+        select(
+            Medicine.name.label("medicine"),
+            MedicationReminder.reminder_time,
+            MedicationReminder.reminder_message,
+            MedicationReminder.status,
+        )
+        .join(UserMedicine, MedicationReminder.user_medicine_id == UserMedicine.id)
+        .join(Medicine, UserMedicine.medicine_id == Medicine.id)
+        .where(MedicationReminder.user_id == user_id)
+        .order_by(MedicationReminder.reminder_time, MedicationReminder.id)
+    )
+
+
+def _history_query(user_id):
+    return (
+        select(
+            DoseHistory.sent_at,
+            DoseHistory.medicine_name.label("medicine"),
+            DoseHistory.reminder_time,
+            DoseHistory.reminder_message,
+            DoseHistory.channel,
+        )
+        .where(DoseHistory.user_id == user_id)
+        .order_by(DoseHistory.sent_at, DoseHistory.id)
+    )
+
+
+DATASETS = {
+    "medicines": _medicines_query,
+    "reminders": _reminders_query,
+    "history": _history_query,
+}
+
+
+def _plain(value, csv_cell=False):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if csv_cell and isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_plain(value, csv_cell=True) for value in row])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl_chunks(columns, rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(lines)
+            lines, size = [], 0
+    yield "".join(lines)
+
+
+def export_rows(dataset, fmt, user_id):
+    """
+    Name:       export_rows(dataset, fmt, user_id)
+    Purpose:    Generates one of a user's datasets encoded as CSV or JSON Lines, a chunk at a
+                time. The query runs when the generator is first advanced, so it must be consumed
+                inside an application context (e.g. via stream_with_context).
+    Parameters: dataset (str): 'medicines', 'reminders' or 'history'.
+                fmt (str): 'csv' or 'jsonl'.
+                user_id (int): The user whose data is exported.
+    Returns:    generator: str chunks of the encoded export.
+    Raises:     KeyError: If dataset or fmt is not supported.
+    """
+
+    query = DATASETS[dataset](user_id)
+    encode = {"csv": _csv_chunks, "jsonl": _jsonl_chunks}[fmt]
+
+    def generate():
+        result = db.session.execute(query.execution_options(yield_per=YIELD_PER))
+        try:
+            yield from encode(list(result.keys()), result)
+        finally:
+            result.close()
+
+    return generate()
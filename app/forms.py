@@ -17,9 +17,11 @@ from wtforms import (
     PasswordField,
     TextAreaField,
     SelectField,
+    SelectMultipleField,
     TimeField,
     BooleanField,
 )
+from wtforms.widgets import ListWidget, CheckboxInput
 from wtforms.validators import (
     DataRequired,
     Email,
@@ -27,8 +29,47 @@ from wtforms.validators import (
     Optional,
     InputRequired,
     Length,
+    ValidationError,
 )
 from wtforms.fields import FieldList
+from datetime import date
+from app.schedules import CUSTOM_SCHEDULE, ScheduleError, parse_schedule, first_occurrence
+from app.notifiers import CHANNEL_CHOICES
+
+
+FREQUENCY_CHOICES = [
+    ("Once a Day", "Once a Day"),
+    ("Twice a Day", "Twice a Day"),
+    ("Three Times a Day", "Three Times a Day"),
+    ("Four Times a Day", "Four Times a Day"),
+    (CUSTOM_SCHEDULE, CUSTOM_SCHEDULE),
+]
+
+
+def validate_custom_schedule(form, field):
+    """
+    Name:       validate_custom_schedule(form, field)
+    Purpose:    Checks the schedule field when the "Custom Schedule" frequency is chosen: it must
+                parse, and it must have an occurrence within the next year. The parsed rules and
+                the first occurrence's time are kept on the form (form.schedule_rules and
+                form.schedule_first_time) so the route doesn't work them out again.
+    Parameters: form (FlaskForm): The form, which has a frequency field.
+                field (Field): The schedule field.
+    Returns:    None
+    Raises:     ValidationError: With the parser's message if the schedule is invalid.
+    """
+
+    if form.frequency.data != CUSTOM_SCHEDULE:
+        return
+    try:
+        rules = parse_schedule(field.data or "")
+    except ScheduleError as e:
+        raise ValidationError(str(e))
+    first_time = first_occurrence(rules, date.today())
+    if first_time is None:
+        raise ValidationError("The schedule has no reminders in the next year")
+    form.schedule_rules = rules
+    form.schedule_first_time = first_time
 
 
 class LoginForm(FlaskForm):
@@ -133,6 +174,7 @@ class MedicineForm(FlaskForm):
         dosage (str): The dosage of the medicine.
         frequency (str): The frequency at which the medicine should be taken, chosen from predefined options.
         notes (str): Optional additional notes related to the medicine.
+        schedule (str): The structured schedule, one rule per line, when the frequency is "Custom Schedule".
 
     Validators:
         DataRequired: Ensures that the field is not left empty.
@@ -146,16 +188,12 @@ class MedicineForm(FlaskForm):
 
     frequency = SelectField(
         "Frequency",
-        choices=[
-            ("Once a Day", "Once a Day"),
-            ("Twice a Day", "Twice a Day"),
-            ("Three Times a Day", "Three Times a Day"),
-            ("Four Times a Day", "Four Times a Day"),
-        ],
+        choices=FREQUENCY_CHOICES,
         validators=[DataRequired()],
     )
 
     notes = TextAreaField("Notes", validators=[Optional()])
+    schedule = TextAreaField("Schedule", validators=[validate_custom_schedule])
 
 
 class ReminderForm(FlaskForm):
@@ -193,6 +231,7 @@ class EditMedicineForm(FlaskForm):
         dosage (str): The dosage of the medicine.
         frequency (str): The frequency at which the medicine should be taken, selected from predefined options.
         notes (str): Optional additional notes related to the medicine.
+        schedule (str): The structured schedule, one rule per line, when the frequency is "Custom Schedule".
         reminder_time (list of str): A list of times at which the user wants to be reminded to take the medicine.
         reminder_message (list of str): A list of custom messages for each reminder time.
 
@@ -209,16 +248,12 @@ class EditMedicineForm(FlaskForm):
 
     frequency = SelectField(
         "Frequency",
-        choices=[
-            ("Once a Day", "Once a Day"),
-            ("Twice a Day", "Twice a Day"),
-            ("Three Times a Day", "Three Times a Day"),
-            ("Four Times a Day", "Four Times a Day"),
-        ],
+        choices=FREQUENCY_CHOICES,
         validators=[InputRequired()],
     )
 
     notes = TextAreaField("Notes", validators=[Optional()])
+    schedule = TextAreaField("Schedule", validators=[validate_custom_schedule])
 
     reminder_time = FieldList(
         TimeField("Reminder Time", format="%H:%M"), min_entries=1, max_entries=4
@@ -234,15 +269,31 @@ class UserAdminForm(FlaskForm):
 
     Fields:
         phone_number (str): The phone number associated with the user profile. Limited to a maximum of 15 characters.
-        receive_sms_reminders (bool): A boolean indicating whether the user should receive SMS reminders for their medication. Defaults to True.
+        receive_sms_reminders (bool): A boolean indicating whether the user should receive medication reminders at all. Defaults to True.
+        reminder_channels (list): The channels reminders are sent on - SMS, email and/or browser notifications.
 
     Validators:
         Length: Ensures that the phone number does not exceed 15 characters.
         BooleanField default: Sets the default value for the `receive_sms_reminders` field to `True`.
+        validate_reminder_channels: Requires at least one channel while reminders are turned on,
+                                    and a phone number for SMS.
 
     """
 
     phone_number = StringField("Phone Number", validators=[Length(max=15)])
     receive_sms_reminders = BooleanField(
-        "Receive SMS Medication Reminders", default=True
+        "Receive Medication Reminders", default=True
     )
+    reminder_channels = SelectMultipleField(
+        "Send Reminders By",
+        choices=CHANNEL_CHOICES,
+        default=["sms"],
+        widget=ListWidget(prefix_label=False),
+        option_widget=CheckboxInput(),
+    )
+
+    def validate_reminder_channels(self, field):
+        if self.receive_sms_reminders.data and not field.data:
+            raise ValidationError("Choose at least one way to receive reminders")
+        if "sms" in (field.data or []) and not self.phone_number.data:
+            raise ValidationError("SMS reminders need a phone number")
@@ -0,0 +1,237 @@
+"""
+icsfeed.py
+----------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/icsfeed.py
+
+Purpose:    Builds a user's reminder schedule as an iCalendar (.ics) feed that phone and desktop
+            calendar apps can subscribe to. Each MedicationReminder becomes a daily recurring
+            event at its reminder_time, in the same time zone the reminder scheduler uses. A
+            reminder that follows a custom schedule becomes one recurring event per rule and
+            time of day instead, limited to the rule's days and date range.
+
+            Calendar apps poll feeds often and can't log in, so the feed URL carries a signed
+            token instead (see feed_token()). The token includes the user's feed_secret, so
+            resetting the secret revokes every URL handed out before. The route answers a poll
+            with one lookup: the ETag is derived from the user's schedule_version, which reminder
+            sends and the daily status reset leave alone, so an unchanged schedule gets a 304,
+            and a changed one is built once and then served from the feed cache.
+"""
+
+from datetime import datetime, date, timedelta
+from itsdangerous import URLSafeSerializer, BadSignature
+from flask import current_app
+from app.extensions import db
+from app.models import Medicine, UserMedicine, MedicationReminder
+from app.schedules import load_schedule, rule_minutes
+
+
+FEED_TOKEN_SALT = "calendar-feed"
+
+# Reminders are scheduled in this zone (see get_scheduler() in application.py). Brisbane has no
+# daylight saving, so a single STANDARD rule describes it completely.
+TIMEZONE = "Australia/Brisbane"
+VTIMEZONE = (
+    "BEGIN:VTIMEZONE",
+    f"TZID:{TIMEZONE}",
+    "BEGIN:STANDARD",
+    "DTSTART:19700101T000000",
+    "TZOFFSETFROM:+1000",
+    "TZOFFSETTO:+1000",
+    "TZNAME:AEST",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+)
+
+# Brisbane's offset from UTC, for RRULE UNTIL values (which must be in UTC)
+UTC_OFFSET = timedelta(hours=10)
+
+EVENT_DURATION = "PT15M"
+
+ICAL_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt=FEED_TOKEN_SALT)
+
+
+def feed_token(user):
+    """
+    Name:       feed_token(user)
+    Purpose:    Returns the signed token that identifies a user's calendar feed.
+    Parameters: user (User): The user the feed belongs to.
+    Returns:    str: The token, for use in the feed URL.
+    """
+
+    return _serializer().dumps([user.id, user.feed_secret])
+
+
+def parse_feed_token(token):
+    """
+    Name:       parse_feed_token(token)
+    Purpose:    Verifies a calendar feed token's signature. The caller must still check the
+                secret against the user's current feed_secret.
+    Parameters: token (str): The token from the feed URL.
+    Returns:    tuple: (user_id, feed_secret), or None if the token is invalid.
+    """
+
+    try:
+        payload = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if (
+        not isinstance(payload, list)
+        or len(payload) != 2
+        or not isinstance(payload[0], int)
+        or not isinstance(payload[1], str)
+    ):
+        return None
+    return payload[0], payload[1]
+
+
+def _escape(text):
+    # RFC 5545 TEXT escaping
+    return (
+        str(text)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    # Content lines are limited to 75 octets; continuation lines start with a space
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Don't split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts)
+
+
+def _utc_stamp(value):
+    return (value or datetime(1970, 1, 1)).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _event(uid, start, rrule, summary, description, stamp):
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{_utc_stamp(stamp)}",
+        f"DTSTART;TZID={TIMEZONE}:{start:%Y%m%dT%H%M%S}",
+        f"DURATION:{EVENT_DURATION}",
+        f"RRULE:{rrule}",
+        f"SUMMARY:{_escape(summary)}",
+        f"DESCRIPTION:{_escape(description)}",
+        "TRANSP:TRANSPARENT",
+        "END:VEVENT",
+    ]
+
+
+def _schedule_events(reminder_id, schedule, start_date, summary, description, stamp):
+    # One recurring event per rule and time of day
+    lines = []
+    for index, rule in enumerate(load_schedule(schedule)):
+        first = date.fromisoformat(rule["start"]) if "start" in rule else start_date
+        if "weekdays" in rule:
+            # DTSTART is always an occurrence, so move it to the first matching weekday
+            while first.weekday() not in rule["weekdays"]:
+                first += timedelta(days=1)
+            rrule = "FREQ=WEEKLY;BYDAY=" + ",".join(ICAL_WEEKDAYS[day] for day in rule["weekdays"])
+        elif "every_days" in rule:
+            rrule = f"FREQ=DAILY;INTERVAL={rule['every_days']}"
+        else:
+            rrule = "FREQ=DAILY"
+        if "end" in rule:
+            until = datetime.combine(date.fromisoformat(rule["end"]), datetime.max.time())
+            rrule += f";UNTIL={until - UTC_OFFSET:%Y%m%dT%H%M%S}Z"
+
+        rule_summary = f"{summary} ({rule['dose']})" if "dose" in rule else summary
+        for minute in rule_minutes(rule):
+            start = datetime.combine(first, datetime.min.time()) + timedelta(minutes=minute)
+            lines.extend(
+                _event(
+                    f"reminder-{reminder_id}-{index}-{minute}@dosetracker",
+                    start,
+                    rrule,
+                    rule_summary,
+                    description,
+                    stamp,
+                )
+            )
+    return lines
+
+
+def build_feed(user_id):
+    """
+    Name:       build_feed(user_id)
+    Purpose:    Builds the iCalendar feed of a user's reminders in one query. Event DTSTARTs use
+                the date the reminder was created, so the feed's content only changes when the
+                reminders do.
+    Parameters: user_id (int): The user whose reminders are included.
+    Returns:    str: The feed in iCalendar format.
+    """
+
+    reminders = (
+        db.session.query(
+            MedicationReminder.id,
+            MedicationReminder.reminder_time,
+            MedicationReminder.reminder_message,
+            MedicationReminder.created_at,
+            MedicationReminder.updated_at,
+            Medicine.name,
+            UserMedicine.schedule,
+        )
+        .join(UserMedicine, MedicationReminder.user_medicine_id == UserMedicine.id)
+        .join(Medicine, UserMedicine.medicine_id == Medicine.id)
+        .filter(MedicationReminder.user_id == user_id)
+        .order_by(MedicationReminder.reminder_time, MedicationReminder.id)
+        .all()
+    )
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Dose Tracker//Medication Reminders//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:Dose Tracker Reminders",
+        f"X-WR-TIMEZONE:{TIMEZONE}",
+        *VTIMEZONE,
+    ]
+    for row in reminders:
+        reminder_id, reminder_time, message, created_at, updated_at, medicine_name, schedule = row
+        start_date = (created_at or datetime(1970, 1, 1)).date()
+        summary = "Take " + medicine_name
+        if schedule:
+            lines.extend(
+                _schedule_events(
+                    reminder_id, schedule, start_date, summary, message or "", updated_at
+                )
+            )
+            continue
+        start = datetime.combine(start_date, reminder_time)
+        lines.extend(
+            _event(
+                f"reminder-{reminder_id}@dosetracker",
+                start,
+                "FREQ=DAILY",
+                summary,
+                message or "",
+                updated_at,
+            )
+        )
+    lines.append("END:VCALENDAR")
+
+    return "".join(_fold(line) + "\r\n" for line in lines)
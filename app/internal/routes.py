@@ -0,0 +1,108 @@
+"""
+internal/routes.py
+------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/internal/routes.py
+
+Purpose:    Contains internal diagnostic routes that are not linked from the user interface.
+            They are only served with PROFILE_ENABLED set, and access requires the signed profile
+            token (see `flask profile-token`), passed either in the X-DoseTracker-Profile header
+            or as a `token` query parameter.
+Routes:
+    - /_internal/profiles: Lists the stored request profiles, newest first.
+    - /_internal/profiles/<name>: Shows one profile's top functions and SQL statements.
+    - /_internal/caches: Hit rates and sizes of this worker's in-process caches, as JSON.
+"""
+
+from flask import Blueprint, render_template, request, current_app, abort, jsonify
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from app.profiling import (
+    PROFILE_HEADER,
+    PROFILE_TOKEN_SALT,
+    SORT_KEYS,
+    list_profiles,
+    load_profile,
+)
+
+
+internal_bp = Blueprint("internal", __name__)
+
+
+@internal_bp.before_request
+def require_token():
+    """
+    Name:       require_token()
+    Purpose:    Rejects requests when profiling is disabled or they don't carry a valid signed
+                profile token.
+    Parameters: None
+    Returns:    None, or aborts with 404 so the routes aren't discoverable.
+    """
+
+    if not current_app.config["PROFILE_ENABLED"]:
+        abort(404)
+
+    token = request.headers.get(PROFILE_HEADER) or request.args.get("token")
+    serializer = URLSafeTimedSerializer(
+        current_app.config["SECRET_KEY"], salt=PROFILE_TOKEN_SALT
+    )
+    try:
+        serializer.loads(token or "", max_age=current_app.config["PROFILE_TOKEN_MAX_AGE"])
+    except BadSignature:
+        abort(404)
+
+
+@internal_bp.route("/profiles")
+def profiles():
+    """
+    Name:       profiles()
+    Purpose:    Lists the stored request profiles with their timing and query counts.
+    Parameters: None
+    Returns:    Response: The rendered profile index.
+    """
+
+    return render_template(
+        "profiles.html",
+        profiles=list_profiles(current_app),
+        token=request.args.get("token", ""),
+    )
+
+
+@internal_bp.route("/profiles/<name>")
+def profile_detail(name):
+    """
+    Name:       profile_detail(name)
+    Purpose:    Shows a single profile as plain text.
+    Parameters: name (str): The profile name.
+    Returns:    Response: The profile report, 404 if it doesn't exist, or 400 for an unknown
+                sort order.
+    """
+
+    sort_by = request.args.get("sort", "cumulative")
+    if sort_by not in SORT_KEYS:
+        abort(400, f"Unknown sort order; use one of {', '.join(sorted(SORT_KEYS))}")
+
+    report = load_profile(current_app, name, sort_by=sort_by)
+    if report is None:
+        abort(404)
+    return report, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
+@internal_bp.route("/caches")
+def caches():
+    """
+    Name:       caches()
+    Purpose:    Reports the statistics of this worker's in-process caches: the medicines
+                catalogue, Wikipedia articles and PDF reports.
+    Parameters: None
+    Returns:    JSON: Each cache's statistics, keyed by cache name.
+    """
+
+    return jsonify(
+        {
+            "catalogue": current_app.extensions["medicine_index"].stats(),
+            "wiki": current_app.extensions["wiki_cache"].stats(),
+            "reports": current_app.extensions["report_cache"].stats(),
+        }
+    )
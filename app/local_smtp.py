@@ -0,0 +1,169 @@
+"""
+local_smtp.py
+-------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/local_smtp.py
+
+Purpose:    A minimal in-process SMTP server that accepts mail and keeps it in memory instead
+            of delivering it. Point MAIL_SERVER/MAIL_PORT at it to exercise the mail queue
+            (or any other mail-sending code) in tests and local development without a real
+            mail server. It can also simulate a slow or failing server.
+
+            Run it standalone with:  python -m app.local_smtp [port]
+"""
+
+import socketserver
+import sys
+import threading
+import time
+from email import message_from_bytes
+from email import policy
+
+
+class ReceivedMessage:
+    """
+    A message accepted by the LocalSMTPServer.
+
+    Attributes:
+        sender (str): The envelope sender (MAIL FROM).
+        recipients (list): The envelope recipients (RCPT TO).
+        data (bytes): The raw message as sent after DATA.
+        message (EmailMessage): The parsed message.
+    """
+
+    def __init__(self, sender, recipients, data):
+        self.sender = sender
+        self.recipients = recipients
+        self.data = data
+        self.message = message_from_bytes(data, policy=policy.default)
+
+    @property
+    def subject(self):
+        return self.message["Subject"]
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 localhost DoseTracker local SMTP ready")
+        sender, recipients = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+
+            if server.delay:
+                time.sleep(server.delay)
+
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip().strip("<>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip().strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    # Undo SMTP dot-stuffing
+                    if data_line.startswith(b".."):
+                        data_line = data_line[1:]
+                    lines.append(data_line)
+
+                if server.fail_next > 0:
+                    server.fail_next -= 1
+                    self.reply("451 Temporary local failure")
+                else:
+                    server.record(ReceivedMessage(sender, recipients, b"".join(lines)))
+                    self.reply("250 OK: queued")
+                sender, recipients = None, []
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded SMTP stand-in that records received messages in memory.
+
+    Attributes:
+        messages (list): ReceivedMessage objects, in the order they were accepted.
+        connections (int): Number of SMTP connections opened so far.
+        delay (float): Seconds to sleep before answering each command (simulates a slow server).
+        fail_next (int): Number of upcoming messages to reject with a 451 temporary failure.
+
+    Methods:
+        start(): Serves in a background thread and returns the server.
+        stop(): Shuts the server down.
+        wait_for(count, timeout): Waits until at least count messages have been received.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.delay = 0
+        self.fail_next = 0
+        self._received = threading.Condition()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def record(self, message):
+        with self._received:
+            self.messages.append(message)
+            self._received.notify_all()
+
+    def wait_for(self, count, timeout=5):
+        with self._received:
+            return self._received.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8025
+    server = LocalSMTPServer(port=port).start()
+    print(f"Local SMTP server listening on 127.0.0.1:{server.port}")
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for message in server.messages[seen:]:
+                print(f"Received '{message.subject}' for {', '.join(message.recipients)}")
+                seen += 1
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,252 @@
+"""
+mailqueue.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/mailqueue.py
+
+Purpose:    Sends Flask-Mail messages from a background thread so requests and scheduled jobs
+            return as soon as a message is queued instead of waiting on the SMTP server.
+
+            The sender thread keeps one SMTP connection open while there is work, sends queued
+            messages in batches over it, and closes it after MAIL_QUEUE_IDLE_TIMEOUT seconds
+            without mail. A message that fails is retried with exponential backoff
+            (MAIL_QUEUE_RETRY_BACKOFF * 2^attempt seconds) up to MAIL_QUEUE_MAX_RETRIES times;
+            the connection is dropped after any failure and re-opened for the next batch.
+
+            At interpreter exit the queue is stopped: messages already queued are still sent
+            (waiting at most MAIL_QUEUE_SHUTDOWN_TIMEOUT seconds), and messages still waiting
+            out a retry backoff are given up.
+"""
+
+import atexit
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+
+class MailQueue:
+    """
+    Background mail sender with a persistent SMTP connection, batching and retries.
+
+    Attributes:
+        app (Flask): The application whose Flask-Mail configuration is used.
+        mail (Mail): The Flask-Mail instance used to open connections.
+        sent (int): Number of messages delivered.
+        failed (int): Number of messages dropped after exhausting their retries.
+
+    Methods:
+        init_app(app, mail): Binds the queue to an application and Flask-Mail instance.
+        send(message, callback): Queues a message and returns immediately.
+        flush(timeout): Blocks until every queued message has been delivered or dropped.
+        stop(): Stops the sender thread after it drains the queue.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.mail = None
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (due_time, seq, attempt, message)
+        self._seq = itertools.count()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = False
+        self._connection = None
+        self._unfinished = 0
+        self._idle = threading.Condition()
+        self._callbacks = {}  # id(message) -> callback
+        self._atexit_registered = False
+
+    def init_app(self, app, mail):
+        self.app = app
+        self.mail = mail
+        app.extensions["mail_queue"] = self
+        if not self._atexit_registered:
+            atexit.register(lambda: self.stop(self.app.config["MAIL_QUEUE_SHUTDOWN_TIMEOUT"]))
+            self._atexit_registered = True
+
+    def send(self, message, callback=None):
+        """
+        Name:       send(message, callback)
+        Purpose:    Queues a message for delivery by the background sender.
+        Parameters: message (Message): The Flask-Mail message to send.
+                    callback (callable): Optional; called from the sender thread as
+                        callback(error) once the message is delivered (error is None) or
+                        dropped after its final retry (error is the last exception).
+        Returns:    None
+        """
+
+        if callback is not None:
+            self._callbacks[id(message)] = callback
+        with self._idle:
+            self._unfinished += 1
+        self._ensure_thread()
+        self._queue.put((0, message))
+
+    def flush(self, timeout=None):
+        """
+        Name:       flush(timeout)
+        Purpose:    Waits until every queued message, including pending retries, has been sent
+                    or dropped. Mostly useful in tests and command-line jobs.
+        Parameters: timeout (float): Seconds to wait, or None to wait indefinitely.
+        Returns:    bool: True if the queue drained, False if the timeout expired.
+        """
+
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def stop(self, timeout=None):
+        """
+        Name:       stop(timeout)
+        Purpose:    Stops the sender thread once it has sent the messages already queued.
+                    Messages waiting out a retry backoff are given up.
+        Parameters: timeout (float): Seconds to wait for the thread, or None to wait indefinitely.
+        Returns:    None
+        """
+
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(
+                    target=self._run, name="mail-queue", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                item = self._next_item()
+                if item is None:
+                    if self._stopping:
+                        break
+                    continue
+
+                # Send this message and whatever else is already waiting as one batch
+                batch = [item]
+                batch_size = self.app.config["MAIL_QUEUE_BATCH_SIZE"]
+                while len(batch) < batch_size:
+                    try:
+                        extra = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if extra is None:
+                        self._stopping = True
+                        break
+                    batch.append(extra)
+
+                self._send_batch(batch)
+
+            self._abandon_retries()
+            self._close_connection()
+
+    def _next_item(self):
+        """
+        Returns the next message to send: a retry whose backoff has expired, otherwise the next
+        queued message. Waits at most until the next retry is due, and closes the SMTP
+        connection if nothing arrives within the idle timeout. Once stopping, never waits:
+        returns None when nothing is left to send.
+        """
+
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            _, _, attempt, message = heapq.heappop(self._retries)
+            return (attempt, message)
+
+        if self._stopping:
+            try:
+                return self._queue.get_nowait()
+            except queue.Empty:
+                return None
+
+        timeout = self.app.config["MAIL_QUEUE_IDLE_TIMEOUT"] if self._connection else None
+        if self._retries:
+            until_retry = max(0, self._retries[0][0] - time.monotonic())
+            timeout = until_retry if timeout is None else min(timeout, until_retry)
+
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            if not self._retries or self._retries[0][0] > time.monotonic():
+                self._close_connection()
+            return None
+
+    def _send_batch(self, batch):
+        for attempt, message in batch:
+            try:
+                if self._connection is None:
+                    self._connection = self.mail.connect()
+                    self._connection.__enter__()
+                self._connection.send(message)
+                self.sent += 1
+                self._finish(message, None)
+            except Exception as e:
+                print(f"Error sending email '{message.subject}' (attempt {attempt + 1}): {e}")
+                self._drop_connection()
+                self._retry(attempt, message, e)
+
+    def _retry(self, attempt, message, error):
+        if attempt + 1 > self.app.config["MAIL_QUEUE_MAX_RETRIES"]:
+            print(f"Giving up on email '{message.subject}' to {message.recipients}")
+            self.failed += 1
+            self._finish(message, error)
+            return
+
+        delay = self.app.config["MAIL_QUEUE_RETRY_BACKOFF"] * (2**attempt)
+        heapq.heappush(
+            self._retries,
+            (time.monotonic() + delay, next(self._seq), attempt + 1, message),
+        )
+
+    def _abandon_retries(self):
+        while self._retries:
+            _, _, _, message = heapq.heappop(self._retries)
+            print(f"Giving up on email '{message.subject}' to {message.recipients}: queue stopped")
+            self.failed += 1
+            self._finish(message, RuntimeError("The mail queue was stopped"))
+
+    def _finish(self, message, error):
+        callback = self._callbacks.pop(id(message), None)
+        if callback is not None:
+            try:
+                callback(error)
+            except Exception as e:
+                print(f"Error in mail callback: {e}")
+        self._task_done()
+
+    def _task_done(self):
+        with self._idle:
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self._idle.notify_all()
+
+    def _close_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except Exception as e:
+                print(f"Error closing SMTP connection: {e}")
+            self._connection = None
+
+    def _drop_connection(self):
+        # The connection may already be broken, so don't wait on a polite QUIT
+        if self._connection is not None and self._connection.host is not None:
+            try:
+                self._connection.host.close()
+            except Exception:
+                pass
+        self._connection = None
+
+
+# Shared queue, bound to the app in create_app()
+mail_queue = MailQueue()
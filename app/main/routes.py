@@ -9,12 +9,26 @@ Purpose:    Contains the routes for the main application, including the index ro
             error messages, and email communication for the Dose Tracker system.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, current_app
+from flask import (
+    Blueprint,
+    render_template,
+    redirect,
+    url_for,
+    flash,
+    current_app,
+    request,
+    make_response,
+    jsonify,
+)
 from flask_mail import Message
-from flask_login import login_required, login_user
+from flask_login import login_required, login_user, current_user
 from app.forms import LoginForm
 from app.models import User
-from app.application import generate_pdf, db
+from app.passwords import needs_rehash, PasswordHasherBusy
+from app.ratelimit import rate_limited
+from app.mailqueue import mail_queue
+from app.reportjobs import report_jobs
+from app.application import get_report_pdf, db
 import traceback
 
 
@@ -22,6 +36,7 @@ main_bp = Blueprint("main", __name__)
 
 
 @main_bp.route("/", methods=["GET", "POST"])
+@rate_limited
 def index():
     """
     Name:       index()
@@ -43,13 +58,23 @@ def index():
 
         user = User.query.filter_by(email=email).first()
 
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+            # Upgrade the stored hash if the configured bcrypt cost has changed
+            if valid and needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash("The server is busy right now, please try again in a moment.", "warning")
+            return render_template("index.html", form=form, page_class="index_page"), 503
+
+        if valid:
             login_user(user)
             return redirect(url_for("medicines.my_medicine"))
 
         flash("Invalid login credentials", "error")
 
-    return render_template("index.html", form=form)
+    return render_template("index.html", form=form, page_class="index_page")
 
 
 @main_bp.route("/send_pdf/<user_email>")
@@ -57,41 +82,77 @@ def index():
 def send_pdf(user_email):
     """
     Name:       send_pdf(user_email)
-    Purpose:    Generates a PDF report of the user's medicines and sends it via email to the provided
-                email address. The function is protected by login requirements to ensure the user is
-                authenticated before sending the email.
+    Purpose:    Queues a background job that generates a PDF report of the user's medicines and
+                emails it to the provided address. The request returns as soon as the job is
+                queued; its progress can be followed at `report_job_status`.
     Parameters: user_email (str): The email address to which the PDF report will be sent.
-    Returns:    Response (Flask): A redirect to the medicines page (`my_medicine`) if the email is
-                successfully sent, or an error message if there is a failure during email sending.
+    Returns:    Response (Flask): 202 with the job id and status URL as JSON when the client asks
+                for JSON, otherwise a redirect to the medicines page that polls the job.
     """
 
-    print(f"Sending PDF to {user_email}")
+    print(f"Queueing PDF report for {user_email}")
 
-    pdf_output = generate_pdf()
+    job_id = report_jobs.submit(current_user.id, user_email)
+    status_url = url_for("main.report_job_status", job_id=job_id)
 
-    # Send the email with the attached PDF
-    msg = Message(
-        "Your Dose Tracker Report",
-        recipients=[user_email],
-        sender="Dose Tracker <dave@djrogers.net.au>",
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202
+
+    flash(f"Your report is being prepared and will be emailed to {user_email}.", "info")
+    return redirect(url_for("medicines.my_medicine", report_job=job_id))
+
+
+@main_bp.route("/report_jobs/<job_id>")
+@login_required
+def report_job_status(job_id):
+    """
+    Name:       report_job_status(job_id)
+    Purpose:    Reports the progress of one of the user's report jobs.
+    Parameters: job_id (str): The id returned by `send_pdf`.
+    Returns:    Response (Flask): JSON with the job's status (queued, rendering, sending, sent or
+                failed) and error message, or 404 with the status "unknown" if the job doesn't
+                exist, has expired or belongs to another user.
+    """
+
+    job = report_jobs.get(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        return jsonify({"job_id": job_id, "status": "unknown", "error": "Unknown report job"}), 404
+
+    return jsonify(
+        {
+            "job_id": job["id"],
+            "status": job["status"],
+            "error": job["error"],
+            "updated": job["updated"].isoformat(),
+        }
     )
-    msg.body = "Please find attached your medicines report."
 
-    # Attach the generated PDF
-    msg.attach("medicines_report.pdf", "application/pdf", pdf_output)
 
-    # Send the email
-    try:
-        if not current_app.extensions["mail"]:
-            raise ValueError("Mail object is not initialized properly.")
+@main_bp.route("/download_pdf")
+@login_required
+def download_pdf():
+    """
+    Name:       download_pdf()
+    Purpose:    Downloads the user's PDF medicines report. The report is served from the report
+                cache when the user's data hasn't changed, and the response carries an ETag based
+                on the user's schedule version so a browser re-requesting it gets a 304.
+    Parameters: None
+    Returns:    Response (Flask): The PDF as an attachment, or 304 Not Modified.
+    """
 
-        print("Sending email...")
-        current_app.extensions["mail"].send(msg)
-        print("Email sent!")
-        return redirect(url_for("medicines.my_medicine"))
+    etag = f"report-{current_user.id}-{current_user.schedule_version}"
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = make_response(get_report_pdf(current_user))
+        response.mimetype = "application/pdf"
+        response.headers["Content-Disposition"] = (
+            'attachment; filename="medicines_report.pdf"'
+        )
 
-    except Exception as e:
-        return f"An error occurred: {e}"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 
 @main_bp.route("/test_email")
@@ -102,10 +163,9 @@ def test_email():
     try:
         if not current_app.extensions["mail"]:
             raise ValueError("Mail object is not initialized properly.")
-        print("Sending email...")
-        current_app.extensions["mail"].send(msg)
-        print("Email sent!")
-        return "Test email sent successfully!"
+        mail_queue.send(msg)
+        print("Email queued!")
+        return "Test email queued successfully!"
     except Exception as e:
         print("Error occurred:", e)
         traceback.print_exc()
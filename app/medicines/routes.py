@@ -14,36 +14,67 @@ Purpose:    Contains the routes related to managing medicines for the user, incl
 Routes:
     - /api/medicines: Provides a JSON representation of the user's medicines and associated reminders.
     - /add_medicine: Allows users to add new medicines and set up reminders.
+    - /suggest: Suggests catalogue medicine names starting with what the user has typed.
     - /my_medicine: Displays a list of the user's medicines along with their reminders.
+    - /export/<dataset>.<fmt>: Streams the user's medicines, reminders or dose history as CSV or JSON Lines.
+    - /calendar/<token>.ics: Serves the user's reminders as an iCalendar feed, authenticated by a signed token.
+    - /calendar/reset: Replaces the user's calendar feed URL, revoking the old one.
     - /delete_medicine/<medicine_id>: Deletes a specific medicine from the user's list.
     - /edit_medicine/<medicine_id>: Enables users to edit the details of an existing medicine and its reminders.
     - /medicine/<medicine_id>: Fetches and displays detailed information about a medicine, including content from Wikipedia.
+    - /medicine/<medicine_id>/section/<index>: Returns the full text of one Wikipedia section as JSON.
+    - /search: Full-text search of the offline drug-information store.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app
+import hmac
+from flask import (
+    Blueprint,
+    render_template,
+    redirect,
+    url_for,
+    request,
+    flash,
+    jsonify,
+    current_app,
+    Response,
+    stream_with_context,
+    make_response,
+)
+from markupsafe import Markup
 from flask_login import login_required, current_user
 from config import Config
-from app.models import Medicine, UserMedicine, MedicationReminder, User
-from app.application import scheduler, mail, create_app
+from app.models import (
+    Medicine,
+    UserMedicine,
+    MedicationReminder,
+    User,
+    DoseHistory,
+    new_feed_secret,
+)
 from app.extensions import db
+from app.cache import TieredCache
+from app.export import DATASETS, FORMATS as EXPORT_FORMATS, export_rows
+from app.icsfeed import build_feed, feed_token, parse_feed_token
 from app.forms import MedicineForm, ReminderForm, EditMedicineForm
+from app.schedules import CUSTOM_SCHEDULE, dump_schedule, format_schedule, load_schedule
 from datetime import time, datetime
-from flask_mail import Mail, Message
-from twilio.rest import Client
-from wtforms import TimeField, StringField, SelectField
-from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
-import wikipediaapi
 
 
 # Define the blueprint for medicines routes
 medicines = Blueprint("medicines", __name__)
 
-# Initialise Wikipedia API
-wiki_wiki = wikipediaapi.Wikipedia(
-    user_agent="DoseTracker (dave@djrogers.net.au)", language="en"
+# Rendered my_medicine tables, keyed by (user_id, data_version)
+medicine_table_cache = TieredCache(
+    max_entries=current_app.config["FRAGMENT_CACHE_SIZE"],
+    directory=current_app.config["FRAGMENT_CACHE_DIR"],
 )
 
+# Characters of each Wikipedia section shown before it is expanded
+SECTION_PREVIEW_LENGTH = 500
+
+# Generated .ics calendar feeds, keyed by (user_id, schedule_version)
+calendar_feed_cache = TieredCache(max_entries=current_app.config["CALENDAR_CACHE_SIZE"])
+
 
 @medicines.route("/api/medicines", methods=["GET"])
 @login_required
@@ -60,27 +91,26 @@ def api_medicines():
 
     user_medicines = UserMedicine.query.filter_by(user_id=current_user.id).all()
     medicines = []
+    catalogue = current_app.extensions["medicine_index"]
 
-    # Fetch associated medicine names and reminders for each user_medicine entry
-    for user_medicine in user_medicines:
-        medicine = Medicine.query.get(user_medicine.medicine_id)
-
-        # Fetch reminders for this user_medicine
-        reminders = MedicationReminder.query.filter_by(
-            user_medicine_id=user_medicine.id
-        ).all()
+    reminders_by_medicine = load_reminders_by_medicine(current_user.id)
 
-        # Add reminder details to the medicine data
-        reminder_data = []
-        for reminder in reminders:
-            reminder_data.append(
-                {"reminder_time": reminder.reminder_time, "status": reminder.status}
-            )
+    # Look up each user_medicine entry's name in the catalogue and attach its reminders
+    for user_medicine in user_medicines:
+        medicine_name = catalogue.name(user_medicine.medicine_id)
+        # Times as "HH:MM", as JSON has no time type
+        reminder_data = [
+            {
+                "reminder_time": reminder["reminder_time"].strftime("%H:%M"),
+                "status": reminder["status"],
+            }
+            for reminder in reminders_by_medicine.get(user_medicine.id, [])
+        ]
 
         medicines.append(
             {
-                "id": medicine.id,
-                "name": medicine.name,
+                "id": user_medicine.medicine_id,
+                "name": medicine_name,
                 "dosage": user_medicine.dosage,
                 "frequency": user_medicine.frequency,
                 "notes": user_medicine.notes,
@@ -102,41 +132,68 @@ def add_medicine():
     Parameters: None
     Returns:    Rendered Template: A template for adding medicine (`add_medicine.html`) if the form
                 is not submitted or contains errors. Redirects to the 'my_medicine' page if the
-                medicine and reminder are successfully added.
+                medicine and reminder are successfully added. A name that isn't in the catalogue
+                but is similar to names that are re-renders the form offering those medicines;
+                submitting the same name again adds it.
     """
 
     medicine_form = MedicineForm()
     reminder_form = ReminderForm()
 
-    if request.method == "POST":
-        # Loop through dynamically generated reminder fields
-        reminder_count = get_reminder_count(medicine_form.frequency.data)
-        for i in range(reminder_count):
-            reminder_time = request.form.get(f"reminder_time_{i}")
-            reminder_message = request.form.get(f"reminder_message_{i}")
-            print(f"Reminder {i+1} Time: {reminder_time}")
-            print(f"Reminder {i+1} Message: {reminder_message}")
-
     if medicine_form.validate_on_submit():
-        medicine_name = medicine_form.name.data
+        medicine_name = medicine_form.name.data.strip()
         dosage = medicine_form.dosage.data
         frequency = medicine_form.frequency.data
         notes = medicine_form.notes.data
 
-        # Find the medicine in the database or create it
-        medicine = Medicine.query.filter_by(name=medicine_name).first()
-        if not medicine:
+        # Find the medicine in the catalogue, ignoring case and spacing, or create it
+        medicine_index = current_app.extensions["medicine_index"]
+        medicine_id = medicine_index.find(medicine_name)
+        if medicine_id is None:
+            medicine = Medicine.query.filter_by(name=medicine_name).first()
+            medicine_id = medicine.id if medicine else None
+        if medicine_id is None:
+            # Before adding what may be a misspelling, offer the similar catalogue medicines,
+            # unless the user has already seen them and confirmed this name
+            if request.form.get("confirm_new") != medicine_name:
+                similar_medicines = medicine_index.similar(
+                    medicine_name, threshold=current_app.config["CATALOG_SIMILAR_THRESHOLD"]
+                )
+                if similar_medicines:
+                    return render_template(
+                        "add_medicine.html",
+                        medicine_form=medicine_form,
+                        reminder_form=reminder_form,
+                        similar_medicines=similar_medicines,
+                        new_name=medicine_name,
+                    )
+
             medicine = Medicine(name=medicine_name)
             db.session.add(medicine)
             db.session.commit()
 
+            # Make it suggestable, and fetch its Wikipedia article now so the details page
+            # never starts cold
+            medicine_index.add(medicine.id, medicine.name)
+            current_app.extensions["wiki_cache"].prefetch(medicine_name)
+            medicine_id = medicine.id
+
+        # A custom schedule decides when its reminder is sent; the reminder's own time is the
+        # schedule's next occurrence, for display
+        schedule = None
+        schedule_time = None
+        if frequency == CUSTOM_SCHEDULE:
+            schedule = dump_schedule(medicine_form.schedule_rules)
+            schedule_time = medicine_form.schedule_first_time.strftime("%H:%M")
+
         # Add the medicine to the user's list
         user_medicine = UserMedicine(
             user_id=current_user.id,
-            medicine_id=medicine.id,
+            medicine_id=medicine_id,
             dosage=dosage,
             frequency=frequency,
             notes=notes,
+            schedule=schedule,
         )
         db.session.add(user_medicine)
         db.session.commit()
@@ -144,7 +201,7 @@ def add_medicine():
         # Create a reminder if reminder details are provided
         reminder_count = get_reminder_count(frequency)
         for i in range(reminder_count):
-            reminder_time = request.form.get(f"reminder_time_{i}")
+            reminder_time = schedule_time or request.form.get(f"reminder_time_{i}")
             reminder_message = request.form.get(f"reminder_message_{i}")
             status = reminder_form.status.data
 
@@ -158,6 +215,9 @@ def add_medicine():
                 )
                 db.session.add(reminder)
 
+        # Invalidate cached pages for this user
+        User.bump_data_version([current_user.id])
+
         try:
             db.session.commit()
             
@@ -176,11 +236,32 @@ def add_medicine():
     )
 
 
+@medicines.route("/suggest", methods=["GET"])
+@login_required
+def suggest():
+    """
+    Name:       suggest()
+    Purpose:    Suggests catalogue medicines whose names start with the text typed so far, for the
+                name field of the add-medicine form. Served from the in-memory prefix index, so
+                a keystroke costs no database query.
+    Parameters: None (reads the `q` and optional `limit` query parameters)
+    Returns:    JSON: A list of {id, name} suggestions, at most SUGGEST_LIMIT long.
+    """
+
+    limit = min(
+        request.args.get("limit", current_app.config["SUGGEST_LIMIT"], type=int),
+        current_app.config["SUGGEST_LIMIT"],
+    )
+    query = request.args.get("q", "")
+    return jsonify(current_app.extensions["medicine_index"].suggest(query, max(limit, 0)))
+
+
 def get_reminder_count(frequency):
     """
     Name:       get_reminder_count()
     Purpose:    Determines the number of reminders based on the frequency of the medication.
-                It maps medication frequency to the number of reminders that should be set.
+                It maps medication frequency to the number of reminders that should be set. A
+                custom schedule has one reminder, sent at each of the schedule's occurrences.
     Parameters: frequency (str): The frequency of the medication (e.g., 'Once a Day', 'Twice a Day').
     Returns:    int: The number of reminders based on the frequency.
                 Returns 0 if the frequency does not match any predefined options.
@@ -194,6 +275,8 @@ def get_reminder_count(frequency):
         return 3
     elif frequency == "Four Times a Day":
         return 4
+    elif frequency == CUSTOM_SCHEDULE:
+        return 1
     return 0  # Default to 0 if no frequency is matched
 
 
@@ -209,30 +292,78 @@ def my_medicine():
     Returns:    Response: The rendered HTML template displaying the user's medicines and associated details.
     """
 
-    # Query medicines associated with the current user
-    user_medicines = UserMedicine.query.filter_by(user_id=current_user.id).all()
-    medicines = []
+    # The table only changes when the user's data version does, so serve it from the cache
+    cache_key = (current_user.id, current_user.data_version)
+    medicine_table = medicine_table_cache.get(cache_key)
 
-    # Fetch associated medicine names and reminders for each user_medicine entry
-    for user_medicine in user_medicines:
-        medicine = Medicine.query.get(user_medicine.medicine_id)
+    if medicine_table is None:
+        medicine_table = render_template(
+            "medicine_table.html", medicines=get_sorted_medicines(current_user.id)
+        )
+        medicine_table_cache.set(cache_key, medicine_table)
+
+    return render_template(
+        "my_medicine.html",
+        medicine_table=Markup(medicine_table),
+        calendar_url=url_for(
+            "medicines.calendar_feed", token=feed_token(current_user), _external=True
+        ),
+        page_class="my_medicine_page",
+    )
 
-        # Fetch reminders for this user_medicine
-        reminders = MedicationReminder.query.filter_by(
-            user_medicine_id=user_medicine.id
-        ).all()
 
-        # Format reminder data for template
-        reminder_data = []
-        for reminder in reminders:
-            reminder_data.append(
-                {"reminder_time": reminder.reminder_time, "status": reminder.status}
-            )
+def load_reminders_by_medicine(user_id):
+    """
+    Name:       load_reminders_by_medicine(user_id)
+    Purpose:    Fetches all of a user's reminder times and statuses in one query, rather than one
+                query per medicine.
+    Parameters: user_id (int): The ID of the user whose reminders are loaded.
+    Returns:    dict: Lists of {"reminder_time", "status"} dicts in creation order, keyed by
+                user_medicine_id.
+    """
+
+    reminders_by_medicine = {}
+    reminders = db.session.execute(
+        db.select(
+            MedicationReminder.user_medicine_id,
+            MedicationReminder.reminder_time,
+            MedicationReminder.status,
+        )
+        .where(MedicationReminder.user_id == user_id)
+        .order_by(MedicationReminder.id)
+    )
+    for user_medicine_id, reminder_time, status in reminders:
+        reminders_by_medicine.setdefault(user_medicine_id, []).append(
+            {"reminder_time": reminder_time, "status": status}
+        )
+    return reminders_by_medicine
+
+
+def get_sorted_medicines(user_id):
+    """
+    Name:       get_sorted_medicines(user_id)
+    Purpose:    Loads a user's medicines with their dosage, frequency, notes and reminders, sorted
+                by the first reminder time and then by medicine name.
+    Parameters: user_id (int): The ID of the user whose medicines are loaded.
+    Returns:    list: A list of medicine dicts ready for the medicine table template.
+    """
+
+    # Query medicines associated with the user
+    user_medicines = UserMedicine.query.filter_by(user_id=user_id).all()
+    medicines = []
+    catalogue = current_app.extensions["medicine_index"]
+
+    reminders_by_medicine = load_reminders_by_medicine(user_id)
+
+    # Look up each user_medicine entry's name in the catalogue and attach its reminders
+    for user_medicine in user_medicines:
+        medicine_name = catalogue.name(user_medicine.medicine_id)
+        reminder_data = reminders_by_medicine.get(user_medicine.id, [])
 
         medicines.append(
             {
-                "id": medicine.id,
-                "name": medicine.name,
+                "id": user_medicine.medicine_id,
+                "name": medicine_name,
                 "dosage": user_medicine.dosage,
                 "frequency": user_medicine.frequency,
                 "notes": user_medicine.notes,
@@ -250,11 +381,105 @@ def my_medicine():
         )
     )
 
-    return render_template(
-        "my_medicine.html", medicines=medicines, page_class="my_medicine_page"
+    return medicines
+
+
+@medicines.route("/export/<dataset>.<fmt>")
+@login_required
+def export(dataset, fmt):
+    """
+    Name:       export(dataset, fmt)
+    Purpose:    Streams the user's medicines, reminders or dose history as CSV or JSON Lines.
+                Rows are read from a server-side cursor and sent as they are encoded, so large
+                histories are never held in memory.
+    Parameters: dataset (str): 'medicines', 'reminders' or 'history'.
+                fmt (str): 'csv' or 'jsonl'.
+    Returns:    Response: The streamed export as an attachment, or 404 for an unknown dataset
+                or format.
+    """
+
+    if dataset not in DATASETS or fmt not in EXPORT_FORMATS:
+        return "Unknown export", 404
+
+    filename = f"dosetracker-{dataset}-{datetime.now():%Y%m%d}.{fmt}"
+    return Response(
+        stream_with_context(export_rows(dataset, fmt, current_user.id)),
+        content_type=EXPORT_FORMATS[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "private, no-store",
+        },
     )
 
 
+@medicines.route("/calendar/<token>.ics")
+def calendar_feed(token):
+    """
+    Name:       calendar_feed(token)
+    Purpose:    Serves a user's reminders as an iCalendar feed for calendar apps to subscribe to.
+                The signed token in the URL stands in for a login. A poll costs one lookup of the
+                user's schedule version and feed secret: a matching If-None-Match gets a 304,
+                otherwise the feed is served from the feed cache and only rebuilt after the
+                reminders change.
+    Parameters: token (str): The signed feed token from feed_token().
+    Returns:    Response: The feed as text/calendar, 304 Not Modified, or 404 for a bad or
+                revoked token.
+    """
+
+    parsed = parse_feed_token(token)
+    row = None
+    if parsed is not None:
+        user_id, secret = parsed
+        row = (
+            db.session.query(User.schedule_version, User.feed_secret)
+            .filter(User.id == user_id)
+            .first()
+        )
+    if row is None or not hmac.compare_digest(row.feed_secret, secret):
+        return "Unknown calendar", 404
+
+    etag = f"calendar-{user_id}-{row.schedule_version}"
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        cache_key = (user_id, row.schedule_version)
+        feed = calendar_feed_cache.get(cache_key)
+        if feed is None:
+            feed = build_feed(user_id)
+            calendar_feed_cache.set(cache_key, feed)
+        response = make_response(feed)
+        response.mimetype = "text/calendar"
+        response.headers["Content-Disposition"] = 'inline; filename="dosetracker.ics"'
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@medicines.route("/calendar/reset", methods=["POST"])
+@login_required
+def reset_calendar_feed():
+    """
+    Name:       reset_calendar_feed()
+    Purpose:    Gives the user a new calendar feed URL. The old URL stops working at once, so
+                calendars subscribed to it have to be subscribed again.
+    Parameters: None
+    Returns:    Response: Redirects to the 'my_medicine' page with a flash message.
+    """
+
+    current_user.feed_secret = new_feed_secret()
+    try:
+        db.session.commit()
+        flash(
+            "Your calendar link has been reset. Subscribe your calendar to the new link.",
+            "success",
+        )
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+    return redirect(url_for("medicines.my_medicine"))
+
+
 @medicines.route("/delete_medicine/<int:medicine_id>", methods=["POST"])
 @login_required
 def delete_medicine(medicine_id):
@@ -276,8 +501,16 @@ def delete_medicine(medicine_id):
         # Delete associated reminders for the medicine
         MedicationReminder.query.filter_by(user_medicine_id=user_medicine.id).delete()
 
+        # Keep the dose history, detached from the deleted medicine
+        DoseHistory.query.filter_by(user_medicine_id=user_medicine.id).update(
+            {DoseHistory.user_medicine_id: None}
+        )
+
         # Delete the user_medicine record
         db.session.delete(user_medicine)
+
+        # Invalidate cached pages for this user
+        User.bump_data_version([current_user.id])
         db.session.commit()
 
         # Schedule the daily reminders after deleting
@@ -298,7 +531,9 @@ def edit_medicine(medicine_id):
     Name:       edit_medicine(medicine_id)
     Purpose:    Allows a user to edit the details of an existing medicine, including dosage, frequency,
                 notes, and reminders. The function pre-fills the form with current data and updates
-                the database after form submission.
+                the database after form submission. Submitted reminders are matched to the
+                existing ones by id (see reconcile_reminders()), and only what changed is
+                written.
     Parameters: medicine_id (int): The ID of the medicine to be edited.
     Returns:    Response: Renders the 'edit_medicine.html' template with the form for editing,
                 or redirects to 'my_medicine' page after successfully saving the changes,
@@ -320,6 +555,8 @@ def edit_medicine(medicine_id):
         form.dosage.data = user_medicine.dosage
         form.frequency.data = user_medicine.frequency
         form.notes.data = user_medicine.notes
+        if user_medicine.schedule:
+            form.schedule.data = format_schedule(load_schedule(user_medicine.schedule))
 
         # Prepare reminder data for JavaScript
         reminder_data = []
@@ -327,6 +564,7 @@ def edit_medicine(medicine_id):
             for reminder in user_medicine.reminders:
                 reminder_data.append(
                     {
+                        "id": reminder.id,
                         "reminder_time": (
                             reminder.reminder_time.strftime("%H:%M")
                             if reminder.reminder_time
@@ -347,74 +585,79 @@ def edit_medicine(medicine_id):
 
     # Handle POST request for form submission
     if request.method == "POST":
-        # Extract reminder data from the form dynamically based on the number of reminders
-        reminder_times = [
-            request.form.get(f"reminder_time_{i}") for i in range(4)
-        ]  # Max 4 reminders
-        reminder_messages = [
-            request.form.get(f"reminder_message_{i}") for i in range(4)
-        ]
-        statuses = [request.form.get(f"status_{i}") for i in range(4)]
-
-        # Manually validate statuses
+        # Extract reminder data from the form dynamically based on the number of reminders. Each
+        # row carries the id of the reminder it was loaded from, blank for a new one.
         valid_status_choices = ["pending", "sent"]
-        statuses = [
-            status if status in valid_status_choices else "pending"
-            for status in statuses
-        ]
-
-        # Filter out empty reminder data
-        filtered_reminders = [
-            (time, message, status)
-            for time, message, status in zip(
-                reminder_times, reminder_messages, statuses
+        submitted_reminders = []
+        for i in range(4):  # Max 4 reminders
+            status = request.form.get(f"status_{i}")
+            submitted_reminders.append(
+                (
+                    request.form.get(f"reminder_id_{i}", type=int),
+                    request.form.get(f"reminder_time_{i}"),
+                    request.form.get(f"reminder_message_{i}"),
+                    status if status in valid_status_choices else "pending",
+                )
             )
-            if time and message and status in valid_status_choices
-        ]
 
         # Check if the form is valid
         if form.validate_on_submit():
-            # Update basic medicine data
-            medicine.name = form.name.data.strip()
-            user_medicine.dosage = form.dosage.data.strip()
-            user_medicine.frequency = form.frequency.data.strip()
-            user_medicine.notes = form.notes.data.strip()
-
-            # Get the current reminders
-            current_reminders = user_medicine.reminders
-
-            # If the number of reminders has decreased, delete the extra ones from the database
-            if len(filtered_reminders) < len(current_reminders):
-                # Remove excess reminders
-                for i in range(len(filtered_reminders), len(current_reminders)):
-                    db.session.delete(current_reminders[i])
-
-            # Loop over the filtered reminder fields and update or create new reminders
-            for i, (reminder_time, reminder_message, status) in enumerate(
-                filtered_reminders
+            frequency = form.frequency.data.strip()
+
+            # A custom schedule decides when its reminder is sent; the reminder's own time is
+            # the schedule's next occurrence, for display
+            if frequency == CUSTOM_SCHEDULE:
+                schedule = dump_schedule(form.schedule_rules)
+                schedule_time = form.schedule_first_time.strftime("%H:%M")
+                submitted_reminders = [
+                    (reminder_id, schedule_time, message, status)
+                    for reminder_id, _, message, status in submitted_reminders
+                    if message
+                ][:1]
+            else:
+                schedule = None
+
+            # Filter out empty reminder data
+            submitted_reminders = [
+                reminder for reminder in submitted_reminders if reminder[1] and reminder[2]
+            ]
+
+            # Only write what the user actually changed
+            changed = False
+            for field, value in (
+                ("dosage", form.dosage.data.strip()),
+                ("frequency", frequency),
+                ("notes", form.notes.data.strip()),
+                ("schedule", schedule),
             ):
-                if i < len(current_reminders):
-                    reminder = current_reminders[i]  # Update existing reminder
-                    reminder.reminder_time = reminder_time
-                    reminder.reminder_message = reminder_message
-                    reminder.status = status
-                else:
-                    # If no reminder exists, create a new reminder
-                    new_reminder = MedicationReminder(
-                        reminder_time=reminder_time,
-                        reminder_message=reminder_message,
-                        status=status,
-                        user_medicine_id=user_medicine.id,
-                        user_id=current_user.id,
-                    )
-                    db.session.add(new_reminder)
+                if (getattr(user_medicine, field) or None) != (value or None):
+                    setattr(user_medicine, field, value)
+                    changed = True
+            reminder_changes = reconcile_reminders(user_medicine, submitted_reminders)
+            changed = changed or any(reminder_changes.values())
+
+            # Renaming a catalog medicine changes the pages of everyone who takes it
+            new_name = form.name.data.strip()
+            renamed = new_name != medicine.name
+            if renamed:
+                User.bump_data_version(
+                    db.select(UserMedicine.user_id).filter_by(medicine_id=medicine.id)
+                )
+                medicine.name = new_name
+            elif changed:
+                User.bump_data_version([current_user.id])
+            else:
+                flash("No changes to save.", "info")
+                return redirect(url_for("medicines.my_medicine"))
 
             # Commit changes to the database
             try:
                 db.session.commit()
 
-                # Schedule the daily reminders after editing
-                # update_reminders()
+                # A renamed medicine is suggested, and needs the article, under its new name
+                if renamed:
+                    current_app.extensions["medicine_index"].add(medicine.id, new_name)
+                    current_app.extensions["wiki_cache"].prefetch(new_name)
 
                 # Advise user
                 flash("Changes saved successfully!", "success")
@@ -436,43 +679,109 @@ def edit_medicine(medicine_id):
     )
 
 
+def reconcile_reminders(user_medicine, submitted):
+    """
+    Name:       reconcile_reminders(user_medicine, submitted)
+    Purpose:    Brings a user medicine's reminders in line with the ones submitted in the edit
+                form, matching them by reminder id rather than by position. Only the fields that
+                differ are written; submitted rows without a known id are added, and existing
+                reminders that weren't submitted are deleted. Nothing is committed.
+    Parameters: user_medicine (UserMedicine): The medicine being edited.
+                submitted (list): (reminder_id, "HH:MM", message, status) tuples from the form,
+                                  with reminder_id None for a new reminder.
+    Returns:    dict: Numbers of reminders created, updated and deleted.
+    """
+
+    existing = {reminder.id: reminder for reminder in user_medicine.reminders}
+    kept = set()
+    created = updated = 0
+    for reminder_id, reminder_time, message, status in submitted:
+        try:
+            reminder_time = time.fromisoformat(reminder_time)
+        except ValueError:
+            continue
+
+        reminder = existing.get(reminder_id) if reminder_id not in kept else None
+        if reminder is None:
+            db.session.add(
+                MedicationReminder(
+                    reminder_time=reminder_time,
+                    reminder_message=message,
+                    status=status,
+                    user_medicine_id=user_medicine.id,
+                    user_id=user_medicine.user_id,
+                )
+            )
+            created += 1
+            continue
+
+        kept.add(reminder_id)
+        fields_changed = False
+        if reminder.reminder_time != reminder_time:
+            reminder.reminder_time = reminder_time
+            fields_changed = True
+        if reminder.reminder_message != message:
+            reminder.reminder_message = message
+            fields_changed = True
+        # The daily reset writes "Pending", the form "pending"
+        if (reminder.status or "").lower() != status:
+            reminder.status = status
+            fields_changed = True
+        updated += fields_changed
+
+    deleted = 0
+    for reminder_id, reminder in existing.items():
+        if reminder_id not in kept:
+            db.session.delete(reminder)
+            deleted += 1
+    return {"created": created, "updated": updated, "deleted": deleted}
+
+
 @medicines.route("/medicine/<int:medicine_id>", methods=["GET"])
 @login_required
 def medicine_details(medicine_id):
     """
     Name:       medicine_details(medicine_id)
     Purpose:    Displays detailed information about a specific medicine, including data fetched from
-                Wikipedia. If the Wikipedia page exists, the sections are displayed; otherwise, an
-                error message is shown.
+                Wikipedia through the Wikipedia cache. If the Wikipedia page exists, each section's
+                title and a short preview are displayed (the full text is loaded on demand from
+                `medicine_section`); otherwise, an error message is shown.
     Parameters: medicine_id (int): The ID of the medicine whose details are to be retrieved.
     Returns:    Response: Renders the 'medicine_details.html' template with the medicine details and
                 Wikipedia sections, or a message indicating that the Wikipedia page was not found.
     """
 
-    # Query the medicine from the database
-    medicine = Medicine.query.get(medicine_id)
-    if not medicine:
+    # Look the medicine up in the in-memory catalogue
+    medicine_name = current_app.extensions["medicine_index"].name(medicine_id)
+    if medicine_name is None:
         return "Medicine not found", 404
+    medicine = {"id": medicine_id, "name": medicine_name}
 
-    # Use wikipedia-api to search for the medicine
-    page = wiki_wiki.page(medicine.name)
+    # Wikipedia articles are cached; a stale copy is served while it refreshes in the background
+    try:
+        article = current_app.extensions["wiki_cache"].get(medicine_name)
+    except Exception as e:
+        print(f"Error fetching Wikipedia article for {medicine_name}: {e}")
+        return render_template(
+            "medicine_details.html", medicine=medicine, wiki_unavailable=True
+        )
 
     # Check if the page exists
-    if not page.exists():
+    if not article["exists"]:
         return render_template(
             "medicine_details.html", medicine=medicine, wiki_not_found=True
         )
 
-    # Get the sections from the Wikipedia page
+    # Only titles and previews are rendered; the full text of a section is fetched from
+    # medicine_section when it is expanded
     sections = []
-    for section in page.sections:
+    for index, section in enumerate(article["sections"]):
         sections.append(
             {
-                "title": section.title,
-                "content": section.text[
-                    :500
-                ],  # Just show the first 500 characters initially
-                "full_content": section.text,  # The full content for later expansion
+                "index": index,
+                "title": section["title"],
+                "content": section["text"][:SECTION_PREVIEW_LENGTH],
+                "has_more": len(section["text"]) > SECTION_PREVIEW_LENGTH,
             }
         )
 
@@ -481,24 +790,95 @@ def medicine_details(medicine_id):
     )
 
 
+@medicines.route("/medicine/<int:medicine_id>/section/<int:section_index>", methods=["GET"])
+@login_required
+def medicine_section(medicine_id, section_index):
+    """
+    Name:       medicine_section(medicine_id, section_index)
+    Purpose:    Returns the full text of one section of a medicine's Wikipedia article, for the
+                details page to load when the section is expanded. Served from the Wikipedia
+                cache, with an ETag so a browser re-expanding the section gets a 304.
+    Parameters: medicine_id (int): The ID of the medicine.
+                section_index (int): The position of the section in the article.
+    Returns:    Response: JSON with the section's title and text, 304 Not Modified, or 404 if
+                the medicine, article or section doesn't exist.
+    """
+
+    medicine_name = current_app.extensions["medicine_index"].name(medicine_id)
+    if medicine_name is None:
+        return jsonify({"error": "Medicine not found"}), 404
+
+    try:
+        article = current_app.extensions["wiki_cache"].get(medicine_name)
+    except Exception as e:
+        print(f"Error fetching Wikipedia article for {medicine_name}: {e}")
+        return jsonify({"error": "Wikipedia is unavailable"}), 503
+
+    if not article["exists"] or not 0 <= section_index < len(article["sections"]):
+        return jsonify({"error": "Section not found"}), 404
+
+    section = article["sections"][section_index]
+    response = jsonify({"title": section["title"], "text": section["text"]})
+    response.set_etag(f"wiki-{medicine_id}-{section_index}-{article['fetched']}")
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+@medicines.route("/search", methods=["GET"])
+@login_required
+def search():
+    """
+    Name:       search()
+    Purpose:    Full-text search of the offline drug-information store across medicine names and
+                section text, best matches first. Results for medicines in the catalogue link to
+                their details page.
+    Parameters: None (reads the `q` query parameter)
+    Returns:    Response: The rendered search page, or JSON results if the client asks for JSON.
+    """
+
+    query = request.args.get("q", "").strip()
+    results = current_app.extensions["drug_info"].search(query) if query else []
+
+    # Link results to catalogue medicines
+    catalogue = current_app.extensions["medicine_index"]
+    for result in results:
+        result["medicine_id"] = catalogue.find(result["name"])
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(
+            [
+                {
+                    "name": result["name"],
+                    "section": result["section"],
+                    "snippet": result["snippet"].striptags(),
+                    "medicine_id": result["medicine_id"],
+                }
+                for result in results
+            ]
+        )
+
+    return render_template("search.html", query=query, results=results)
+
+
 @medicines.route('/update_medicine', methods=['GET'])
 def update_medicine():
     # Get the current user's medicines
     user_medicines = UserMedicine.query.filter_by(user_id=current_user.id).all()
+    catalogue = current_app.extensions["medicine_index"]
     
     # Initialize an empty list to store response data
     response_data = []
     
+    # Get all of the user's reminders in one query, grouped by user-medicine combination
+    reminders_by_medicine = load_reminders_by_medicine(current_user.id)
+    
     for user_medicine in user_medicines:
-        # Get the reminders for this user-medicine combination
-        reminders = MedicationReminder.query.filter_by(user_medicine_id=user_medicine.id).all()
-        
-        for reminder in reminders:
+        for reminder in reminders_by_medicine.get(user_medicine.id, []):
             # Append the relevant information to the response_data list
             response_data.append({
                 'id': user_medicine.medicine_id,  # This is the medicine ID, tied to the user-medicine record
-                'name': user_medicine.medicine.name,  # Accessing the medicine's name
-                'status': reminder.status  # The status of the reminder
+                'name': catalogue.name(user_medicine.medicine_id),  # The medicine's name, from the catalogue cache
+                'status': reminder['status']  # The status of the reminder
             })
     
     return jsonify(response_data)
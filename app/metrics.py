@@ -0,0 +1,284 @@
+"""
+metrics.py
+----------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/metrics.py
+
+Purpose:    Records per-endpoint request metrics and exposes them in the Prometheus text
+            exposition format at /metrics. For every request we record latency, time spent in
+            the database, the number of SQL statements issued and the response size, as
+            histograms labelled by blueprint, endpoint and method, plus a request counter by
+            status code. A sudden jump in an endpoint's query count is how N+1 regressions show up.
+
+            Metrics are off unless METRICS_ENABLED is set. /metrics is only served to addresses
+            listed in METRICS_ALLOWED_IPS (the client's own address once ProxyFix has applied
+            the proxy's X-Forwarded-For, see PROXY_FIX_HOPS), and, if METRICS_TOKEN is set, only
+            to requests carrying it as a bearer token, so it can be scraped by a collector
+            without being exposed publicly.
+"""
+
+import bisect
+import hmac
+import threading
+import time
+from flask import g, request, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram: cumulative bucket counts plus a running sum and count,
+    tracked separately for each combination of label values.
+
+    Attributes:
+        name (str): The metric name.
+        help (str): The metric's help text.
+        labels (tuple): The label names.
+        buckets (tuple): Upper bounds of the buckets, in increasing order.
+
+    Methods:
+        observe(label_values, value): Records one observation.
+        render(): Returns the metric in Prometheus text format.
+    """
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        # Count the observation in the first bucket it fits; render() accumulates
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{_format_value(bound)}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """
+    A Prometheus counter tracked separately for each combination of label values.
+
+    Methods:
+        inc(label_values, amount): Increments the counter.
+        render(): Returns the metric in Prometheus text format.
+    """
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}{{{labels}}} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class RequestMetrics:
+    """
+    The set of request metrics recorded for the application.
+
+    Methods:
+        record(blueprint, endpoint, method, status, duration, db_time, queries, size):
+            Records one finished request.
+        render(): Returns every metric in Prometheus text format.
+    """
+
+    def __init__(self):
+        labels = ("blueprint", "endpoint", "method")
+        self.requests = Counter(
+            "dosetracker_requests_total",
+            "Requests handled, by endpoint and status.",
+            labels + ("status",),
+        )
+        self.latency = Histogram(
+            "dosetracker_request_duration_seconds",
+            "Request latency in seconds.",
+            labels,
+            LATENCY_BUCKETS,
+        )
+        self.db_time = Histogram(
+            "dosetracker_request_db_seconds",
+            "Time spent executing SQL per request, in seconds.",
+            labels,
+            LATENCY_BUCKETS,
+        )
+        self.queries = Histogram(
+            "dosetracker_request_queries",
+            "SQL statements executed per request.",
+            labels,
+            QUERY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "dosetracker_response_size_bytes",
+            "Response body size in bytes (buffered responses only).",
+            labels,
+            SIZE_BUCKETS,
+        )
+        self._lock = threading.Lock()
+
+    def record(self, blueprint, endpoint, method, status, duration, db_time, queries, size):
+        label_values = (blueprint, endpoint, method)
+        with self._lock:
+            self.requests.inc(label_values + (str(status),))
+            self.latency.observe(label_values, duration)
+            self.db_time.observe(label_values, db_time)
+            self.queries.observe(label_values, queries)
+            if size is not None:
+                self.response_size.observe(label_values, size)
+
+    def render(self):
+        with self._lock:
+            metrics = (self.requests, self.latency, self.db_time, self.queries, self.response_size)
+            return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def _format_labels(names, values):
+    return ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def init_metrics(app):
+    """
+    Name:       init_metrics(app)
+    Purpose:    Registers the request hooks and SQLAlchemy listeners that collect request
+                metrics, and the /metrics route that exposes them. Does nothing unless
+                METRICS_ENABLED is set.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    metrics = RequestMetrics()
+    app.extensions["request_metrics"] = metrics
+
+    @app.before_request
+    def start_request_metrics():
+        g._metrics = {"started": time.perf_counter(), "queries": 0, "db_time": 0.0}
+
+    @app.after_request
+    def record_request_metrics(response):
+        stats = g.pop("_metrics", None)
+        if stats is None or request.endpoint == "metrics":
+            return response
+
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics.record(
+            request.blueprint or "",
+            request.endpoint or "unmatched",
+            request.method,
+            response.status_code,
+            time.perf_counter() - stats["started"],
+            stats["db_time"],
+            stats["queries"],
+            size,
+        )
+        return response
+
+    def metrics_view():
+        if request.remote_addr not in app.config["METRICS_ALLOWED_IPS"]:
+            abort(404)
+        token = app.config["METRICS_TOKEN"]
+        if token and not hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            abort(404)
+        return metrics.render(), 200, {"Content-Type": PROMETHEUS_CONTENT_TYPE}
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _current_stats():
+    try:
+        return g.get("_metrics")
+    except RuntimeError:
+        return None  # Outside an application context (e.g. a scheduler job)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault("_metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    starts = conn.info.get("_metrics_query_start")
+    if stats is None or not starts:
+        return
+    stats["db_time"] += time.perf_counter() - starts.pop()
+    stats["queries"] += 1
+
+
+def parse_metrics(text):
+    """
+    Name:       parse_metrics(text)
+    Purpose:    Parses Prometheus text format into a dict of samples. Acts as a minimal local
+                collector for checking /metrics output in tests.
+    Parameters: text (str): The scraped metrics text.
+    Returns:    dict: Maps (metric name, frozenset of (label, value) pairs) to the sample value.
+    """
+
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name, _, label_text = series.partition("{")
+        labels = []
+        for pair in label_text.rstrip("}").split('",'):
+            if "=" in pair:
+                key, _, raw = pair.partition("=")
+                labels.append((key, raw.strip('"')))
+        samples[(name, frozenset(labels))] = float(value)
+    return samples
@@ -7,11 +7,25 @@ Email:      dave@djrogers.net.au
 Path:       /path/to/project/app/models.py
 
 Purpose:    Contains the database models for the Flask application, including User, Medicine, UserMedicine, 
-            and MedicationReminder models, and their relationships.
+            MedicationReminder, DoseHistory, PushSubscription and ReportJob models, and their
+            relationships.
 """
 
 
-from app.extensions import db, bcrypt
+import secrets
+from app.extensions import db
+from app.passwords import hash_password, check_password
+
+
+def new_feed_secret():
+    """
+    Name:       new_feed_secret()
+    Purpose:    Generates a random secret for a user's calendar feed token.
+    Parameters: None
+    Returns:    str: The secret.
+    """
+
+    return secrets.token_urlsafe(16)
 
 
 class User(db.Model):
@@ -28,13 +42,27 @@ class User(db.Model):
         email (str): The user's email address. This is unique and used for authentication.
         password_hash (str): The hashed password of the user for secure authentication.
         phone_number (str): The user's phone number. This is unique and optional.
-        receive_sms_reminders (bool): Indicates whether the user wants to receive SMS reminders.
+        receive_sms_reminders (bool): Indicates whether the user wants to receive reminders at all.
+        reminder_channels (str): Comma-separated channels reminders are sent on ('sms', 'email',
+                                 'push').
+        data_version (int): Counter bumped whenever the user's medicines or reminders change,
+                            including a reminder's status. Used as part of the key for cached
+                            pages.
+        schedule_version (int): Counter bumped only when the user's medicines, reminders or
+                                schedules are edited - not when reminders are sent or reset. Used
+                                for cached reports and calendar feeds, which don't show status.
+        schedule_changed_at (datetime): When schedule_version was last bumped, so the reminder
+                                        dispatcher can find recently changed users with an
+                                        index range scan.
+        feed_secret (str): Random value carried in the user's calendar feed token. Replacing it
+                           revokes every feed URL handed out before.
         created_at (datetime): Timestamp of when the user was created.
         updated_at (datetime): Timestamp of when the user was last updated.
 
     Relationships:
         user_medicines (list): A list of UserMedicine records representing medications associated with the user.
         reminders (list): A list of MedicationReminder records associated with the user, used for scheduling reminders.
+        push_subscriptions (list): The browsers subscribed to the user's push notifications.
 
     Methods:
         is_active(): Returns True, indicating the user is active.
@@ -43,6 +71,8 @@ class User(db.Model):
         get_id(): Returns the string representation of the user's ID.
         check_password(password): Checks if the provided password matches the user's stored password hash.
         set_password(password): Sets the user's password after hashing it.
+        get_reminder_channels(): Returns reminder_channels as a list.
+        bump_data_version(user_ids, status_only): Increments data_version (and schedule_version) for the given users (or all users).
         __repr__(): Returns a string representation of the User object, primarily the user's email.
     """
 
@@ -53,6 +83,13 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     phone_number = db.Column(db.String(15), unique=True, nullable=True)
     receive_sms_reminders = db.Column(db.Boolean, default=True)
+    reminder_channels = db.Column(
+        db.String(50), nullable=False, default="sms", server_default="sms"
+    )
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    schedule_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    schedule_changed_at = db.Column(db.DateTime, nullable=True, index=True)
+    feed_secret = db.Column(db.String(32), nullable=False, default=new_feed_secret)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
@@ -64,6 +101,9 @@ class User(db.Model):
     reminders = db.relationship(
         "MedicationReminder", backref="user", cascade="all, delete-orphan"
     )
+    push_subscriptions = db.relationship(
+        "PushSubscription", backref="user", cascade="all, delete-orphan"
+    )
 
     def is_active(self):
         return True
@@ -78,10 +118,39 @@ class User(db.Model):
         return str(self.id)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return check_password(self.password_hash, password)
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode("utf-8")
+        self.password_hash = hash_password(password)
+
+    def get_reminder_channels(self):
+        return [channel for channel in (self.reminder_channels or "").split(",") if channel]
+
+    @classmethod
+    def bump_data_version(cls, user_ids=None, status_only=False):
+        """
+        Increments data_version (and schedule_version, stamping schedule_changed_at) for the
+        given users in the current transaction, invalidating any cached pages, reports or feeds
+        built from their data. The caller is responsible for committing.
+
+        Parameters:
+            user_ids (iterable or Select): User IDs (or a select of user IDs) to bump.
+                                           None bumps every user.
+            status_only (bool): Only reminder statuses changed (a reminder was sent, or the
+                                daily reset), so schedule_version is left alone.
+        """
+        query = db.session.query(cls)
+        if user_ids is not None:
+            if not isinstance(user_ids, db.Select):
+                user_ids = list(user_ids)
+                if not user_ids:
+                    return
+            query = query.filter(cls.id.in_(user_ids))
+        values = {cls.data_version: cls.data_version + 1}
+        if not status_only:
+            values[cls.schedule_version] = cls.schedule_version + 1
+            values[cls.schedule_changed_at] = db.func.now()
+        query.update(values, synchronize_session=False)
 
     def __repr__(self):
         return f"<User {self.email}>"
@@ -144,6 +213,8 @@ class UserMedicine(db.Model):
         dosage (str): The dosage amount for the user to take.
         frequency (str): The frequency at which the user should take the medicine (e.g., daily, twice a day).
         notes (str): Any additional notes or instructions related to the user’s medicine regimen.
+        schedule (str): The structured schedule, as JSON rules (see schedules.py), when frequency
+                        is "Custom Schedule"; None for the fixed frequencies.
         created_at (datetime): Timestamp of when the user-medicine association was created.
         updated_at (datetime): Timestamp of when the user-medicine association was last updated.
 
@@ -162,6 +233,7 @@ class UserMedicine(db.Model):
     dosage = db.Column(db.String(255), nullable=False)
     frequency = db.Column(db.String(255), nullable=False)
     notes = db.Column(db.Text)
+    schedule = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
@@ -240,3 +312,141 @@ class MedicationReminder(db.Model):
 
     def __repr__(self):
         return f"<MedicationReminder User: {self.user_id}, Medicine: {self.user_medicine_id}, Time: {self.reminder_time}, Status: {self.status}>"
+
+
+class DoseHistory(db.Model):
+    """
+    Represents one reminder that was sent to a user - the user's dose history.
+
+    A row is written each time a reminder is delivered. The medicine name, reminder time and
+    message are copied onto the row so the history still reads correctly after the medicine
+    or reminder is edited or deleted.
+
+    Attributes:
+        id (int): The unique identifier for the history entry.
+        user_id (int): The foreign key reference to the User the reminder was sent to.
+        user_medicine_id (int): The user-medicine association the reminder was for, or None if it
+                                has since been deleted.
+        medicine_name (str): The medicine's name when the reminder was sent.
+        reminder_time (time): The scheduled time of the reminder.
+        reminder_message (str): The reminder message that was sent.
+        channel (str): How the reminder was delivered: 'sms', 'email' or 'push'.
+        sent_at (datetime): When the reminder was sent.
+
+    Indexes:
+        idx_dose_history_user_sent (Index): On (user_id, sent_at), for reading a user's history
+                                            in order.
+
+    Methods:
+        __repr__(): Returns a string representation of the DoseHistory object.
+    """
+
+    __tablename__ = "dose_history"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    user_medicine_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user_medicines.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    medicine_name = db.Column(db.String(255), nullable=False)
+    reminder_time = db.Column(db.Time, nullable=False)
+    reminder_message = db.Column(db.String(255), nullable=True)
+    channel = db.Column(db.String(20), nullable=False, default="sms")
+    sent_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (db.Index("idx_dose_history_user_sent", "user_id", "sent_at"),)
+
+    def __repr__(self):
+        return f"<DoseHistory User: {self.user_id}, Medicine: {self.medicine_name}, Sent: {self.sent_at}>"
+
+
+class PushSubscription(db.Model):
+    """
+    Represents a browser subscribed to a user's Web Push reminders.
+
+    The endpoint and keys are the ones the browser's PushManager returns when the user turns
+    on browser notifications; the push service rejects the endpoint once the subscription
+    expires, and the row is then deleted.
+
+    Attributes:
+        id (int): The unique identifier for the subscription.
+        user_id (int): The foreign key reference to the User who subscribed.
+        endpoint (str): The push service URL for this browser. Unique.
+        p256dh (str): The browser's public key for encrypting messages.
+        auth (str): The browser's authentication secret.
+        created_at (datetime): When the browser subscribed.
+
+    Methods:
+        subscription_info(): The subscription in the form pywebpush takes.
+        __repr__(): Returns a string representation of the PushSubscription object.
+    """
+
+    __tablename__ = "push_subscriptions"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    endpoint = db.Column(db.String(500), unique=True, nullable=False)
+    p256dh = db.Column(db.String(255), nullable=False)
+    auth = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def subscription_info(self):
+        return {"endpoint": self.endpoint, "keys": {"p256dh": self.p256dh, "auth": self.auth}}
+
+    def __repr__(self):
+        return f"<PushSubscription User: {self.user_id}, Endpoint: {self.endpoint[:40]}>"
+
+
+class ReportJob(db.Model):
+    """
+    Represents a background job that renders a user's PDF report and emails it (see
+    reportjobs.py).
+
+    Job state is kept in the database rather than in the process that ran the job, so any web
+    worker can answer a status poll and finished jobs survive a restart.
+
+    Attributes:
+        id (str): The job id handed to the client.
+        user_id (int): The foreign key reference to the User whose report it is.
+        recipient (str): The address the report is emailed to.
+        status (str): queued, rendering, sending, sent or failed.
+        error (str): Why the job failed, or None.
+        created_at (datetime): When the job was queued.
+        updated_at (datetime): When the job last changed state.
+
+    Methods:
+        to_dict(): The job's state as a plain dict.
+        __repr__(): Returns a string representation of the ReportJob object.
+    """
+
+    __tablename__ = "report_jobs"
+
+    id = db.Column(db.String(24), primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    recipient = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "recipient": self.recipient,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created_at,
+            "updated": self.updated_at,
+        }
+
+    def __repr__(self):
+        return f"<ReportJob {self.id} User: {self.user_id}, Status: {self.status}>"
@@ -0,0 +1,324 @@
+"""
+notifiers.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/notifiers.py
+
+Purpose:    Delivers medication reminders over the channels each user picks on the user admin
+            page: SMS (Twilio), email (SMTP, through Flask-Mail) and Web Push notifications to
+            the browsers the user has subscribed.
+
+            Every channel is a Notifier with its own bounded pool of worker threads and its own
+            connections: Twilio requests share one pooled HTTPS session, each email worker keeps
+            its SMTP connection open between reminders, and push messages share one HTTPS
+            session. The pool size is the channel's concurrency limit (NOTIFY_SMS_CONCURRENCY,
+            NOTIFY_EMAIL_CONCURRENCY, NOTIFY_PUSH_CONCURRENCY), so a busy minute can't open more
+            connections to a provider than it allows. notify() hands one user's reminder to all
+            of the user's channels at once and waits for them together, so a slot costs the
+            slowest channel's latency rather than the sum of them.
+
+            A channel is only enabled when it is configured: SMS needs the Twilio credentials,
+            and push needs the VAPID key pair (VAPID_PUBLIC_KEY, VAPID_PRIVATE_KEY) and the
+            optional pywebpush package. Push subscriptions the push service reports as expired
+            are deleted.
+"""
+
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask_mail import Message
+from app.extensions import db
+
+
+CHANNEL_CHOICES = [
+    ("sms", "SMS"),
+    ("email", "Email"),
+    ("push", "Browser notifications"),
+]
+
+# Seconds a push service keeps trying to deliver a reminder to an offline browser
+PUSH_TTL = 3600
+
+# Everything a notifier needs to reach a user, copied out of the database session so it can
+# be handed to the channels' worker threads
+Recipient = namedtuple("Recipient", "user_id phone_number email push_subscriptions")
+
+
+class Notifier:
+    """
+    A delivery channel with its own bounded pool of worker threads.
+
+    Attributes:
+        channel (str): The channel's name, as stored in User.reminder_channels and
+                       DoseHistory.channel.
+        concurrency (int): Most messages the channel sends at once.
+        sent (int): Number of reminders delivered.
+        failed (int): Number of reminders that failed.
+
+    Methods:
+        can_reach(recipient): Whether the recipient has an address on this channel.
+        submit(recipient, subject, body): Sends a reminder on the channel's pool.
+        send(recipient, subject, body): Sends a reminder; implemented by each channel.
+        stats(): The channel's counters.
+    """
+
+    channel = None
+
+    def __init__(self, app, concurrency):
+        self.app = app
+        self.concurrency = concurrency
+        self.sent = 0
+        self.failed = 0
+        self._counter_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix=f"notify-{self.channel}"
+        )
+
+    def can_reach(self, recipient):
+        raise NotImplementedError
+
+    def send(self, recipient, subject, body):
+        raise NotImplementedError
+
+    def submit(self, recipient, subject, body):
+        """
+        Name:       submit(recipient, subject, body)
+        Purpose:    Queues a reminder for one of the channel's workers.
+        Parameters: recipient (Recipient): Who to send it to.
+                    subject (str): The reminder's title.
+                    body (str): The reminder text.
+        Returns:    Future: Resolves when the reminder is sent, or raises its error.
+        """
+
+        return self._executor.submit(self._deliver, recipient, subject, body)
+
+    def _deliver(self, recipient, subject, body):
+        try:
+            with self.app.app_context():
+                self.send(recipient, subject, body)
+        except Exception:
+            with self._counter_lock:
+                self.failed += 1
+            raise
+        with self._counter_lock:
+            self.sent += 1
+
+    def stats(self):
+        with self._counter_lock:
+            return {"concurrency": self.concurrency, "sent": self.sent, "failed": self.failed}
+
+
+class SmsNotifier(Notifier):
+    """Sends reminders as SMS through Twilio, over one pooled HTTPS session."""
+
+    channel = "sms"
+
+    def __init__(self, app, concurrency):
+        super().__init__(app, concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def can_reach(self, recipient):
+        return bool(recipient.phone_number)
+
+    def _get_client(self):
+        # Twilio is only imported by the process that sends reminders
+        with self._client_lock:
+            if self._client is None:
+                from requests.adapters import HTTPAdapter
+                from twilio.http.http_client import TwilioHttpClient
+                from twilio.rest import Client
+
+                http_client = TwilioHttpClient(
+                    pool_connections=True, timeout=self.app.config["NOTIFY_TIMEOUT"]
+                )
+                http_client.session.mount(
+                    "https://", HTTPAdapter(pool_maxsize=self.concurrency)
+                )
+                self._client = Client(
+                    self.app.config["TWILIO_ACCOUNT_SID"],
+                    self.app.config["TWILIO_AUTH_TOKEN"],
+                    http_client=http_client,
+                )
+            return self._client
+
+    def send(self, recipient, subject, body):
+        # Australian mobile numbers: drop the leading '0' and add the +61 country code
+        phone_number = recipient.phone_number
+        if phone_number.startswith("0"):
+            phone_number = phone_number[1:]
+        self._get_client().messages.create(
+            body=f"{subject}: {body}",
+            from_=self.app.config["TWILIO_PHONE_NUMBER"],
+            to=f"+61 {phone_number}",
+        )
+
+
+class EmailNotifier(Notifier):
+    """
+    Sends reminders by email. Each worker keeps its own SMTP connection open between reminders
+    and re-opens it after MAIL_QUEUE_IDLE_TIMEOUT seconds without mail.
+    """
+
+    channel = "email"
+
+    def __init__(self, app, concurrency, mail):
+        super().__init__(app, concurrency)
+        self.mail = mail
+        self._local = threading.local()
+
+    def can_reach(self, recipient):
+        return bool(recipient.email)
+
+    def send(self, recipient, subject, body):
+        message = Message(subject, recipients=[recipient.email], body=body)
+        connection = getattr(self._local, "connection", None)
+        idle_timeout = self.app.config["MAIL_QUEUE_IDLE_TIMEOUT"]
+        if connection is not None and time.monotonic() - self._local.used > idle_timeout:
+            self._close_connection()
+            connection = None
+
+        try:
+            self._connection().send(message)
+        except Exception:
+            self._close_connection()
+            if connection is None:
+                raise
+            # The server may have dropped a connection kept open from an earlier reminder
+            self._connection().send(message)
+        self._local.used = time.monotonic()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.mail.connect()
+            connection.__enter__()
+            self._local.connection = connection
+        return connection
+
+    def _close_connection(self):
+        connection = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+class WebPushNotifier(Notifier):
+    """Sends reminders as Web Push notifications to every browser the user has subscribed."""
+
+    channel = "push"
+
+    def __init__(self, app, concurrency):
+        super().__init__(app, concurrency)
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+
+    def can_reach(self, recipient):
+        return bool(recipient.push_subscriptions)
+
+    def send(self, recipient, subject, body):
+        from pywebpush import webpush, WebPushException
+        from app.models import PushSubscription
+
+        payload = json.dumps({"title": subject, "body": body})
+        delivered = 0
+        expired = []
+        error = None
+        for subscription in recipient.push_subscriptions:
+            try:
+                webpush(
+                    subscription,
+                    data=payload,
+                    vapid_private_key=self.app.config["VAPID_PRIVATE_KEY"],
+                    # pywebpush adds its own claims to this dict, so pass a fresh one each time
+                    vapid_claims={"sub": self.app.config["VAPID_CLAIM_SUBJECT"]},
+                    ttl=PUSH_TTL,
+                    timeout=self.app.config["NOTIFY_TIMEOUT"],
+                    requests_session=self._session,
+                )
+                delivered += 1
+            except WebPushException as e:
+                if e.response is not None and e.response.status_code in (404, 410):
+                    expired.append(subscription["endpoint"])
+                else:
+                    error = e
+
+        if expired:
+            PushSubscription.query.filter(PushSubscription.endpoint.in_(expired)).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+        if not delivered:
+            raise error or RuntimeError("All of the user's push subscriptions have expired")
+
+
+def init_notifiers(app, mail):
+    """
+    Name:       init_notifiers(app, mail)
+    Purpose:    Creates a notifier for each configured channel and stores them, keyed by
+                channel, in app.extensions["notifiers"]. Worker threads start on first use.
+    Parameters: app (Flask): The Flask application instance.
+                mail (Mail): The Flask-Mail instance used for email reminders.
+    Returns:    dict: The notifiers.
+    """
+
+    config = app.config
+    notifiers = {
+        "email": EmailNotifier(app, config["NOTIFY_EMAIL_CONCURRENCY"], mail),
+    }
+    if config["TWILIO_ACCOUNT_SID"] and config["TWILIO_AUTH_TOKEN"]:
+        notifiers["sms"] = SmsNotifier(app, config["NOTIFY_SMS_CONCURRENCY"])
+    if config["VAPID_PRIVATE_KEY"] and config["VAPID_PUBLIC_KEY"]:
+        try:
+            import pywebpush  # noqa: F401
+        except ImportError:
+            print("pywebpush is not installed; browser notifications are disabled.")
+        else:
+            notifiers["push"] = WebPushNotifier(app, config["NOTIFY_PUSH_CONCURRENCY"])
+
+    app.extensions["notifiers"] = notifiers
+    return notifiers
+
+
+def notify(notifiers, recipient, channels, subject, body, timeout):
+    """
+    Name:       notify(notifiers, recipient, channels, subject, body, timeout)
+    Purpose:    Sends one reminder to a user on all of their channels at once, each on its own
+                channel's pool, and waits for them together. Channels that aren't configured,
+                or that the user has no address on, are skipped.
+    Parameters: notifiers (dict): The app's notifiers, from init_notifiers().
+                recipient (Recipient): Who to send it to.
+                channels (list): The user's chosen channels.
+                subject (str): The reminder's title.
+                body (str): The reminder text.
+                timeout (float): Seconds to wait for the slowest channel.
+    Returns:    list: The channels the reminder was delivered on.
+    """
+
+    futures = {}
+    for channel in channels:
+        notifier = notifiers.get(channel)
+        if notifier is not None and notifier.can_reach(recipient):
+            futures[notifier.submit(recipient, subject, body)] = channel
+
+    done, not_done = wait(futures, timeout=timeout)
+    delivered = []
+    for future in done:
+        try:
+            future.result()
+            delivered.append(futures[future])
+        except Exception as e:
+            print(f"Error sending {futures[future]} reminder to user {recipient.user_id}: {e}")
+    for future in not_done:
+        print(f"Timed out sending {futures[future]} reminder to user {recipient.user_id}")
+    return sorted(delivered)
@@ -0,0 +1,155 @@
+"""
+passwords.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/passwords.py
+
+Purpose:    Runs bcrypt password hashing and verification in a bounded pool of worker processes,
+            so a burst of logins doesn't tie up every web worker thread (or the GIL) for hundreds
+            of milliseconds per attempt. When more than PASSWORD_HASH_MAX_PENDING operations are
+            already queued, new requests are rejected immediately with PasswordHasherBusy rather
+            than piling up behind the backlog.
+
+            Setting PASSWORD_HASH_WORKERS to 0 runs bcrypt inline on the calling thread, which
+            is handy for development and tests.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from flask import current_app
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing pool already has its maximum number of pending jobs."""
+
+
+_pool = None
+_pending = None
+_pool_lock = threading.Lock()
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    except ValueError:
+        return False  # Malformed hash
+
+
+def _get_pool():
+    """
+    Name:       _get_pool()
+    Purpose:    Returns the shared process pool and the semaphore that bounds its queue, creating
+                them on first use. Workers are forked (spawned workers would re-import run.py and
+                start a second app and scheduler), so init_password_pool() starts them before
+                the scheduler's threads exist.
+    Parameters: None
+    Returns:    tuple: (ProcessPoolExecutor, BoundedSemaphore)
+    """
+    global _pool, _pending
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=current_app.config["PASSWORD_HASH_WORKERS"],
+                mp_context=multiprocessing.get_context("fork"),
+            )
+            _pending = threading.BoundedSemaphore(
+                current_app.config["PASSWORD_HASH_MAX_PENDING"]
+            )
+        return _pool, _pending
+
+
+def init_password_pool(app):
+    """
+    Name:       init_password_pool(app)
+    Purpose:    Creates the password hashing pool and starts its worker processes. Called from
+                create_app() before the scheduler is started.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    if app.config["PASSWORD_HASH_WORKERS"] <= 0:
+        return
+
+    with app.app_context():
+        pool, _ = _get_pool()
+    # A forking pool launches all of its workers on the first submit
+    pool.submit(int).result()
+
+
+def _run(func, *args):
+    """
+    Name:       _run(func, *args)
+    Purpose:    Runs a bcrypt operation in the pool and waits for its result, or inline when the
+                pool is disabled.
+    Parameters: func (callable): _hash or _check.
+                *args: Arguments passed to func.
+    Returns:    The result of func.
+    Raises:     PasswordHasherBusy: If the pool's queue is full or the operation times out.
+    """
+
+    if current_app.config["PASSWORD_HASH_WORKERS"] <= 0:
+        return func(*args)
+
+    pool, pending = _get_pool()
+    if not pending.acquire(blocking=False):
+        raise PasswordHasherBusy("Too many password operations in progress.")
+
+    try:
+        future = pool.submit(func, *args)
+    except Exception:
+        pending.release()
+        raise
+    future.add_done_callback(lambda _: pending.release())
+
+    try:
+        return future.result(timeout=current_app.config["PASSWORD_HASH_TIMEOUT"])
+    except FutureTimeoutError:
+        raise PasswordHasherBusy("Timed out waiting for a password worker.")
+
+
+def hash_password(password):
+    """
+    Name:       hash_password(password)
+    Purpose:    Hashes a password with bcrypt at the configured cost (BCRYPT_LOG_ROUNDS).
+    Parameters: password (str): The plain-text password.
+    Returns:    str: The bcrypt hash.
+    Raises:     PasswordHasherBusy: If the pool's queue is full or the operation times out.
+    """
+    return _run(_hash, password, current_app.config["BCRYPT_LOG_ROUNDS"])
+
+
+def check_password(password_hash, password):
+    """
+    Name:       check_password(password_hash, password)
+    Purpose:    Verifies a plain-text password against a stored bcrypt hash.
+    Parameters: password_hash (str): The stored bcrypt hash.
+                password (str): The plain-text password to check.
+    Returns:    bool: True if the password matches.
+    Raises:     PasswordHasherBusy: If the pool's queue is full or the operation times out.
+    """
+    return _run(_check, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """
+    Name:       needs_rehash(password_hash)
+    Purpose:    Checks whether a stored hash was made with a different bcrypt cost than the one
+                currently configured, so it can be upgraded after a successful login.
+    Parameters: password_hash (str): The stored bcrypt hash ('$2b$<cost>$...').
+    Returns:    bool: True if the hash should be regenerated.
+    """
+
+    try:
+        cost = int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return True
+    return cost != current_app.config["BCRYPT_LOG_ROUNDS"]
@@ -0,0 +1,192 @@
+"""
+pdfreport.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/pdfreport.py
+
+Purpose:    Renders the PDF medicines report with ReportLab's Platypus layout engine. The title
+            band and logo are drawn by a page template on the first page, and the medicines go
+            into a LongTable whose header row repeats on every page, so pagination is handled by
+            the table rather than by hand.
+
+            The logo is decoded and scaled down to the size it is drawn at once per process and
+            reused by every report, instead of re-reading and re-compressing the full-size PNG for
+            each document. Rows have fixed heights and column widths, so the table never has to
+            measure its content and render time stays proportional to the number of pages.
+
+            render_pdf() only takes plain data, so it can run without a database session or
+            request context (e.g. in the batch report worker processes).
+"""
+
+import threading
+from io import BytesIO
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import (
+    BaseDocTemplate,
+    Frame,
+    LongTable,
+    NextPageTemplate,
+    PageTemplate,
+    TableStyle,
+)
+from config import Config
+
+
+MAUVE = colors.HexColor("#9b4d96")
+DARK_GREY = colors.HexColor("#333333")
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+TITLE_HEIGHT = 720
+# The table starts below the subtitle on the first page, and near the top of later pages
+FIRST_PAGE_TABLE_TOP = 690
+TOP_MARGIN = 40
+LOGO_WIDTH, LOGO_HEIGHT = 55, 50
+
+# Scale the logo to this multiple of its drawn size in points (about 216 dpi)
+LOGO_RESOLUTION = 3
+
+COLUMN_WIDTHS = (120, 100, 100, 220)
+ROW_HEIGHT = 20
+HEADER = ("Name", "Dosage", "Frequency", "Notes")
+
+TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), MAUVE),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 12),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), 10),
+        ("TEXTCOLOR", (0, 1), (-1, -1), colors.black),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LEFTPADDING", (0, 0), (-1, -1), 0),
+    ]
+)
+
+_logos = {}
+_logos_lock = threading.Lock()
+
+
+def default_logo_path():
+    return Config.DT_SERVER_LOGO_PATH + "app/static/img/logo.png"
+
+
+def get_logo(logo_path):
+    """
+    Name:       get_logo(logo_path)
+    Purpose:    Returns the logo as an ImageReader scaled to the size it is drawn at, decoding
+                the file only the first time a path is requested in this process.
+    Parameters: logo_path (str): Path to the logo image.
+    Returns:    ImageReader: The decoded, resized logo.
+    """
+
+    with _logos_lock:
+        logo = _logos.get(logo_path)
+        if logo is None:
+            from PIL import Image
+
+            with Image.open(logo_path) as image:
+                image = image.convert("RGB")
+                image.thumbnail(
+                    (LOGO_WIDTH * LOGO_RESOLUTION, LOGO_HEIGHT * LOGO_RESOLUTION),
+                    Image.LANCZOS,
+                )
+            logo = _logos[logo_path] = ImageReader(image)
+        return logo
+
+
+class ReportDocTemplate(BaseDocTemplate):
+    """
+    Document template for the medicines report: a "first" page whose frame starts below the
+    title band, logo and subtitle, and "later" pages whose frame fills the page from the top
+    margin, so they hold more rows.
+
+    Attributes:
+        user_email (str): Shown in the subtitle on the first page.
+        logo (ImageReader): The logo drawn in the title band.
+    """
+
+    def __init__(self, buffer, user_email, logo):
+        super().__init__(
+            buffer,
+            pagesize=letter,
+            leftMargin=30,
+            rightMargin=PAGE_WIDTH - 570,
+            topMargin=TOP_MARGIN,
+            bottomMargin=80,
+        )
+        self.user_email = user_email
+        self.logo = logo
+
+        first_height = FIRST_PAGE_TABLE_TOP - self.bottomMargin
+        first_frame = Frame(
+            self.leftMargin, self.bottomMargin, self.width, first_height,
+            leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0, id="first",
+        )
+        later_frame = Frame(
+            self.leftMargin, self.bottomMargin, self.width, self.height,
+            leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0, id="later",
+        )
+        self.addPageTemplates(
+            [
+                PageTemplate(id="first", frames=[first_frame], onPage=self.draw_title),
+                PageTemplate(id="later", frames=[later_frame]),
+            ]
+        )
+
+    def draw_title(self, canvas, doc):
+        canvas.saveState()
+
+        # Title background (mauve) with the logo and white title text
+        canvas.setFillColor(MAUVE)
+        canvas.rect(0, TITLE_HEIGHT, 600, 80, fill=1, stroke=0)
+        canvas.drawImage(self.logo, 30, TITLE_HEIGHT + 10, width=LOGO_WIDTH, height=LOGO_HEIGHT)
+        canvas.setFillColor(colors.white)
+        canvas.setFont("Helvetica-Bold", 18)
+        canvas.drawString(100, TITLE_HEIGHT + 25, "Dose Tracker")
+
+        # Subtitle: User's Email (Dark grey)
+        canvas.setFillColor(DARK_GREY)
+        canvas.setFont("Helvetica", 12)
+        canvas.drawString(100, TITLE_HEIGHT - 20, f"Report for: {self.user_email}")
+
+        canvas.restoreState()
+
+
+def render_pdf(user_email, medicines, logo_path=None):
+    """
+    Name:       render_pdf(user_email, medicines, logo_path)
+    Purpose:    Renders the PDF medicines report from already-loaded data.
+    Parameters: user_email (str): The email address shown in the report's subtitle.
+                medicines (list): Row dicts with name, dosage, frequency and notes keys.
+                logo_path (str): Path to the logo image. Defaults to the one under
+                                 DT_SERVER_LOGO_PATH.
+    Returns:    pdf_data (bytes): The generated PDF content as bytes.
+    """
+
+    logo = get_logo(logo_path or default_logo_path())
+
+    rows = [HEADER]
+    rows.extend(
+        (m["name"], m["dosage"], m["frequency"], m["notes"]) for m in medicines
+    )
+    table = LongTable(
+        rows,
+        colWidths=COLUMN_WIDTHS,
+        rowHeights=ROW_HEIGHT,
+        repeatRows=1,
+        hAlign="LEFT",
+    )
+    table.setStyle(TABLE_STYLE)
+
+    buffer = BytesIO()
+    doc = ReportDocTemplate(buffer, user_email, logo)
+    doc.build([NextPageTemplate("later"), table])
+
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
@@ -0,0 +1,249 @@
+"""
+profiling.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/profiling.py
+
+Purpose:    Opt-in per-request profiling. When PROFILE_ENABLED is set, a request is profiled if it
+            carries a valid signed X-DoseTracker-Profile header (see `flask profile-token`) or is
+            picked by PROFILE_SAMPLE_RATE. Profiled requests run under cProfile and record every
+            SQL statement they issue; the results are written to PROFILE_DIR, which keeps only the
+            newest PROFILE_MAX_FILES profiles. The profiles can be browsed at /_internal/profiles.
+
+            With PROFILE_ENABLED off, nothing is registered and requests pay no overhead at all.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import time
+from datetime import datetime
+import click
+from flask import g, request
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+PROFILE_HEADER = "X-DoseTracker-Profile"
+PROFILE_TOKEN_SALT = "request-profile"
+
+# Don't let one pathological request write an unbounded SQL log
+MAX_RECORDED_STATEMENTS = 500
+
+# Sort orders a profile report can be shown in (?sort= on /_internal/profiles/<name>)
+SORT_KEYS = frozenset(pstats.Stats.sort_arg_dict_default)
+
+
+def init_profiling(app):
+    """
+    Name:       init_profiling(app)
+    Purpose:    Registers the request hooks, SQL listeners and `flask profile-token` command used
+                for request profiling. Does nothing unless PROFILE_ENABLED is set.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    if not app.config["PROFILE_ENABLED"]:
+        return
+
+    profile_dir = get_profile_dir(app)
+    os.makedirs(profile_dir, exist_ok=True)
+    serializer = URLSafeTimedSerializer(app.config["SECRET_KEY"], salt=PROFILE_TOKEN_SALT)
+
+    def wants_profile():
+        token = request.headers.get(PROFILE_HEADER)
+        if token:
+            try:
+                serializer.loads(token, max_age=app.config["PROFILE_TOKEN_MAX_AGE"])
+                return True
+            except BadSignature:
+                pass
+        rate = app.config["PROFILE_SAMPLE_RATE"]
+        return rate > 0 and random.random() < rate
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in (None, "static") or not wants_profile():
+            return
+        profiler = cProfile.Profile()
+        g._profile = {
+            "profiler": profiler,
+            "statements": [],
+            "started": time.perf_counter(),
+        }
+        profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop("_profile", None)
+        if profile is None:
+            return response
+        profile["profiler"].disable()
+        elapsed_ms = (time.perf_counter() - profile["started"]) * 1000
+
+        try:
+            write_profile(app, profile, response, elapsed_ms)
+        except OSError as e:
+            print(f"Error writing request profile: {e}")
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # after_request doesn't run if the view raised, so make sure the profiler is off
+        profile = g.pop("_profile", None)
+        if profile is not None:
+            profile["profiler"].disable()
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.cli.command("profile-token")
+    def profile_token_command():
+        """Print a signed value for the X-DoseTracker-Profile header."""
+        click.echo(serializer.dumps("profile"))
+
+
+def get_profile_dir(app):
+    return app.config["PROFILE_DIR"] or os.path.join(app.instance_path, "profiles")
+
+
+def _current_profile():
+    try:
+        return g.get("_profile")
+    except RuntimeError:
+        return None  # Outside an application context (e.g. a scheduler job)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None:
+        conn.info.setdefault("_profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    starts = conn.info.get("_profile_query_start")
+    if profile is None or not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    if len(profile["statements"]) < MAX_RECORDED_STATEMENTS:
+        profile["statements"].append(
+            {
+                "statement": statement,
+                "parameters": repr(parameters)[:200],
+                "duration_ms": round(duration_ms, 3),
+            }
+        )
+
+
+def write_profile(app, profile, response, elapsed_ms):
+    """
+    Name:       write_profile(app, profile, response, elapsed_ms)
+    Purpose:    Writes a profiled request's cProfile stats (<name>.prof) and its metadata and SQL
+                statements (<name>.json) to the profile directory, then deletes the oldest
+                profiles beyond PROFILE_MAX_FILES.
+    Parameters: app (Flask): The Flask application instance.
+                profile (dict): The profiler and statements captured for the request.
+                response (Response): The response that was produced.
+                elapsed_ms (float): Wall time for the request in milliseconds.
+    Returns:    str: The name of the profile that was written.
+    """
+
+    profile_dir = get_profile_dir(app)
+    now = datetime.now()
+    name = f"{now:%Y%m%d-%H%M%S-%f}-{request.endpoint}".replace("/", "_")
+
+    profile["profiler"].dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+
+    statements = profile["statements"]
+    metadata = {
+        "name": name,
+        "timestamp": now.isoformat(timespec="seconds"),
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "query_count": len(statements),
+        "db_ms": round(sum(s["duration_ms"] for s in statements), 2),
+        "statements": statements,
+    }
+    with open(os.path.join(profile_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=1)
+
+    _rotate(profile_dir, app.config["PROFILE_MAX_FILES"])
+    return name
+
+
+def _rotate(profile_dir, max_files):
+    names = sorted(f[:-5] for f in os.listdir(profile_dir) if f.endswith(".json"))
+    for name in names[: max(0, len(names) - max_files)]:
+        for ext in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(profile_dir, name + ext))
+            except OSError:
+                pass
+
+
+def list_profiles(app):
+    """
+    Name:       list_profiles(app)
+    Purpose:    Loads the metadata of every stored profile, newest first, without the SQL text.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    list: Profile metadata dicts.
+    """
+
+    profile_dir = get_profile_dir(app)
+    profiles = []
+    for filename in sorted(os.listdir(profile_dir), reverse=True):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(profile_dir, filename), encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metadata.pop("statements", None)
+        profiles.append(metadata)
+    return profiles
+
+
+def load_profile(app, name, sort_by="cumulative", limit=40):
+    """
+    Name:       load_profile(app, name, sort_by, limit)
+    Purpose:    Loads one stored profile as text: the request metadata, the top functions from
+                the cProfile stats, and the SQL statements issued.
+    Parameters: app (Flask): The Flask application instance.
+                name (str): The profile name, as returned by list_profiles().
+                sort_by (str): pstats sort key, one of SORT_KEYS.
+                limit (int): Number of functions to include.
+    Returns:    str: The formatted report, or None if the profile doesn't exist.
+    """
+
+    profile_dir = get_profile_dir(app)
+    base = os.path.join(profile_dir, os.path.basename(name))
+    try:
+        with open(base + ".json", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    out = io.StringIO()
+    out.write(
+        f"{metadata['method']} {metadata['path']} ({metadata['endpoint']}) -> {metadata['status']}\n"
+        f"{metadata['elapsed_ms']} ms total, {metadata['query_count']} queries, "
+        f"{metadata['db_ms']} ms in the database\n\n"
+    )
+    stats = pstats.Stats(base + ".prof", stream=out)
+    stats.sort_stats(sort_by).print_stats(limit)
+
+    out.write("\nSQL statements:\n")
+    for i, statement in enumerate(metadata["statements"], start=1):
+        out.write(f"\n[{i}] {statement['duration_ms']} ms  {statement['parameters']}\n")
+        out.write(f"{statement['statement']}\n")
+    return out.getvalue()
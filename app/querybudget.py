@@ -0,0 +1,222 @@
+"""
+querybudget.py
+--------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/querybudget.py
+
+Purpose:    Counts and fingerprints the SQL statements issued on the current thread so that N+1
+            query patterns can be caught before they reach production.
+
+            In tests, wrap a request in a budget and it fails loudly when exceeded:
+
+                with query_budget(4, max_repeats=2):
+                    client.get("/medicines/my_medicine")
+
+            In development, set QUERY_DEBUG to record every request; requests that repeat a
+            statement more than QUERY_DEBUG_MAX_REPEATS times with different parameters are
+            reported, and endpoints listed in QUERY_BUDGETS raise QueryBudgetExceeded when
+            they issue more statements than their budget allows.
+"""
+
+import re
+import threading
+from collections import Counter
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block of code or a request issues more SQL than its budget allows."""
+
+
+_local = threading.local()
+_listening = False
+_listen_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*[?%s:\w()]+\s*,?)+\)", re.IGNORECASE)
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+
+
+def fingerprint(statement):
+    """
+    Name:       fingerprint(statement)
+    Purpose:    Normalises a SQL statement so that executions differing only in their literal
+                values or IN-list lengths compare equal.
+    Parameters: statement (str): The SQL statement text.
+    Returns:    str: The normalised statement.
+    """
+
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _POSTCOMPILE.sub("(?)", statement)
+    statement = _IN_LIST.sub("IN (?)", statement)
+    return statement
+
+
+class QueryRecorder:
+    """
+    Records the SQL statements executed on the current thread while active. Recorders can be
+    nested; each active recorder sees every statement.
+
+    Attributes:
+        statements (list): (statement, parameters) tuples in execution order.
+
+    Methods:
+        count: Number of statements recorded.
+        fingerprints(): Counter of fingerprinted statements.
+        repeated(min_count): Fingerprints executed at least min_count times with differing
+                             parameters - the N+1 signature.
+        report(): A human-readable summary of what was recorded.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        _ensure_listening()
+        stack = getattr(_local, "recorders", None)
+        if stack is None:
+            stack = _local.recorders = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _local.recorders.remove(self)
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def fingerprints(self):
+        return Counter(fingerprint(statement) for statement, _ in self.statements)
+
+    def repeated(self, min_count=2):
+        parameters = {}
+        for statement, params in self.statements:
+            parameters.setdefault(fingerprint(statement), set()).add(repr(params))
+        return {
+            sql: count
+            for sql, count in self.fingerprints().items()
+            if count >= min_count and len(parameters[sql]) > 1
+        }
+
+    def report(self):
+        lines = [f"{self.count} SQL statements executed:"]
+        for sql, count in self.fingerprints().most_common():
+            lines.append(f"  {count:4d} x {sql}")
+        return "\n".join(lines)
+
+
+class query_budget(QueryRecorder):
+    """
+    Context manager asserting that the enclosed code stays within a query budget.
+
+    Parameters:
+        max_queries (int): Maximum number of statements allowed, or None for no limit.
+        max_repeats (int): Maximum number of times any one statement may be repeated with
+                           different parameters, or None for no limit.
+
+    Raises:
+        QueryBudgetExceeded: On exit, if either limit was exceeded. The message lists every
+                             fingerprinted statement with its count.
+    """
+
+    def __init__(self, max_queries=None, max_repeats=None):
+        super().__init__()
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+
+    def __exit__(self, exc_type, exc_value, tb):
+        super().__exit__(exc_type, exc_value, tb)
+        if exc_type is None:
+            check_budget(self, self.max_queries, self.max_repeats)
+        return False
+
+
+def check_budget(recorder, max_queries=None, max_repeats=None, label="Block"):
+    """
+    Name:       check_budget(recorder, max_queries, max_repeats, label)
+    Purpose:    Raises QueryBudgetExceeded if a recorder holds more statements than max_queries,
+                or any statement repeated with different parameters more than max_repeats times.
+    Parameters: recorder (QueryRecorder): The recorded statements.
+                max_queries (int): Statement budget, or None.
+                max_repeats (int): Repeat budget, or None.
+                label (str): Describes what was measured, for the error message.
+    Returns:    None
+    """
+
+    problems = []
+    if max_queries is not None and recorder.count > max_queries:
+        problems.append(f"{label} issued {recorder.count} queries (budget {max_queries})")
+    if max_repeats is not None:
+        for sql, count in recorder.repeated(max_repeats + 1).items():
+            problems.append(
+                f"{label} repeated a statement {count} times (budget {max_repeats}): {sql}"
+            )
+    if problems:
+        raise QueryBudgetExceeded("\n".join(problems) + "\n\n" + recorder.report())
+
+
+def _ensure_listening():
+    global _listening
+    with _listen_lock:
+        if not _listening:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            _listening = True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorders = getattr(_local, "recorders", None)
+    if recorders:
+        for recorder in recorders:
+            recorder.statements.append((statement, parameters))
+
+
+def init_query_debug(app):
+    """
+    Name:       init_query_debug(app)
+    Purpose:    In QUERY_DEBUG mode, records the statements issued by every request, warns about
+                repeated statements and enforces the per-endpoint budgets in QUERY_BUDGETS.
+                The X-Query-Count response header reports the number of statements.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    if not app.config["QUERY_DEBUG"]:
+        return
+
+    @app.before_request
+    def start_query_recording():
+        g._query_recorder = QueryRecorder().__enter__()
+
+    @app.after_request
+    def check_query_recording(response):
+        recorder = g.pop("_query_recorder", None)
+        if recorder is None:
+            return response
+        recorder.__exit__(None, None, None)
+
+        response.headers["X-Query-Count"] = str(recorder.count)
+
+        max_repeats = app.config["QUERY_DEBUG_MAX_REPEATS"]
+        for sql, count in recorder.repeated(max_repeats + 1).items():
+            print(f"Possible N+1 in {request.endpoint}: {count} x {sql}")
+
+        budget = app.config["QUERY_BUDGETS"].get(request.endpoint)
+        if budget is not None:
+            check_budget(recorder, max_queries=budget, label=request.endpoint)
+        return response
+
+    @app.teardown_request
+    def stop_query_recording(exc):
+        recorder = g.pop("_query_recorder", None)
+        if recorder is not None:
+            recorder.__exit__(None, None, None)
@@ -0,0 +1,174 @@
+"""
+ratelimit.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/ratelimit.py
+
+Purpose:    In-process rate limiting for the login, sign-up and forgot-password routes, where each
+            attempt costs bcrypt work or an email. Attempts are counted per client IP and per
+            submitted email address with a sliding-window counter: each key keeps only its
+            current and previous window counts, so the store stays small, and the least recently
+            seen keys are evicted once RATE_LIMIT_MAX_KEYS is reached.
+
+            Limits are configured per endpoint in Config.RATE_LIMITS as "<count>/<period>",
+            e.g. {"auth.login": "10/minute"}. Endpoints listed in Config.RATE_LIMIT_BUCKETS count
+            against another endpoint's limit instead, so two forms for the same action share one
+            budget.
+
+            Clients are identified by request.remote_addr. Behind a reverse proxy, set
+            PROXY_FIX_HOPS to the number of proxies (see create_app()) so it is the client's own
+            address; otherwise every client would share the proxy's address and its limit.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(limit):
+    """
+    Name:       parse_limit(limit)
+    Purpose:    Parses a limit string such as '10/minute' or '5 per hour'.
+    Parameters: limit (str): The limit string.
+    Returns:    tuple: (count (int), period in seconds (int)).
+    Raises:     ValueError: If the string is not a valid limit.
+    """
+
+    count, _, period = limit.replace(" per ", "/").partition("/")
+    period = period.strip().lower().rstrip("s")
+    if period not in PERIODS:
+        raise ValueError(f"Unknown rate limit period in {limit!r}")
+    return int(count), PERIODS[period]
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window-counter rate limiter with an LRU-bounded in-memory store.
+
+    Rather than storing a timestamp per attempt, each key keeps the start of its current fixed
+    window and the counts for the current and previous windows. The rate is estimated by
+    weighting the previous window's count by how much of it still overlaps the sliding window,
+    which is accurate to within a few percent and costs a constant three numbers per key.
+
+    Attributes:
+        max_keys (int): Maximum number of keys tracked before the least recently used is evicted.
+
+    Methods:
+        hit(key, count, period): Records an attempt and reports whether it is within the limit.
+        reset(): Forgets every key.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # key -> [window_start, previous_count, current_count]
+        self._lock = threading.Lock()
+
+    def hit(self, key, count, period, now=None):
+        """
+        Records an attempt for key and checks it against a limit of count per period seconds.
+
+        Returns:
+            tuple: (allowed (bool), retry_after (int) seconds until the next attempt may succeed).
+        """
+        now = time.time() if now is None else now
+        window_start = now - (now % period)
+
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = [window_start, 0, 0]
+                self._windows[key] = window
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+                if window[0] != window_start:
+                    # Roll forward; counts older than one window no longer matter
+                    adjacent = window_start - window[0] == period
+                    window[1] = window[2] if adjacent else 0
+                    window[2] = 0
+                    window[0] = window_start
+
+            window[2] += 1
+            elapsed = now - window_start
+            estimate = window[1] * (period - elapsed) / period + window[2]
+
+        if estimate <= count:
+            return True, 0
+        return False, max(1, math.ceil(period - elapsed))
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+
+
+def init_rate_limiter(app):
+    """
+    Name:       init_rate_limiter(app)
+    Purpose:    Creates the application's rate limiter and validates the configured limits.
+    Parameters: app (Flask): The Flask application instance.
+    Returns:    None
+    """
+
+    for limit in app.config["RATE_LIMITS"].values():
+        parse_limit(limit)
+    for endpoint, bucket in app.config["RATE_LIMIT_BUCKETS"].items():
+        if bucket not in app.config["RATE_LIMITS"]:
+            raise ValueError(f"Rate limit bucket {bucket!r} for {endpoint} has no limit")
+    app.extensions["rate_limiter"] = SlidingWindowLimiter(app.config["RATE_LIMIT_MAX_KEYS"])
+
+
+def rate_limited(view):
+    """
+    Name:       rate_limited(view)
+    Purpose:    Decorator that applies the endpoint's configured limit (or its bucket's) to POST
+                requests, counting attempts both by client IP and by the submitted 'email' form
+                field. Requests over either limit get a 429 response with a Retry-After header.
+    Parameters: view (callable): The view function to wrap.
+    Returns:    callable: The wrapped view.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        bucket = current_app.config["RATE_LIMIT_BUCKETS"].get(request.endpoint, request.endpoint)
+        limit = current_app.config["RATE_LIMITS"].get(bucket)
+        if (
+            request.method != "POST"
+            or not limit
+            or not current_app.config["RATE_LIMIT_ENABLED"]
+        ):
+            return view(*args, **kwargs)
+
+        limiter = current_app.extensions["rate_limiter"]
+        count, period = parse_limit(limit)
+
+        keys = [(bucket, "ip", request.remote_addr)]
+        email = request.form.get("email", "").strip().lower()
+        if email:
+            keys.append((bucket, "email", email))
+
+        retry_after = 0
+        for key in keys:
+            allowed, wait = limiter.hit(key, count, period)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+
+        if retry_after:
+            print(f"Rate limit exceeded for {request.endpoint} from {request.remote_addr}")
+            return (
+                f"Too many attempts. Please try again in {retry_after} seconds.",
+                429,
+                {"Retry-After": str(retry_after)},
+            )
+
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,202 @@
+"""
+reportjobs.py
+-------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/reportjobs.py
+
+Purpose:    Renders and emails PDF medicine reports in the background. A request submits a job and
+            gets a job id back straight away; a small pool of worker threads renders the report
+            (through the report cache) and hands the message to the mail queue. The job moves
+            through these states, which the /report_jobs/<job_id> endpoint reports:
+
+                queued -> rendering -> sending -> sent
+
+            or "failed", with the error message, if rendering or delivery fails.
+
+            "sent" is only reported once the mail queue's SMTP server has accepted the message.
+            Job state is kept in the report_jobs table, so a status poll can be answered by any
+            worker process, not just the one running the job, and finished jobs survive a
+            restart. Finished jobs are deleted after REPORT_JOB_RETENTION seconds. A job whose
+            worker went away (a restart or crash) stops making progress; once it hasn't changed
+            state for REPORT_JOB_STALE_AFTER seconds it is reported as failed.
+"""
+
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask_mail import Message
+from app.extensions import db
+from app.mailqueue import mail_queue
+from app.models import ReportJob
+
+
+QUEUED = "queued"
+RENDERING = "rendering"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+FINISHED_STATES = (SENT, FAILED)
+
+
+def build_report_message(recipient, pdf_data):
+    """
+    Name:       build_report_message(recipient, pdf_data)
+    Purpose:    Builds the email that carries a user's PDF medicines report.
+    Parameters: recipient (str): The address to send the report to.
+                pdf_data (bytes): The rendered PDF.
+    Returns:    Message: The Flask-Mail message with the report attached.
+    """
+
+    msg = Message(
+        "Your Dose Tracker Report",
+        recipients=[recipient],
+        sender="Dose Tracker <dave@djrogers.net.au>",
+    )
+    msg.body = "Please find attached your medicines report."
+    msg.attach("medicines_report.pdf", "application/pdf", pdf_data)
+    return msg
+
+
+class ReportJobs:
+    """
+    Background executor for report jobs, with their state in the report_jobs table.
+
+    Attributes:
+        app (Flask): The application whose context the jobs run in.
+
+    Methods:
+        init_app(app): Binds the executor to an application.
+        submit(user_id, recipient): Queues a report job and returns its id.
+        get(job_id): Returns a job's state, or None if it is unknown.
+        shutdown(wait): Stops the worker threads.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["report_jobs"] = self
+
+    def submit(self, user_id, recipient):
+        """
+        Name:       submit(user_id, recipient)
+        Purpose:    Records a new job in the "queued" state and hands it to the worker pool.
+                    Must be called in an application context.
+        Parameters: user_id (int): The user whose report is rendered.
+                    recipient (str): The address the report is emailed to.
+        Returns:    str: The job id.
+        """
+
+        job_id = secrets.token_urlsafe(12)
+        now = datetime.now()
+        self._prune(now)
+        db.session.add(
+            ReportJob(
+                id=job_id,
+                user_id=user_id,
+                recipient=recipient,
+                status=QUEUED,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+        db.session.commit()
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config["REPORT_JOB_WORKERS"],
+                    thread_name_prefix="report-job",
+                )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Name:       get(job_id)
+        Purpose:    Returns a job's state. An unfinished job that hasn't changed state for
+                    REPORT_JOB_STALE_AFTER seconds lost its worker, and is marked failed. Must be
+                    called in an application context.
+        Parameters: job_id (str): The job id.
+        Returns:    dict: The job's state, or None if the job is unknown (or has expired).
+        """
+
+        job = db.session.get(ReportJob, job_id)
+        if job is None:
+            return None
+        stale_after = timedelta(seconds=self.app.config["REPORT_JOB_STALE_AFTER"])
+        if job.status not in FINISHED_STATES and datetime.now() - job.updated_at > stale_after:
+            job.status = FAILED
+            job.error = "The report job was interrupted. Please request the report again."
+            job.updated_at = datetime.now()
+            db.session.commit()
+        return job.to_dict()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _set_status(self, job_id, status, error=None):
+        # Runs on worker and mail queue threads, so use a context (and session) of its own
+        with self.app.app_context():
+            job = db.session.get(ReportJob, job_id)
+            if job is None:
+                return None
+            job.status = status
+            job.error = error
+            job.updated_at = datetime.now()
+            db.session.commit()
+            return job.to_dict()
+
+    def _prune(self, now):
+        # Forget finished jobs past their retention; jobs still in progress are always kept
+        cutoff = now - timedelta(seconds=self.app.config["REPORT_JOB_RETENTION"])
+        db.session.execute(
+            db.delete(ReportJob).where(
+                ReportJob.status.in_(FINISHED_STATES), ReportJob.updated_at < cutoff
+            )
+        )
+
+    def _run(self, job_id):
+        # Imported here to avoid a circular import with app.application
+        from app.application import get_report_pdf
+        from app.models import User
+
+        job = self._set_status(job_id, RENDERING)
+        if job is None:
+            return
+
+        with self.app.app_context():
+            try:
+                user = db.session.get(User, job["user_id"])
+                if user is None:
+                    raise LookupError(f"User {job['user_id']} no longer exists")
+                pdf_data = get_report_pdf(user)
+                msg = build_report_message(job["recipient"], pdf_data)
+            except Exception as e:
+                print(f"Error rendering report for job {job_id}: {e}")
+                self._set_status(job_id, FAILED, str(e))
+                return
+
+        self._set_status(job_id, SENDING)
+
+        def delivered(error):
+            if error is None:
+                self._set_status(job_id, SENT)
+            else:
+                self._set_status(job_id, FAILED, str(error))
+
+        mail_queue.send(msg, callback=delivered)
+
+
+# Shared executor, bound to the app in create_app()
+report_jobs = ReportJobs()
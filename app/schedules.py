@@ -0,0 +1,329 @@
+"""
+schedules.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/schedules.py
+
+Purpose:    Structured medication schedules, for regimens the fixed frequencies ("Once a Day" ...
+            "Four Times a Day") can't express: every 8 hours, only on some weekdays, every other
+            day, or a tapering dose that changes from one week to the next.
+
+            A schedule is a list of rules, stored as JSON in UserMedicine.schedule. Each rule
+            says which days it applies to and at which times, and may give the dose for those
+            occurrences. Users write rules one per line:
+
+                daily 08:00,20:00
+                every 8h 06:00-22:00
+                mon,wed,fri 09:00
+                2026-10-01..2026-10-07 08:00 dose 40 mg
+                2026-10-08..2026-10-14 08:00 dose 20 mg
+                2026-10-01.. every 2 days 07:30
+
+            A line is: an optional date range (either end may be left open), optional days
+            ("daily", a list of weekdays or "every N days" counted from the range's start), the
+            times (a list, or "every Nh" with an optional HH:MM-HH:MM window) and an optional
+            dose.
+
+            The reminder dispatcher never looks at rules while it runs: compile_day() turns a
+            schedule into the sorted minutes of the day it occurs at, once per schedule per day
+            (the result is cached), and the dispatcher finds due reminders with a binary search.
+"""
+
+import json
+import re
+from datetime import date, time, timedelta
+from functools import lru_cache
+
+
+# Frequency choice whose reminders follow UserMedicine.schedule instead of fixed times
+CUSTOM_SCHEDULE = "Custom Schedule"
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+MINUTES_PER_DAY = 24 * 60
+
+# Compiled days kept, keyed by (schedule, date); a day's worth for every distinct schedule
+COMPILED_DAYS_CACHE = 4096
+
+MAX_DOSE_LENGTH = 100
+
+_DATE_RANGE = re.compile(r"^(\d{4}-\d{2}-\d{2})?\.\.(\d{4}-\d{2}-\d{2})?$")
+_TIMES = re.compile(r"^\d{1,2}:\d{2}(,\d{1,2}:\d{2})*$")
+_WINDOW = re.compile(r"^(\d{1,2}:\d{2})-(\d{1,2}:\d{2})$")
+_HOURS = re.compile(r"^(\d+)h$")
+
+
+class ScheduleError(ValueError):
+    """Raised when a schedule can't be parsed; the message says which line is wrong and why."""
+
+
+def _minute(text):
+    hours, minutes = (int(part) for part in text.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ScheduleError(f"{text} is not a valid time")
+    return hours * 60 + minutes
+
+
+def _clock(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _parse_date(text):
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise ScheduleError(f"{text} is not a valid date") from None
+
+
+def _parse_rule(line):
+    tokens = line.split()
+    rule = {}
+    i = 0
+
+    def take(count=1):
+        nonlocal i
+        taken = tokens[i:i + count]
+        i += count
+        return taken
+
+    def peek(offset=0):
+        return tokens[i + offset].lower() if i + offset < len(tokens) else None
+
+    # Date range
+    match = _DATE_RANGE.match(peek() or "")
+    if match:
+        take()
+        start, end = match.groups()
+        if start:
+            rule["start"] = _parse_date(start).isoformat()
+        if end:
+            rule["end"] = _parse_date(end).isoformat()
+        if start and end and start > end:
+            raise ScheduleError("the date range ends before it starts")
+
+    # Days
+    if peek() == "daily":
+        take()
+    elif peek() == "every" and peek(2) in ("day", "days"):
+        try:
+            every_days = int(take(3)[1])
+        except ValueError:
+            raise ScheduleError("expected 'every N days'") from None
+        if every_days < 1:
+            raise ScheduleError("'every N days' needs N of at least 1")
+        if every_days > 1:
+            if "start" not in rule:
+                raise ScheduleError(
+                    "'every N days' needs a start date to count from, e.g. 2026-10-01.."
+                )
+            rule["every_days"] = every_days
+    elif peek() and re.fullmatch(r"[a-z]{3}([,/][a-z]{3})*", peek()):
+        names = re.split(r"[,/]", take()[0].lower())
+        unknown = [name for name in names if name not in WEEKDAYS]
+        if unknown:
+            raise ScheduleError(f"{unknown[0]} is not a weekday (use mon, tue, ... sun)")
+        rule["weekdays"] = sorted({WEEKDAYS.index(name) for name in names})
+
+    # Times
+    if peek() == "every":
+        take()
+        match = _HOURS.match(peek() or "")
+        if match:
+            take()
+            hours = int(match.group(1))
+        elif peek(1) in ("h", "hour", "hours"):
+            try:
+                hours = int(take(2)[0])
+            except ValueError:
+                raise ScheduleError("expected 'every Nh'") from None
+        else:
+            raise ScheduleError("expected 'every Nh' or 'every N days'")
+        if not 1 <= hours <= 24:
+            raise ScheduleError("'every Nh' needs N from 1 to 24")
+        rule["every_hours"] = hours
+        match = _WINDOW.match(peek() or "")
+        if match:
+            take()
+            start_minute, end_minute = (_minute(part) for part in match.groups())
+            if start_minute > end_minute:
+                raise ScheduleError("the time window ends before it starts")
+            rule["from"], rule["until"] = _clock(start_minute), _clock(end_minute)
+    elif _TIMES.match(peek() or ""):
+        minutes = sorted({_minute(part) for part in take()[0].split(",")})
+        rule["times"] = [_clock(minute) for minute in minutes]
+    else:
+        raise ScheduleError("expected the times, e.g. 08:00,20:00 or every 8h")
+
+    # Dose
+    if peek() == "dose":
+        take()
+        dose = " ".join(take(len(tokens)))
+        if not dose:
+            raise ScheduleError("'dose' needs the amount, e.g. dose 20 mg")
+        if len(dose) > MAX_DOSE_LENGTH:
+            raise ScheduleError(f"the dose is longer than {MAX_DOSE_LENGTH} characters")
+        rule["dose"] = dose
+
+    if i < len(tokens):
+        raise ScheduleError(f"didn't understand '{' '.join(tokens[i:])}'")
+    return rule
+
+
+def parse_schedule(text):
+    """
+    Name:       parse_schedule(text)
+    Purpose:    Parses a schedule written one rule per line (see the module docstring). Blank
+                lines and lines starting with # are ignored.
+    Parameters: text (str): The schedule as the user typed it.
+    Returns:    list: The rules, as dicts ready to be stored with dump_schedule().
+    Raises:     ScheduleError: If a line can't be parsed, or there are no rules.
+    """
+
+    rules = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            rules.append(_parse_rule(line))
+        except ScheduleError as e:
+            raise ScheduleError(f"Line {number}: {e}") from None
+    if not rules:
+        raise ScheduleError("The schedule has no rules")
+    return rules
+
+
+def format_schedule(rules):
+    """
+    Name:       format_schedule(rules)
+    Purpose:    Writes rules back out in the one-rule-per-line form parse_schedule() reads, for
+                editing.
+    Parameters: rules (list): The schedule's rules.
+    Returns:    str: The schedule as text.
+    """
+
+    lines = []
+    for rule in rules:
+        parts = []
+        if "start" in rule or "end" in rule:
+            parts.append(f"{rule.get('start', '')}..{rule.get('end', '')}")
+        if "every_days" in rule:
+            parts.append(f"every {rule['every_days']} days")
+        elif "weekdays" in rule:
+            parts.append(",".join(WEEKDAYS[day] for day in rule["weekdays"]))
+        else:
+            parts.append("daily")
+        if "every_hours" in rule:
+            parts.append(f"every {rule['every_hours']}h")
+            if "from" in rule:
+                parts.append(f"{rule['from']}-{rule['until']}")
+        else:
+            parts.append(",".join(rule["times"]))
+        if "dose" in rule:
+            parts.append(f"dose {rule['dose']}")
+        lines.append(" ".join(parts))
+    return "\n".join(lines)
+
+
+def dump_schedule(rules):
+    return json.dumps(rules, separators=(",", ":"), sort_keys=True)
+
+
+def load_schedule(stored):
+    return json.loads(stored)
+
+
+def rule_minutes(rule):
+    """
+    Name:       rule_minutes(rule)
+    Purpose:    Returns the minutes of the day a rule's occurrences fall on.
+    Parameters: rule (dict): The rule.
+    Returns:    list: Sorted minutes since midnight.
+    """
+
+    if "every_hours" in rule:
+        start = _minute(rule.get("from", "00:00"))
+        end = _minute(rule.get("until", "23:59"))
+        return list(range(start, end + 1, rule["every_hours"] * 60))
+    return [_minute(text) for text in rule["times"]]
+
+
+def rule_applies(rule, day):
+    """
+    Name:       rule_applies(rule, day)
+    Purpose:    Tells whether a rule has occurrences on a given day.
+    Parameters: rule (dict): The rule.
+                day (date): The day.
+    Returns:    bool: True if the rule applies that day.
+    """
+
+    if "start" in rule and day < date.fromisoformat(rule["start"]):
+        return False
+    if "end" in rule and day > date.fromisoformat(rule["end"]):
+        return False
+    if "weekdays" in rule and day.weekday() not in rule["weekdays"]:
+        return False
+    if "every_days" in rule:
+        return (day - date.fromisoformat(rule["start"])).days % rule["every_days"] == 0
+    return True
+
+
+@lru_cache(maxsize=COMPILED_DAYS_CACHE)
+def compile_day(stored, day):
+    """
+    Name:       compile_day(stored, day)
+    Purpose:    Compiles a stored schedule into the occurrences of one day. Results are cached,
+                so each distinct schedule is only evaluated once a day however many medicines
+                share it.
+    Parameters: stored (str): The schedule as stored in UserMedicine.schedule.
+                day (date): The day.
+    Returns:    tuple: (minutes, doses) - the sorted minutes since midnight of the day's
+                occurrences, and the dose for each (None if its rule gives none). Where rules
+                overlap, the first rule's dose is used.
+    """
+
+    doses = {}
+    for rule in load_schedule(stored):
+        if rule_applies(rule, day):
+            for minute in rule_minutes(rule):
+                doses.setdefault(minute, rule.get("dose"))
+    minutes = tuple(sorted(doses))
+    return minutes, tuple(doses[minute] for minute in minutes)
+
+
+def _first_day(rule, day):
+    # The first day on or after `day` that the rule applies to, or None if it has ended
+    if "start" in rule:
+        day = max(day, date.fromisoformat(rule["start"]))
+    if "every_days" in rule:
+        behind = (day - date.fromisoformat(rule["start"])).days % rule["every_days"]
+        if behind:
+            day += timedelta(days=rule["every_days"] - behind)
+    elif "weekdays" in rule:
+        day += timedelta(days=min((weekday - day.weekday()) % 7 for weekday in rule["weekdays"]))
+    if "end" in rule and day > date.fromisoformat(rule["end"]):
+        return None
+    return day
+
+
+def first_occurrence(rules, day):
+    """
+    Name:       first_occurrence(rules, day)
+    Purpose:    Returns the time of a schedule's first occurrence on or after a day, looking up
+                to a year ahead, for the reminder row's display time. Each rule's first day is
+                worked out directly, so this doesn't step through (or fill compile_day()'s cache
+                with) the days in between.
+    Parameters: rules (list): The schedule's rules.
+                day (date): The day to start looking from.
+    Returns:    time: The first occurrence's time of day, or None if there are none.
+    """
+
+    first_days = [_first_day(rule, day) for rule in rules]
+    first_days = [first_day for first_day in first_days if first_day is not None]
+    if not first_days or min(first_days) > day + timedelta(days=365):
+        return None
+    first_day = min(first_days)
+    minute = min(min(rule_minutes(rule)) for rule in rules if rule_applies(rule, first_day))
+    return time(minute // 60, minute % 60)
@@ -0,0 +1,27 @@
+// Service worker for browser notification reminders: shows each Web Push reminder as a
+// notification, and opens the medicine list when it is clicked
+
+self.addEventListener('push', function (event) {
+    let reminder = { title: 'DoseTracker Reminder', body: '' };
+    if (event.data) {
+        try {
+            reminder = event.data.json();
+        } catch (e) {
+            reminder.body = event.data.text();
+        }
+    }
+
+    event.waitUntil(
+        self.registration.showNotification(reminder.title, {
+            body: reminder.body,
+            icon: '/static/img/logo.png',
+            tag: 'dosetracker-reminder',
+            renotify: true
+        })
+    );
+});
+
+self.addEventListener('notificationclick', function (event) {
+    event.notification.close();
+    event.waitUntil(clients.openWindow('/medicines/my_medicine'));
+});
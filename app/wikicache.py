@@ -0,0 +1,434 @@
+"""
+wikicache.py
+------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/app/wikicache.py
+
+Purpose:    Caches the Wikipedia article shown on a medicine's details page, so the page no longer
+            walks every section of the article over the network on each view.
+
+            Articles are keyed by normalised medicine name and cached in two tiers: an in-memory
+            LRUCache in front of a SQLite database (WIKI_CACHE_PATH) that survives restarts and is
+            shared by every worker process on the host. An entry is fresh for WIKI_CACHE_TTL
+            seconds (WIKI_CACHE_MISSING_TTL for medicines with no article). After that it is still
+            served straight away, and a background thread fetches a new copy
+            (stale-while-revalidate). Only the very first view of a medicine waits on Wikipedia.
+
+            The article source is pluggable: WikipediaSource talks to Wikipedia, while
+            FakeWikipediaSource serves canned articles for tests and offline development
+            (WIKI_SOURCE=fake, with WIKI_FAKE_PAGES pointing at a JSON file of articles).
+
+            New and renamed medicines are prefetched in the background, and the whole catalogue
+            can be warmed up with:  flask wiki warm [--concurrency N] [--force]
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+import click
+from flask.cli import AppGroup
+from app.cache import LRUCache
+
+
+def normalize_name(name):
+    """
+    Name:       normalize_name(name)
+    Purpose:    Normalises a medicine name for use as a cache key, so that case and spacing
+                differences share one entry.
+    Parameters: name (str): The medicine name.
+    Returns:    str: The normalised name.
+    """
+
+    return " ".join(name.split()).casefold()
+
+
+def make_article(title, sections):
+    """
+    Name:       make_article(title, sections)
+    Purpose:    Builds the article dict stored in the cache.
+    Parameters: title (str): The article title, or None if there is no article.
+                sections (list): (section title, section text) pairs.
+    Returns:    dict: {"title", "exists", "sections": [{"title", "text"}], "fetched"}.
+    """
+
+    return {
+        "title": title,
+        "exists": title is not None,
+        "sections": [{"title": t, "text": text} for t, text in sections],
+        "fetched": time.time(),
+    }
+
+
+class WikipediaSource:
+    """
+    Fetches articles from Wikipedia with wikipedia-api.
+
+    Methods:
+        fetch(name): Returns the article for a medicine name.
+    """
+
+    def __init__(self, language="en"):
+        self.language = language
+        self._wiki = None
+
+    def fetch(self, name):
+        if self._wiki is None:
+            import wikipediaapi
+
+            self._wiki = wikipediaapi.Wikipedia(
+                user_agent="DoseTracker (dave@djrogers.net.au)", language=self.language
+            )
+
+        page = self._wiki.page(name)
+        if not page.exists():
+            return make_article(None, [])
+        return make_article(
+            page.title, [(section.title, section.text) for section in page.sections]
+        )
+
+
+class FakeWikipediaSource:
+    """
+    Serves canned articles instead of calling Wikipedia, for tests and offline development.
+
+    Attributes:
+        pages (dict): Maps medicine names (matched after normalisation) to lists of
+                      (section title, section text) pairs.
+        delay (float): Seconds to sleep per fetch, to simulate a slow network.
+        fail (bool): When True, every fetch raises ConnectionError.
+        calls (int): Number of fetches made.
+    """
+
+    def __init__(self, pages=None, delay=0, fail=False):
+        self.pages = {normalize_name(name): sections for name, sections in (pages or {}).items()}
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def fetch(self, name):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("Fake Wikipedia is unavailable")
+        sections = self.pages.get(normalize_name(name))
+        if sections is None:
+            return make_article(None, [])
+        return make_article(name, [tuple(section) for section in sections])
+
+
+class SQLiteStore:
+    """
+    On-disk tier of the Wikipedia cache: one row per normalised name holding the article as
+    JSON. Uses WAL mode so several worker processes can read while one writes.
+
+    Methods:
+        get(key): Returns the stored article or None.
+        set(key, article): Stores an article.
+        delete(key): Removes an article.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS wiki_articles "
+            "(key TEXT PRIMARY KEY, fetched REAL NOT NULL, article TEXT NOT NULL)"
+        )
+        connection.commit()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT article FROM wiki_articles WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading Wikipedia cache: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, article):
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO wiki_articles (key, fetched, article) VALUES (?, ?, ?)",
+                (key, article["fetched"], json.dumps(article)),
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing Wikipedia cache: {e}")
+
+    def delete(self, key):
+        connection = self._connection()
+        connection.execute("DELETE FROM wiki_articles WHERE key = ?", (key,))
+        connection.commit()
+
+
+class WikiCache:
+    """
+    Two-tier, stale-while-revalidate cache of Wikipedia articles.
+
+    Attributes:
+        source: Object with a fetch(name) method returning an article dict.
+        store (SQLiteStore): The on-disk tier, or None for memory only.
+        memory (LRUCache): The in-memory tier.
+        ttl (float): Seconds an article stays fresh.
+        missing_ttl (float): Seconds a "no article" result stays fresh.
+        fetches (int): Number of synchronous fetches made on a miss.
+        refreshes (int): Number of background fetches (refreshes and prefetches) started.
+
+    Methods:
+        get(name): Returns the article for a medicine name, fetching it only on a full miss.
+        refresh(name): Fetches and stores a new copy of an article.
+        prefetch(name): Fetches an article in the background if it isn't cached and fresh.
+        warm(names, concurrency, force): Fetches many articles with bounded concurrency.
+        wait_for_refreshes(timeout): Waits for background refreshes to finish.
+        stats(): Returns memory tier statistics and fetch counters.
+    """
+
+    def __init__(self, source, store=None, max_entries=256, ttl=7 * 86400, missing_ttl=86400,
+                 refresh_workers=2):
+        self.source = source
+        self.store = store
+        self.memory = LRUCache(max_entries=max_entries)
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.fetches = 0
+        self.refreshes = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix="wiki-refresh"
+        )
+        self._in_flight = {}  # key -> Future of a background fetch
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        article = self.memory.get(key)
+        if article is None and self.store is not None:
+            article = self.store.get(key)
+            if article is not None:
+                self.memory.set(key, article)
+        return article
+
+    def _save(self, key, article):
+        self.memory.set(key, article)
+        if self.store is not None:
+            self.store.set(key, article)
+
+    def is_stale(self, article):
+        ttl = self.ttl if article["exists"] else self.missing_ttl
+        return time.time() - article["fetched"] > ttl
+
+    def get(self, name):
+        """
+        Name:       get(name)
+        Purpose:    Returns the cached article for a medicine. A stale article is returned as-is
+                    and refreshed in the background; only a complete miss waits on the source,
+                    and concurrent misses for the same name share one fetch.
+        Parameters: name (str): The medicine name.
+        Returns:    dict: The article (see make_article()).
+        Raises:     Whatever the source raises, if the article isn't cached at all.
+        """
+
+        key = normalize_name(name)
+        article = self._lookup(key)
+        if article is not None:
+            if self.is_stale(article):
+                self._refresh_in_background(name, key)
+            return article
+
+        # A prefetch may already be fetching it; wait for that rather than fetching twice
+        with self._lock:
+            future = self._in_flight.get(key)
+        if future is not None:
+            futures_wait([future])
+            article = self._lookup(key)
+            if article is not None:
+                return article
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Another request may have fetched it while we waited
+                article = self._lookup(key)
+                if article is None:
+                    self.fetches += 1
+                    article = self.source.fetch(name)
+                    self._save(key, article)
+        finally:
+            # Drop the lock even when the fetch fails, so failures don't accumulate locks
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return article
+
+    def refresh(self, name):
+        key = normalize_name(name)
+        article = self.source.fetch(name)
+        self._save(key, article)
+        return article
+
+    def prefetch(self, name):
+        """
+        Name:       prefetch(name)
+        Purpose:    Fetches a medicine's article in the background unless a fresh copy is already
+                    cached, so the first view of its details page is served from the cache.
+                    Called when a medicine enters the catalogue or is renamed.
+        Parameters: name (str): The medicine name.
+        Returns:    None
+        """
+
+        key = normalize_name(name)
+        article = self._lookup(key)
+        if article is None or self.is_stale(article):
+            self._refresh_in_background(name, key)
+
+    def warm(self, names, concurrency=4, force=False):
+        """
+        Name:       warm(names, concurrency, force)
+        Purpose:    Fetches the articles of many medicines, at most `concurrency` at a time,
+                    skipping those already cached and fresh unless force is set.
+        Parameters: names (iterable): Medicine names.
+                    concurrency (int): Maximum number of simultaneous fetches.
+                    force (bool): Re-fetch articles that are still fresh.
+        Returns:    dict: Counts of fetched, skipped and failed names.
+        """
+
+        pending = {}
+        skipped = 0
+        for name in names:
+            key = normalize_name(name)
+            if key in pending:
+                continue
+            article = None if force else self._lookup(key)
+            if article is not None and not self.is_stale(article):
+                skipped += 1
+            else:
+                pending[key] = name
+
+        fetched = failed = 0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="wiki-warm") as pool:
+            futures = {pool.submit(self.refresh, name): name for name in pending.values()}
+            for future, name in futures.items():
+                try:
+                    future.result()
+                    fetched += 1
+                except Exception as e:
+                    print(f"Error fetching Wikipedia article for {name}: {e}")
+                    failed += 1
+        return {"fetched": fetched, "skipped": skipped, "failed": failed}
+
+    def _refresh_in_background(self, name, key):
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self.refreshes += 1
+
+            def run():
+                try:
+                    self.refresh(name)
+                except Exception as e:
+                    # Keep serving the stale copy (if any); the next view will try again
+                    print(f"Error refreshing Wikipedia article for {name}: {e}")
+                finally:
+                    with self._lock:
+                        self._in_flight.pop(key, None)
+
+            self._in_flight[key] = self._executor.submit(run)
+
+    def wait_for_refreshes(self, timeout=5):
+        # Mostly useful in tests
+        with self._lock:
+            futures = list(self._in_flight.values())
+        _, not_done = futures_wait(futures, timeout)
+        return not not_done
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update(fetches=self.fetches, refreshes=self.refreshes)
+        return stats
+
+
+def init_wiki_cache(app, source=None):
+    """
+    Name:       init_wiki_cache(app, source)
+    Purpose:    Creates the application's Wikipedia cache, stores it in
+                app.extensions["wiki_cache"] and registers the `flask wiki warm` command.
+    Parameters: app (Flask): The Flask application instance.
+                source: Article source to use instead of the one named by WIKI_SOURCE, e.g. a
+                        FakeWikipediaSource in tests.
+    Returns:    WikiCache: The cache.
+    Raises:     ValueError: If WIKI_SOURCE is 'fake' but WIKI_FAKE_PAGES isn't set.
+    """
+
+    config = app.config
+    if source is None:
+        if config["WIKI_SOURCE"] == "fake":
+            if not config["WIKI_FAKE_PAGES"]:
+                raise ValueError(
+                    "WIKI_SOURCE=fake needs WIKI_FAKE_PAGES, the path of a JSON file of articles"
+                )
+            source = FakeWikipediaSource.from_file(config["WIKI_FAKE_PAGES"])
+        else:
+            source = WikipediaSource()
+
+    path = config["WIKI_CACHE_PATH"] or os.path.join(app.instance_path, "wiki_cache.sqlite3")
+    cache = WikiCache(
+        source,
+        store=SQLiteStore(path),
+        max_entries=config["WIKI_CACHE_SIZE"],
+        ttl=config["WIKI_CACHE_TTL"],
+        missing_ttl=config["WIKI_CACHE_MISSING_TTL"],
+        refresh_workers=config["WIKI_REFRESH_WORKERS"],
+    )
+    app.extensions["wiki_cache"] = cache
+    app.cli.add_command(wiki_cli)
+    return cache
+
+
+wiki_cli = AppGroup("wiki", help="Manage the Wikipedia article cache.")
+
+
+@wiki_cli.command("warm")
+@click.option("--concurrency", type=int, default=None, help="Simultaneous fetches.")
+@click.option("--force", is_flag=True, help="Re-fetch articles that are still fresh.")
+def warm_command(concurrency, force):
+    """Fetch the Wikipedia article of every medicine in the catalogue."""
+    from flask import current_app
+    from app.extensions import db
+    from app.models import Medicine
+
+    names = [name for (name,) in db.session.query(Medicine.name)]
+    started = time.perf_counter()
+    result = current_app.extensions["wiki_cache"].warm(
+        names,
+        concurrency=concurrency or current_app.config["WIKI_WARM_CONCURRENCY"],
+        force=force,
+    )
+    click.echo(
+        f"{len(names)} medicines: fetched {result['fetched']}, already fresh {result['skipped']}, "
+        f"failed {result['failed']} in {time.perf_counter() - started:.1f}s"
+    )
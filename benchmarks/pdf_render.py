@@ -0,0 +1,86 @@
+"""
+benchmarks/pdf_render.py
+------------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/benchmarks/pdf_render.py
+
+Purpose:    Measures the PDF report renderer on reports of 10, 100 and 1,000 medicines (or the
+            sizes given): median render time, pages produced, time per page, peak Python memory
+            allocated during a render (from tracemalloc) and output size. Time and memory per
+            page should stay roughly flat as the list grows.
+
+            The first render in the process is timed separately, since it pays for decoding
+            the logo and loading the fonts that later renders reuse.
+
+Usage:      python benchmarks/pdf_render.py [--sizes 10 100 1000] [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def make_medicines(count):
+    return [
+        {
+            "name": f"Medicine {i}",
+            "dosage": f"{(i % 4) + 1} tablet(s)",
+            "frequency": "Twice a Day" if i % 2 else "Once a Day",
+            "notes": "Take with food" if i % 3 else "N/A",
+        }
+        for i in range(count)
+    ]
+
+
+def count_pages(pdf_data):
+    return pdf_data.count(b"/Type /Page\n") or pdf_data.count(b"/Type /Page ") or 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF report renderer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--runs", type=int, default=5, help="timed renders per size")
+    args = parser.parse_args()
+
+    from app.pdfreport import render_pdf
+
+    logo_path = os.path.join(PROJECT_ROOT, "app", "static", "img", "logo.png")
+
+    started = time.perf_counter()
+    render_pdf("benchmark@example.com", make_medicines(1), logo_path)
+    print(f"First render (cold): {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+    print(f"{'medicines':>9} {'pages':>6} {'median ms':>10} {'ms/page':>8} {'peak KiB':>9} "
+          f"{'KiB/page':>9} {'size KiB':>9}")
+    for size in args.sizes:
+        medicines = make_medicines(size)
+        times = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            pdf_data = render_pdf("benchmark@example.com", medicines, logo_path)
+            times.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        render_pdf("benchmark@example.com", medicines, logo_path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pages = count_pages(pdf_data)
+        median_ms = statistics.median(times) * 1000
+        print(
+            f"{size:>9} {pages:>6} {median_ms:>10.1f} {median_ms / pages:>8.2f} "
+            f"{peak / 1024:>9.0f} {peak / 1024 / pages:>9.1f} {len(pdf_data) / 1024:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
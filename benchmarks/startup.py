@@ -0,0 +1,113 @@
+"""
+benchmarks/startup.py
+---------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/benchmarks/startup.py
+
+Purpose:    Measures cold-start cost for a web worker: the wall time to import `app.application`,
+            the wall time of `create_app()`, and a breakdown of which top-level packages the
+            import spends its time in (from `python -X importtime`). Each run happens in a fresh
+            interpreter so nothing is already cached in sys.modules.
+
+Usage:      python benchmarks/startup.py [--runs N] [--top N]
+
+            SECRET_KEY and DATABASE_URL default to throwaway values if unset; no database
+            connection is made during startup. Set SCHEDULER_ENABLED=false to measure a
+            web-only worker.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter and prints its timings as JSON on the last line of stdout
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from app.application import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "create_app_s": created - imported}))
+"""
+
+
+def run_once():
+    """
+    Name:       run_once()
+    Purpose:    Starts a fresh interpreter with -X importtime, imports the app and calls
+                create_app(), and collects the timings.
+    Parameters: None
+    Returns:    tuple: (timings dict, {top-level package: cumulative import microseconds})
+    """
+
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark")
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # importtime lines look like "import time: self [us] | cumulative | <indent>package",
+    # indented two spaces per level; level 1 holds the imports made by app.application itself
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        if name.startswith("  ") and not name.startswith("   "):
+            top = name.strip().split(".")[0]
+            packages[top] = packages.get(top, 0) + int(cumulative)
+    return timings, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure DoseTracker startup time.")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the breakdown")
+    args = parser.parse_args()
+
+    import_times, create_times, package_times = [], [], {}
+    for _ in range(args.runs):
+        timings, packages = run_once()
+        import_times.append(timings["import_s"])
+        create_times.append(timings["create_app_s"])
+        for name, micros in packages.items():
+            package_times.setdefault(name, []).append(micros)
+
+    print(f"Runs: {args.runs}")
+    print(f"import app.application  median {statistics.median(import_times) * 1000:8.1f} ms")
+    print(f"create_app()            median {statistics.median(create_times) * 1000:8.1f} ms")
+    print(
+        f"total                   median "
+        f"{statistics.median(i + c for i, c in zip(import_times, create_times)) * 1000:8.1f} ms"
+    )
+
+    print("\nSlowest imports made by app.application (median cumulative):")
+    medians = sorted(
+        ((statistics.median(times), name) for name, times in package_times.items()),
+        reverse=True,
+    )
+    for micros, name in medians[: args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,8 +20,128 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     MAIL_SERVER_PASS = os.getenv('MS_PASSWORD')
+    MAIL_SERVER = os.getenv('MAIL_SERVER', 'mx3594.syd1.mymailhosting.com')
+    MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
     TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
     DT_SERVER_URL = os.getenv('DT_SERVER_URL')
     DT_SERVER_LOGO_PATH = os.getenv('DT_SERVER_LOGO_PATH')
+
+    # Response compression
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_BR_LEVEL = int(os.getenv('COMPRESS_BR_LEVEL', 5))
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+
+    # Cache of rendered my_medicine tables (FRAGMENT_CACHE_DIR enables the on-disk tier)
+    FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 512))
+    FRAGMENT_CACHE_DIR = os.getenv('FRAGMENT_CACHE_DIR')
+
+    # Cache of generated .ics calendar feeds, keyed by (user_id, schedule_version)
+    CALENDAR_CACHE_SIZE = int(os.getenv('CALENDAR_CACHE_SIZE', 512))
+
+    # Password hashing (PASSWORD_HASH_WORKERS=0 hashes inline on the request thread)
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Rate limits per endpoint, applied separately to each client IP and submitted email
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 10000))
+    RATE_LIMITS = {
+        'auth.login': os.getenv('RATE_LIMIT_LOGIN', '10/minute'),
+        'auth.sign_up': os.getenv('RATE_LIMIT_SIGN_UP', '5/hour'),
+        'auth.forgot_password': os.getenv('RATE_LIMIT_FORGOT_PASSWORD', '5/hour'),
+    }
+    # Endpoints that count against another endpoint's limit: the landing page is a second login form
+    RATE_LIMIT_BUCKETS = {
+        'main.index': 'auth.login',
+    }
+
+    # Number of reverse proxies in front of the app whose X-Forwarded-* headers are trusted, so
+    # request.remote_addr is the client's address rather than the proxy's. Leave at 0 when serving
+    # directly, or any client could choose its own address with an X-Forwarded-For header
+    PROXY_FIX_HOPS = int(os.getenv('PROXY_FIX_HOPS', 0))
+
+    # Background mail queue
+    MAIL_QUEUE_BATCH_SIZE = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 20))
+    MAIL_QUEUE_IDLE_TIMEOUT = float(os.getenv('MAIL_QUEUE_IDLE_TIMEOUT', 30))
+    MAIL_QUEUE_MAX_RETRIES = int(os.getenv('MAIL_QUEUE_MAX_RETRIES', 5))
+    MAIL_QUEUE_RETRY_BACKOFF = float(os.getenv('MAIL_QUEUE_RETRY_BACKOFF', 2))
+    MAIL_QUEUE_SHUTDOWN_TIMEOUT = float(os.getenv('MAIL_QUEUE_SHUTDOWN_TIMEOUT', 10))
+
+    # Per-request profiling (see `flask profile-token`); PROFILE_DIR defaults to instance/profiles
+    PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.getenv('PROFILE_DIR')
+    PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+    PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 7 * 86400))
+
+    # Request metrics, served in Prometheus format at /metrics to the listed addresses. With
+    # METRICS_TOKEN set, scrapers must also send it as 'Authorization: Bearer <token>'
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # N+1 query detection for development; QUERY_BUDGETS maps endpoints to a statement budget,
+    # e.g. {'medicines.my_medicine': 4}
+    QUERY_DEBUG = os.getenv('QUERY_DEBUG', 'false').lower() == 'true'
+    QUERY_DEBUG_MAX_REPEATS = int(os.getenv('QUERY_DEBUG_MAX_REPEATS', 2))
+    QUERY_BUDGETS = {}
+
+    # Run the reminder scheduler in this process (disable on web-only workers)
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+
+    # Cache of generated PDF reports (REPORT_CACHE_DIR enables the on-disk tier)
+    REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', 256))
+    REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR')
+
+    # Background report jobs (send_pdf): worker threads, seconds a finished job's state is kept,
+    # and seconds after which a job that stopped making progress (its worker restarted) is failed
+    REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', 2))
+    REPORT_JOB_RETENTION = int(os.getenv('REPORT_JOB_RETENTION', 7 * 86400))
+    REPORT_JOB_STALE_AFTER = int(os.getenv('REPORT_JOB_STALE_AFTER', 900))
+
+    # Bulk report generation (`flask reports batch`): render processes and users per bulk query
+    REPORT_BATCH_WORKERS = int(os.getenv('REPORT_BATCH_WORKERS', os.cpu_count() or 2))
+    REPORT_BATCH_CHUNK = int(os.getenv('REPORT_BATCH_CHUNK', 500))
+
+    # Wikipedia articles on the medicine details page: in-memory LRU over a SQLite file
+    # (WIKI_CACHE_PATH defaults to instance/wiki_cache.sqlite3). Stale articles are served while
+    # they refresh in the background. WIKI_SOURCE=fake serves the articles in WIKI_FAKE_PAGES.
+    WIKI_SOURCE = os.getenv('WIKI_SOURCE', 'wikipedia')
+    WIKI_FAKE_PAGES = os.getenv('WIKI_FAKE_PAGES')
+    WIKI_CACHE_PATH = os.getenv('WIKI_CACHE_PATH')
+    WIKI_CACHE_SIZE = int(os.getenv('WIKI_CACHE_SIZE', 256))
+    WIKI_CACHE_TTL = int(os.getenv('WIKI_CACHE_TTL', 7 * 86400))
+    WIKI_CACHE_MISSING_TTL = int(os.getenv('WIKI_CACHE_MISSING_TTL', 86400))
+    WIKI_REFRESH_WORKERS = int(os.getenv('WIKI_REFRESH_WORKERS', 2))
+    WIKI_WARM_CONCURRENCY = int(os.getenv('WIKI_WARM_CONCURRENCY', 4))
+
+    # Offline drug-information store with full-text search (`flask druginfo load`);
+    # defaults to instance/drug_info.sqlite3
+    DRUG_INFO_PATH = os.getenv('DRUG_INFO_PATH')
+
+    # In-memory medicines catalogue: seconds between checks for medicines added or renamed by
+    # other workers, and the most name suggestions returned in the add-medicine form
+    CATALOG_INDEX_REFRESH = int(os.getenv('CATALOG_INDEX_REFRESH', 5))
+    SUGGEST_LIMIT = int(os.getenv('SUGGEST_LIMIT', 10))
+
+    # Trigram similarity (0-1) above which a new medicine name is flagged as a possible duplicate
+    # in the add-medicine form, and above which `flask catalog merge` merges catalogue medicines
+    CATALOG_SIMILAR_THRESHOLD = float(os.getenv('CATALOG_SIMILAR_THRESHOLD', 0.4))
+    CATALOG_MERGE_THRESHOLD = float(os.getenv('CATALOG_MERGE_THRESHOLD', 0.8))
+
+    # Reminder channels: the most messages each channel sends at once, and how long a reminder
+    # waits for its slowest channel. Browser notifications need a VAPID key pair (generate one
+    # with `vapid --gen` from py-vapid) and a contact URL or mailto: for the push services.
+    NOTIFY_SMS_CONCURRENCY = int(os.getenv('NOTIFY_SMS_CONCURRENCY', 4))
+    NOTIFY_EMAIL_CONCURRENCY = int(os.getenv('NOTIFY_EMAIL_CONCURRENCY', 8))
+    NOTIFY_PUSH_CONCURRENCY = int(os.getenv('NOTIFY_PUSH_CONCURRENCY', 16))
+    NOTIFY_TIMEOUT = float(os.getenv('NOTIFY_TIMEOUT', 30))
+    VAPID_PUBLIC_KEY = os.getenv('VAPID_PUBLIC_KEY')
+    VAPID_PRIVATE_KEY = os.getenv('VAPID_PRIVATE_KEY')
+    VAPID_CLAIM_SUBJECT = os.getenv('VAPID_CLAIM_SUBJECT', 'mailto:dave@djrogers.net.au')
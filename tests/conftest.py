@@ -0,0 +1,134 @@
+"""
+conftest.py
+-----------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/conftest.py
+
+Purpose:    Shared pytest fixtures. The application is created once per session against a
+            throwaway SQLite database, with the scheduler off, mail suppressed and the fake
+            Wikipedia source, so the suite needs no MySQL, SMTP server or network. Every test
+            starts from empty tables.
+
+            Config is read from the environment when config.py is imported, so the environment
+            is set here, before anything imports the app.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import time
+
+import pytest
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+_scratch = tempfile.mkdtemp(prefix="dosetracker-tests-")
+_fake_pages = os.path.join(_scratch, "wiki_pages.json")
+with open(_fake_pages, "w", encoding="utf-8") as f:
+    json.dump({}, f)
+
+os.environ.update(
+    SECRET_KEY="test-secret-key",
+    DATABASE_URL=f"sqlite:///{os.path.join(_scratch, 'test.sqlite3')}",
+    DT_SERVER_LOGO_PATH=PROJECT_ROOT + os.sep,
+    BCRYPT_LOG_ROUNDS="4",
+    SCHEDULER_ENABLED="false",
+    WIKI_SOURCE="fake",
+    WIKI_FAKE_PAGES=_fake_pages,
+    WIKI_CACHE_PATH=os.path.join(_scratch, "wiki_cache.sqlite3"),
+    DRUG_INFO_PATH=os.path.join(_scratch, "drug_info.sqlite3"),
+)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app.application import create_app
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    app.extensions["mail"].suppress = True
+    return app
+
+
+@pytest.fixture(autouse=True)
+def db(app):
+    """Empty tables and caches for every test. The app context is only held while resetting."""
+    from app.extensions import db
+    from app.medicines.routes import calendar_feed_cache, medicine_table_cache
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+    # Cached pages are keyed by user id and version, which start over with the tables
+    for cache in (medicine_table_cache, calendar_feed_cache, app.extensions["report_cache"]):
+        cache.memory.clear()
+    app.extensions["rate_limiter"].reset()
+    return db
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app, db):
+    """Creates a user with the given medicines, each a (name, [(hour, minute), ...]) pair."""
+    from app.models import Medicine, UserMedicine, MedicationReminder, User
+
+    def make_user(email="patient@example.com", medicines=(), **fields):
+        with app.app_context():
+            user = User(email=email, password_hash="x", **fields)
+            db.session.add(user)
+            db.session.flush()
+            for name, times in medicines:
+                medicine = Medicine(name=name)
+                db.session.add(medicine)
+                db.session.flush()
+                user_medicine = UserMedicine(
+                    user_id=user.id,
+                    medicine_id=medicine.id,
+                    dosage="1 tablet",
+                    frequency="Once a Day",
+                )
+                db.session.add(user_medicine)
+                db.session.flush()
+                for hour, minute in times:
+                    db.session.add(
+                        MedicationReminder(
+                            user_id=user.id,
+                            user_medicine_id=user_medicine.id,
+                            reminder_time=time(hour, minute),
+                            reminder_message=f"Take {name}",
+                            status="pending",
+                        )
+                    )
+            db.session.commit()
+            app.extensions["medicine_index"].refresh()
+            return user.id
+
+    return make_user
+
+
+@pytest.fixture
+def login(client):
+    """Logs the test client in as a user, without going through the login form."""
+
+    def login(user_id):
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+
+    return login
@@ -0,0 +1,75 @@
+"""
+test_assets.py
+--------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_assets.py
+
+Purpose:    Fingerprinted static assets: the build's manifest and pre-compressed copies, and
+            serving those copies to clients that accept them.
+"""
+
+import gzip
+
+import brotli
+import pytest
+from flask import Flask
+
+from app.assets import ASSETS_DIST_DIR, IMMUTABLE_CACHE_CONTROL, build_manifest, init_assets
+
+
+STYLE = "body { color: #333; }\n" * 200
+
+
+@pytest.fixture
+def static_folder(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "style.css").write_text(STYLE)
+    (tmp_path / "img").mkdir()
+    (tmp_path / "img" / "logo.png").write_bytes(b"\x89PNG" + bytes(1000))
+    return tmp_path
+
+
+@pytest.fixture
+def asset_client(static_folder):
+    manifest = build_manifest(str(static_folder))
+    app = Flask(__name__, static_folder=str(static_folder), static_url_path="/static")
+    init_assets(app)
+    client = app.test_client()
+    client.style_url = f"/static/{ASSETS_DIST_DIR}/{manifest['css/style.css']}"
+    return client
+
+
+def test_the_build_fingerprints_assets_and_compresses_the_text_ones(static_folder):
+    manifest = build_manifest(str(static_folder))
+
+    style = static_folder / ASSETS_DIST_DIR / manifest["css/style.css"]
+    logo = static_folder / ASSETS_DIST_DIR / manifest["img/logo.png"]
+    assert style.read_text() == STYLE
+    assert brotli.decompress(style.with_name(style.name + ".br").read_bytes()) == STYLE.encode()
+    assert gzip.decompress(style.with_name(style.name + ".gz").read_bytes()) == STYLE.encode()
+    assert not logo.with_name(logo.name + ".br").exists()
+
+
+@pytest.mark.parametrize(
+    "accept, encoding, decompress",
+    [("gzip, deflate, br", "br", brotli.decompress), ("gzip", "gzip", gzip.decompress)],
+)
+def test_accepting_clients_get_the_precompressed_copy(asset_client, accept, encoding, decompress):
+    response = asset_client.get(asset_client.style_url, headers={"Accept-Encoding": accept})
+
+    assert response.headers["Content-Encoding"] == encoding
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.mimetype == "text/css"
+    assert decompress(response.get_data()) == STYLE.encode()
+    response.close()
+
+
+def test_other_clients_get_the_plain_file(asset_client):
+    response = asset_client.get(asset_client.style_url, headers={"Accept-Encoding": "identity"})
+
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data(as_text=True) == STYLE
+    response.close()
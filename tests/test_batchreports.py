@@ -0,0 +1,60 @@
+"""
+test_batchreports.py
+--------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_batchreports.py
+
+Purpose:    Bulk report generation: every user gets a report, and emailed reports are queued a
+            chunk at a time so the mail queue never holds more than one chunk of attachments.
+"""
+
+import os
+
+from app import batchreports
+from app.batchreports import run_batch
+
+
+class RecordingMailQueue:
+    """Stands in for the mail queue, recording how many reports were waiting at once."""
+
+    def __init__(self):
+        self.pending = []
+        self.delivered = []
+        self.most_pending = 0
+
+    def send(self, message, callback=None):
+        self.pending.append(message)
+        self.most_pending = max(self.most_pending, len(self.pending))
+
+    def flush(self, timeout=None):
+        self.delivered.extend(self.pending)
+        self.pending = []
+        return True
+
+
+def test_reports_are_written_for_every_user(app, make_user, tmp_path):
+    user_ids = [
+        make_user(email=f"user{n}@example.com", medicines=[("Aspirin", [(8, 0)])])
+        for n in range(3)
+    ]
+
+    with app.app_context():
+        stats = run_batch(user_ids, output_dir=str(tmp_path), workers=0, chunk_size=2)
+
+    assert stats["documents"] == 3
+    assert sorted(os.listdir(tmp_path))[0].startswith(f"report-{user_ids[0]}-")
+    assert all(path.read_bytes().startswith(b"%PDF") for path in tmp_path.iterdir())
+
+
+def test_emailed_reports_wait_for_the_previous_chunk(app, make_user, monkeypatch):
+    user_ids = [make_user(email=f"user{n}@example.com") for n in range(5)]
+    queue = RecordingMailQueue()
+    monkeypatch.setattr(batchreports, "mail_queue", queue)
+
+    with app.app_context():
+        run_batch(user_ids, send_email=True, workers=0, chunk_size=2)
+
+    assert queue.most_pending == 2
+    assert len(queue.delivered) + len(queue.pending) == 5
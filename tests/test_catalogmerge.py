@@ -0,0 +1,125 @@
+"""
+test_catalogmerge.py
+--------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_catalogmerge.py
+
+Purpose:    Finding and merging duplicate catalogue medicines, including users who take more than
+            one medicine of a merged group.
+"""
+
+from datetime import datetime, time
+
+import pytest
+
+from app.catalogmerge import find_duplicates, merge_duplicates
+from app.models import DoseHistory, MedicationReminder, Medicine, User, UserMedicine
+
+
+@pytest.fixture
+def medicines(app_context, db):
+    names = ["Paracetamol", "Paracetmol", "paracetamol ", "Prednisone"]
+    rows = [Medicine(name=name) for name in names]
+    db.session.add_all(rows)
+    db.session.commit()
+    return {name.strip(): row.id for name, row in zip(names, rows)}
+
+
+def take(db, user_id, medicine_id, hour):
+    user_medicine = UserMedicine(
+        user_id=user_id, medicine_id=medicine_id, dosage="1 tablet", frequency="Once a Day"
+    )
+    db.session.add(user_medicine)
+    db.session.flush()
+    db.session.add(
+        MedicationReminder(
+            user_id=user_id,
+            user_medicine_id=user_medicine.id,
+            reminder_time=time(hour, 0),
+            reminder_message="Take it",
+            status="pending",
+        )
+    )
+    db.session.commit()
+    return user_medicine.id
+
+
+def user_medicines(user_id):
+    return {
+        user_medicine.id: (
+            user_medicine.medicine_id,
+            sorted(reminder.reminder_time.hour for reminder in user_medicine.reminders),
+        )
+        for user_medicine in UserMedicine.query.filter_by(user_id=user_id)
+    }
+
+
+def test_similar_names_are_grouped_under_the_most_used(make_user, medicines, db):
+    take(db, make_user(email="a@example.com"), medicines["Paracetamol"], 8)
+    take(db, make_user(email="b@example.com"), medicines["Paracetamol"], 8)
+    take(db, make_user(email="c@example.com"), medicines["Paracetmol"], 8)
+
+    groups = find_duplicates(0.5)
+
+    assert [
+        (canonical[1], sorted(name for _, name, _ in duplicates))
+        for canonical, duplicates in groups
+    ] == [("Paracetamol", ["Paracetmol", "paracetamol "])]
+
+
+def test_merging_repoints_users_and_removes_the_duplicates(make_user, medicines, db):
+    user_id = make_user()
+    user_medicine_id = take(db, user_id, medicines["Paracetmol"], 8)
+    take(db, make_user(email="other@example.com"), medicines["Paracetamol"], 8)
+
+    stats = merge_duplicates(find_duplicates(0.5))
+
+    assert stats == {
+        "medicines_removed": 2,
+        "user_medicines_repointed": 1,
+        "user_medicines_combined": 0,
+    }
+    assert user_medicines(user_id) == {user_medicine_id: (medicines["Paracetamol"], [8])}
+    assert db.session.get(Medicine, medicines["Paracetmol"]) is None
+    assert db.session.get(Medicine, medicines["Prednisone"]) is not None
+
+
+def test_a_user_taking_two_duplicates_keeps_one_entry_with_all_reminders(make_user, medicines, db):
+    user_id = make_user()
+    kept_id = take(db, user_id, medicines["Paracetamol"], 8)
+    duplicate_id = take(db, user_id, medicines["Paracetmol"], 20)
+    take(db, make_user(email="other@example.com"), medicines["Paracetamol"], 8)
+    db.session.add(
+        DoseHistory(
+            user_id=user_id,
+            user_medicine_id=duplicate_id,
+            medicine_name="Paracetmol",
+            reminder_time=time(20, 0),
+            sent_at=datetime(2026, 10, 18, 20, 0),
+        )
+    )
+    db.session.commit()
+    version = db.session.get(User, user_id).schedule_version
+
+    stats = merge_duplicates(find_duplicates(0.5))
+    db.session.expire_all()
+
+    assert stats["user_medicines_combined"] == 1
+    assert user_medicines(user_id) == {kept_id: (medicines["Paracetamol"], [8, 20])}
+    assert DoseHistory.query.one().user_medicine_id == kept_id
+    assert db.session.get(User, user_id).schedule_version > version
+
+
+def test_a_user_with_only_duplicates_keeps_their_first_entry(make_user, medicines, db):
+    user_id = make_user()
+    first_id = take(db, user_id, medicines["Paracetmol"], 8)
+    take(db, user_id, medicines["paracetamol"], 20)
+    for n in range(2):
+        take(db, make_user(email=f"other{n}@example.com"), medicines["Paracetamol"], 8)
+
+    merge_duplicates(find_duplicates(0.5))
+    db.session.expire_all()
+
+    assert user_medicines(user_id) == {first_id: (medicines["Paracetamol"], [8, 20])}
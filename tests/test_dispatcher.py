@@ -0,0 +1,159 @@
+"""
+test_dispatcher.py
+------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_dispatcher.py
+
+Purpose:    The reminder dispatcher's day plan: which reminders come due, and how edits are
+            picked up - one user at a time from the schedule_changed_at watermark, or with a full
+            rebuild when more than FULL_REBUILD_FRACTION of the plan's users have changed.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from app import dispatcher as dispatcher_module
+from app.dispatcher import ReminderDispatcher
+from app.models import MedicationReminder, User
+from app.querybudget import query_budget
+
+
+DAY = date(2026, 10, 19)
+
+
+@pytest.fixture
+def users(make_user, app_context):
+    # Ten users, user n with one reminder at 08:0n
+    return [
+        make_user(email=f"user{n}@example.com", medicines=[(f"Medicine {n}", [(8, n)])])
+        for n in range(10)
+    ]
+
+
+@pytest.fixture
+def dispatcher(users):
+    # The first tick of the day builds the plan
+    dispatcher = ReminderDispatcher()
+    dispatcher.due(datetime.combine(DAY, time(0, 0)))
+    return dispatcher
+
+
+def move_reminders(db, user_ids, minute):
+    MedicationReminder.query.filter(MedicationReminder.user_id.in_(user_ids)).update(
+        {MedicationReminder.reminder_time: time(9, minute)}, synchronize_session=False
+    )
+    User.bump_data_version(user_ids)
+    db.session.commit()
+
+
+def test_due_returns_each_minutes_reminders_once(dispatcher, users):
+    first_tick = dispatcher.due(datetime.combine(DAY, time(8, 0)))
+    next_tick = dispatcher.due(datetime.combine(DAY, time(8, 2)))
+
+    assert [(due_time, list(slot)) for due_time, slot in first_tick] == [(time(8, 0), [users[0]])]
+    assert [due_time for due_time, _ in next_tick] == [time(8, 1), time(8, 2)]
+    assert dispatcher.due(datetime.combine(DAY, time(8, 2))) == []
+
+
+def test_the_first_tick_only_sends_the_current_minute(users):
+    dispatcher = ReminderDispatcher()
+
+    due = dispatcher.due(datetime.combine(DAY, time(8, 5)))
+
+    assert [due_time for due_time, _ in due] == [time(8, 5)]
+
+
+def test_a_tick_without_changes_costs_one_query(dispatcher):
+    with query_budget(1):
+        dispatcher.due(datetime.combine(DAY, time(7, 1)))
+    assert dispatcher.updates == 0
+
+
+def test_a_few_changed_users_are_updated_in_place(dispatcher, users, db):
+    move_reminders(db, users[:3], 30)
+
+    assert dispatcher.update() == 3
+    assert dispatcher.rebuilds == 1
+    assert dispatcher.updates == 3
+    assert set(dispatcher.slots[9 * 60 + 30]) == set(users[:3])
+    assert 8 * 60 not in dispatcher.slots
+
+
+def test_more_than_the_fraction_changed_rebuilds_the_plan(dispatcher, users, db):
+    changed = int(len(users) * dispatcher_module.FULL_REBUILD_FRACTION) + 1
+    move_reminders(db, users[:changed], 30)
+
+    assert dispatcher.update() == changed
+    assert dispatcher.rebuilds == 2
+    assert dispatcher.updates == 0
+    assert set(dispatcher.slots[9 * 60 + 30]) == set(users[:changed])
+
+
+def test_exactly_the_fraction_changed_is_still_updated_in_place(dispatcher, users, db):
+    changed = int(len(users) * dispatcher_module.FULL_REBUILD_FRACTION)
+    move_reminders(db, users[:changed], 30)
+
+    dispatcher.update()
+
+    assert dispatcher.rebuilds == 1
+    assert dispatcher.updates == changed
+
+
+def test_the_rebuild_threshold_follows_the_setting(dispatcher, users, db, monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "FULL_REBUILD_FRACTION", 0.2)
+    move_reminders(db, users[:3], 30)
+
+    dispatcher.update()
+
+    assert dispatcher.rebuilds == 2
+
+
+def test_sending_reminders_does_not_reload_anyone(dispatcher, users, db):
+    User.bump_data_version(users, status_only=True)
+    db.session.commit()
+
+    assert dispatcher.update() == 0
+    assert dispatcher.updates == 0
+
+
+def test_an_edit_committed_out_of_order_is_still_seen(dispatcher, users, db):
+    move_reminders(db, users[:1], 30)
+    dispatcher.update()
+
+    # A slower transaction stamped before the watermark, but committed after it moved
+    stamped = dispatcher._watermark - dispatcher_module.WATERMARK_OVERLAP / 2
+    MedicationReminder.query.filter_by(user_id=users[1]).update(
+        {MedicationReminder.reminder_time: time(9, 45)}
+    )
+    User.query.filter_by(id=users[1]).update(
+        {User.schedule_version: User.schedule_version + 1, User.schedule_changed_at: stamped}
+    )
+    db.session.commit()
+
+    assert dispatcher.update() == 1
+    assert users[1] in dispatcher.slots[9 * 60 + 45]
+
+
+def test_updates_leave_the_same_plan_as_a_rebuild(dispatcher, users, db):
+    move_reminders(db, users[:2], 30)
+    dispatcher.update()
+    MedicationReminder.query.filter_by(user_id=users[4]).delete()
+    User.bump_data_version([users[4]])
+    db.session.commit()
+    dispatcher.update()
+
+    rebuilt = ReminderDispatcher()
+    rebuilt.rebuild(DAY)
+
+    assert dispatcher.minutes == rebuilt.minutes
+    assert dispatcher.slots == rebuilt.slots
+
+
+def test_a_new_day_rebuilds_the_plan(dispatcher):
+    dispatcher.due(datetime.combine(DAY + timedelta(days=1), time(7, 0)))
+
+    assert dispatcher.day == DAY + timedelta(days=1)
+    assert dispatcher.rebuilds == 2
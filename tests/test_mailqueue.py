@@ -0,0 +1,122 @@
+"""
+test_mailqueue.py
+-----------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_mailqueue.py
+
+Purpose:    The background mail queue, run against the in-process SMTP server in local_smtp.py:
+            batching over one connection, retries with backoff, and the delivery callbacks the
+            report jobs rely on for their "sent" and "failed" states.
+"""
+
+import time
+
+import pytest
+from flask import Flask
+from flask_mail import Mail, Message
+
+from app.local_smtp import LocalSMTPServer
+from app.mailqueue import MailQueue
+
+
+@pytest.fixture
+def smtp_server():
+    server = LocalSMTPServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mail_queue(smtp_server):
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=smtp_server.port,
+        MAIL_QUEUE_BATCH_SIZE=20,
+        MAIL_QUEUE_IDLE_TIMEOUT=30,
+        MAIL_QUEUE_MAX_RETRIES=2,
+        MAIL_QUEUE_RETRY_BACKOFF=0.1,
+        MAIL_QUEUE_SHUTDOWN_TIMEOUT=5,
+    )
+    mail_queue = MailQueue()
+    mail_queue.init_app(app, Mail(app))
+    yield mail_queue
+    mail_queue.stop(5)
+
+
+def message(n):
+    return Message(
+        f"Message {n}",
+        sender="dosetracker@example.com",
+        recipients=[f"user{n}@example.com"],
+        body="Hello",
+    )
+
+
+def test_queued_messages_are_sent_over_one_connection(mail_queue, smtp_server):
+    for n in range(5):
+        mail_queue.send(message(n))
+
+    assert mail_queue.flush(5)
+    assert [received.subject for received in smtp_server.messages] == [
+        f"Message {n}" for n in range(5)
+    ]
+    assert smtp_server.connections == 1
+    assert mail_queue.sent == 5
+
+
+def test_the_connection_is_closed_when_idle_and_reopened(mail_queue, smtp_server):
+    mail_queue.app.config["MAIL_QUEUE_IDLE_TIMEOUT"] = 0.1
+    mail_queue.send(message(1))
+    mail_queue.flush(5)
+    time.sleep(0.3)
+
+    mail_queue.send(message(2))
+
+    assert mail_queue.flush(5)
+    assert smtp_server.connections == 2
+
+
+def test_a_failed_message_is_retried_after_a_backoff(mail_queue, smtp_server):
+    results = []
+    smtp_server.fail_next = 2
+    started = time.monotonic()
+
+    mail_queue.send(message(1), callback=results.append)
+
+    assert mail_queue.flush(5)
+    # Backoff of 0.1s, then 0.2s
+    assert time.monotonic() - started >= 0.3
+    assert results == [None]
+    assert [received.subject for received in smtp_server.messages] == ["Message 1"]
+    assert (mail_queue.sent, mail_queue.failed) == (1, 0)
+
+
+def test_a_message_is_given_up_after_its_last_retry(mail_queue, smtp_server):
+    results = []
+    smtp_server.fail_next = 3
+
+    mail_queue.send(message(1), callback=results.append)
+
+    assert mail_queue.flush(5)
+    # The first attempt and MAIL_QUEUE_MAX_RETRIES retries all failed
+    assert len(results) == 1 and isinstance(results[0], Exception)
+    assert smtp_server.messages == []
+    assert (mail_queue.sent, mail_queue.failed) == (0, 1)
+
+
+def test_stopping_sends_what_is_queued_and_abandons_retries(mail_queue, smtp_server):
+    results = []
+    mail_queue.app.config["MAIL_QUEUE_RETRY_BACKOFF"] = 30
+    smtp_server.fail_next = 1
+
+    mail_queue.send(message(1), callback=results.append)
+    mail_queue.send(message(2), callback=results.append)
+    mail_queue.stop(5)
+
+    assert [received.subject for received in smtp_server.messages] == ["Message 2"]
+    assert results[0] is None
+    assert isinstance(results[1], RuntimeError)
+    assert mail_queue.flush(0)
@@ -0,0 +1,148 @@
+"""
+test_metrics.py
+---------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_metrics.py
+
+Purpose:    Request metrics, collected locally: requests are made against a small app with
+            metrics enabled, and its /metrics output is read back with parse_metrics(). Covers
+            the histograms, the address allowlist and the scrape token.
+"""
+
+import pytest
+import sqlalchemy
+from flask import Blueprint, Flask
+
+from app.metrics import init_metrics, parse_metrics
+
+
+ENDPOINT = (("blueprint", "demo"), ("endpoint", "demo.items"), ("method", "GET"))
+
+
+@pytest.fixture(scope="module")
+def metrics_app():
+    engine = sqlalchemy.create_engine("sqlite://")
+    demo = Blueprint("demo", __name__)
+
+    @demo.route("/items/<int:count>")
+    def items(count):
+        with engine.connect() as connection:
+            for _ in range(count):
+                connection.execute(sqlalchemy.text("SELECT 1"))
+        return "x" * 2000
+
+    app = Flask(__name__)
+    app.config.update(
+        METRICS_ENABLED=True, METRICS_ALLOWED_IPS=["127.0.0.1", "::1"], METRICS_TOKEN=None
+    )
+    app.register_blueprint(demo)
+    init_metrics(app)
+    return app
+
+
+@pytest.fixture
+def metrics_client(metrics_app, monkeypatch):
+    monkeypatch.setitem(metrics_app.config, "METRICS_TOKEN", None)
+    client = metrics_app.test_client()
+    # Each test reads only the requests it made itself
+    before = parse_metrics(client.get("/metrics").get_data(as_text=True))
+
+    def scrape():
+        after = parse_metrics(client.get("/metrics").get_data(as_text=True))
+        return {key: value - before.get(key, 0) for key, value in after.items()}
+
+    client.scrape = scrape
+    return client
+
+
+def sample(samples, name, **labels):
+    return samples[(name, frozenset(ENDPOINT + tuple(labels.items())))]
+
+
+def test_requests_are_counted_by_endpoint_and_status(metrics_client):
+    for count in (1, 3):
+        metrics_client.get(f"/items/{count}")
+    metrics_client.get("/missing")
+
+    samples = metrics_client.scrape()
+
+    assert sample(samples, "dosetracker_requests_total", status="200") == 2
+    unmatched = frozenset(
+        {("blueprint", ""), ("endpoint", "unmatched"), ("method", "GET"), ("status", "404")}
+    )
+    assert samples[("dosetracker_requests_total", unmatched)] == 1
+
+
+def test_query_counts_fall_into_their_histogram_buckets(metrics_client):
+    for count in (1, 3, 30):
+        metrics_client.get(f"/items/{count}")
+
+    samples = metrics_client.scrape()
+
+    buckets = {
+        le: sample(samples, "dosetracker_request_queries_bucket", le=le)
+        for le in ("1", "2", "5", "50", "+Inf")
+    }
+    assert buckets == {"1": 1, "2": 1, "5": 2, "50": 3, "+Inf": 3}
+    assert sample(samples, "dosetracker_request_queries_sum") == 34
+    assert sample(samples, "dosetracker_request_queries_count") == 3
+
+
+def test_latency_db_time_and_size_are_recorded(metrics_client):
+    metrics_client.get("/items/2")
+
+    samples = metrics_client.scrape()
+
+    assert sample(samples, "dosetracker_request_duration_seconds_count") == 1
+    assert sample(samples, "dosetracker_request_duration_seconds_sum") > 0
+    assert 0 < sample(samples, "dosetracker_request_db_seconds_sum") <= sample(
+        samples, "dosetracker_request_duration_seconds_sum"
+    )
+    assert sample(samples, "dosetracker_response_size_bytes_bucket", le="4096") == 1
+    assert sample(samples, "dosetracker_response_size_bytes_bucket", le="1024") == 0
+
+
+def test_scrapes_are_not_counted(metrics_client):
+    metrics_client.get("/metrics")
+
+    assert not any(
+        ("endpoint", "metrics") in labels for _, labels in metrics_client.scrape()
+    )
+
+
+def test_addresses_outside_the_allowlist_are_refused(metrics_client):
+    response = metrics_client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.5"})
+
+    assert response.status_code == 404
+
+
+def test_the_scrape_token_is_required_when_set(metrics_client, metrics_app):
+    metrics_app.config["METRICS_TOKEN"] = "scrape-secret"
+
+    assert metrics_client.get("/metrics").status_code == 404
+    wrong = {"Authorization": "Bearer guess"}
+    assert metrics_client.get("/metrics", headers=wrong).status_code == 404
+    right = {"Authorization": "Bearer scrape-secret"}
+    response = metrics_client.get("/metrics", headers=right)
+    assert response.status_code == 200
+    assert "dosetracker_requests_total" in response.get_data(as_text=True)
+
+
+def test_metrics_are_off_by_default(client):
+    assert client.get("/metrics").status_code == 404
+
+
+def test_parse_metrics_reads_labels_and_values():
+    text = (
+        "# HELP x_total Things.\n"
+        "# TYPE x_total counter\n"
+        'x_total{path="/a,b",status="200"} 3\n'
+        "y_seconds 0.25\n"
+    )
+
+    assert parse_metrics(text) == {
+        ("x_total", frozenset({("path", "/a,b"), ("status", "200")})): 3.0,
+        ("y_seconds", frozenset()): 0.25,
+    }
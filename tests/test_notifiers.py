@@ -0,0 +1,120 @@
+"""
+test_notifiers.py
+-----------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_notifiers.py
+
+Purpose:    notify(), which sends one reminder on all of a user's channels at once and waits
+            for them together, giving up on a channel that takes longer than the timeout.
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.notifiers import Notifier, Recipient, notify
+
+
+RECIPIENT = Recipient(
+    user_id=1, phone_number="0400000000", email="a@example.com", push_subscriptions=[]
+)
+
+
+class FakeNotifier(Notifier):
+    """A channel whose send() runs the given function."""
+
+    def __init__(self, app, channel, send=None, reachable=True):
+        self.channel = channel
+        super().__init__(app, concurrency=1)
+        self._send = send or (lambda: None)
+        self.reachable = reachable
+        self.calls = 0
+
+    def can_reach(self, recipient):
+        return self.reachable
+
+    def send(self, recipient, subject, body):
+        self.calls += 1
+        self._send()
+
+
+@pytest.fixture
+def release():
+    # Lets a blocked channel finish once the test is done with it
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def fail():
+    raise ConnectionError("provider unavailable")
+
+
+def test_delivers_on_every_channel(app):
+    notifiers = {channel: FakeNotifier(app, channel) for channel in ("sms", "email", "push")}
+
+    delivered = notify(notifiers, RECIPIENT, ["push", "sms", "email"], "Reminder", "Take it", 5)
+
+    assert delivered == ["email", "push", "sms"]
+
+
+def test_a_slow_channel_times_out_without_holding_up_the_others(app, release):
+    notifiers = {
+        "sms": FakeNotifier(app, "sms", send=lambda: release.wait(10)),
+        "email": FakeNotifier(app, "email"),
+    }
+
+    started = time.monotonic()
+    delivered = notify(notifiers, RECIPIENT, ["sms", "email"], "Reminder", "Take it", 0.2)
+    elapsed = time.monotonic() - started
+
+    assert delivered == ["email"]
+    assert 0.2 <= elapsed < 2
+
+
+def test_channels_wait_together_not_one_after_another(app):
+    notifiers = {
+        channel: FakeNotifier(app, channel, send=lambda: time.sleep(0.3))
+        for channel in ("sms", "email", "push")
+    }
+
+    started = time.monotonic()
+    delivered = notify(notifiers, RECIPIENT, ["sms", "email", "push"], "Reminder", "Take it", 5)
+
+    assert delivered == ["email", "push", "sms"]
+    assert time.monotonic() - started < 0.8
+
+
+def test_a_failing_channel_is_left_out(app):
+    notifiers = {
+        "sms": FakeNotifier(app, "sms", send=fail),
+        "email": FakeNotifier(app, "email"),
+    }
+
+    delivered = notify(notifiers, RECIPIENT, ["sms", "email"], "Reminder", "Take it", 5)
+
+    assert delivered == ["email"]
+    assert notifiers["sms"].stats()["failed"] == 1
+    assert notifiers["email"].stats()["sent"] == 1
+
+
+def test_unconfigured_and_unreachable_channels_are_skipped(app):
+    notifiers = {
+        "email": FakeNotifier(app, "email"),
+        "push": FakeNotifier(app, "push", reachable=False),
+    }
+
+    delivered = notify(notifiers, RECIPIENT, ["sms", "email", "push"], "Reminder", "Take it", 5)
+
+    assert delivered == ["email"]
+    assert notifiers["push"].calls == 0
+
+
+def test_no_channels_returns_at_once(app):
+    started = time.monotonic()
+
+    assert notify({}, RECIPIENT, ["sms"], "Reminder", "Take it", 5) == []
+    assert time.monotonic() - started < 0.5
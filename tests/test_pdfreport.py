@@ -0,0 +1,49 @@
+"""
+test_pdfreport.py
+-----------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_pdfreport.py
+
+Purpose:    The PDF report layout: the first page's table sits below the title band, and later
+            pages use the full page height.
+"""
+
+import re
+from io import BytesIO
+
+from app.pdfreport import ROW_HEIGHT, TITLE_HEIGHT, ReportDocTemplate, render_pdf
+
+
+def page_count(pdf_data):
+    return len(re.findall(rb"/Type /Page[^s]", pdf_data))
+
+
+def rows(count):
+    return [
+        {"name": f"Medicine {i}", "dosage": "1 tablet", "frequency": "Daily", "notes": ""}
+        for i in range(count)
+    ]
+
+
+def test_the_first_page_table_starts_below_the_title_band():
+    first, later = ReportDocTemplate(BytesIO(), "a@example.com", logo=None).pageTemplates
+    first_frame, later_frame = first.frames[0], later.frames[0]
+
+    # The subtitle is drawn 20pt below the title band
+    assert first_frame._y2 < TITLE_HEIGHT - 20
+    assert later_frame._y2 > TITLE_HEIGHT
+    assert later_frame._y1 == first_frame._y1
+
+
+def test_later_pages_hold_more_rows_than_the_first():
+    doc = ReportDocTemplate(BytesIO(), "a@example.com", logo=None)
+    first_rows = int(doc.pageTemplates[0].frames[0]._height // ROW_HEIGHT) - 1
+    later_rows = int(doc.pageTemplates[1].frames[0]._height // ROW_HEIGHT) - 1
+    assert later_rows > first_rows
+
+    assert page_count(render_pdf("a@example.com", rows(first_rows))) == 1
+    assert page_count(render_pdf("a@example.com", rows(first_rows + 1))) == 2
+    assert page_count(render_pdf("a@example.com", rows(first_rows + later_rows))) == 2
+    assert page_count(render_pdf("a@example.com", rows(first_rows + later_rows + 1))) == 3
@@ -0,0 +1,74 @@
+"""
+test_query_budgets.py
+---------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_query_budgets.py
+
+Purpose:    Query budgets for the medicine list, the medicine JSON endpoints and the PDF report.
+            Each must issue a fixed number of statements however many medicines and reminders the
+            user has, so an N+1 pattern fails here with query_budget()'s per-statement report.
+"""
+
+import pytest
+
+from app.application import generate_pdf
+from app.querybudget import QueryRecorder, query_budget
+
+
+def medicines(count):
+    return [(f"Medicine {i}", [(8, 0), (20, 0)]) for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 25])
+def test_my_medicine_stays_within_budget(client, make_user, login, count):
+    login(make_user(medicines=medicines(count)))
+
+    with query_budget(4, max_repeats=1):
+        response = client.get("/medicines/my_medicine")
+
+    assert response.status_code == 200
+    assert response.data.count(b"Medicine ") >= count
+
+
+def test_my_medicine_query_count_does_not_grow_with_medicines(client, make_user, login):
+    counts = []
+    for count in (1, 25):
+        login(make_user(email=f"user{count}@example.com", medicines=medicines(count)))
+        with QueryRecorder() as recorder:
+            client.get("/medicines/my_medicine")
+        counts.append(recorder.count)
+
+    assert counts[0] == counts[1]
+
+
+def test_my_medicine_serves_cached_table_without_loading_medicines(client, make_user, login):
+    login(make_user(medicines=medicines(5)))
+    client.get("/medicines/my_medicine")
+
+    # Only the logged-in user is loaded
+    with query_budget(1):
+        client.get("/medicines/my_medicine")
+
+
+@pytest.mark.parametrize("count", [1, 25])
+def test_generate_pdf_stays_within_budget(app, make_user, count):
+    user_id = make_user(medicines=medicines(count))
+
+    with app.app_context(), query_budget(2, max_repeats=1):
+        pdf_data = generate_pdf(user_id)
+
+    assert pdf_data.startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("path", ["/medicines/api/medicines", "/medicines/update_medicine"])
+@pytest.mark.parametrize("count", [1, 25])
+def test_medicine_json_endpoints_stay_within_budget(client, make_user, login, path, count):
+    login(make_user(medicines=medicines(count)))
+
+    with query_budget(3, max_repeats=1):
+        response = client.get(path)
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == count * (2 if path.endswith("update_medicine") else 1)
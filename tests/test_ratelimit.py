@@ -0,0 +1,106 @@
+"""
+test_ratelimit.py
+-----------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_ratelimit.py
+
+Purpose:    The sliding-window rate limiter, and the login limit shared by the login form and
+            the landing page.
+"""
+
+import pytest
+
+from app.ratelimit import SlidingWindowLimiter, parse_limit
+
+
+@pytest.mark.parametrize(
+    "limit, expected",
+    [("10/minute", (10, 60)), ("5 per hour", (5, 3600)), ("100/days", (100, 86400))],
+)
+def test_parse_limit(limit, expected):
+    assert parse_limit(limit) == expected
+
+
+def test_parse_limit_rejects_unknown_periods():
+    with pytest.raises(ValueError):
+        parse_limit("10/fortnight")
+
+
+def test_hits_over_the_limit_are_refused_until_the_window_passes():
+    limiter = SlidingWindowLimiter()
+
+    assert [limiter.hit("key", 3, 60, now=now)[0] for now in (0, 1, 2)] == [True] * 3
+    assert limiter.hit("key", 3, 60, now=3) == (False, 57)
+
+
+def test_the_previous_window_is_weighted_by_its_overlap():
+    limiter = SlidingWindowLimiter()
+    for now in range(4):
+        limiter.hit("key", 3, 60, now=now)
+
+    # Half way through the next window the previous window's 4 hits count as 2
+    assert limiter.hit("key", 3, 60, now=90) == (True, 0)
+    assert limiter.hit("key", 3, 60, now=90)[0] is False
+
+
+def test_the_previous_window_has_almost_no_weight_at_the_end_of_the_next():
+    limiter = SlidingWindowLimiter()
+    for now in range(4):
+        limiter.hit("key", 3, 60, now=now)
+
+    assert [limiter.hit("key", 3, 60, now=119)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_counts_older_than_one_window_are_forgotten():
+    limiter = SlidingWindowLimiter()
+    for now in range(10):
+        limiter.hit("key", 3, 60, now=now)
+
+    assert limiter.hit("key", 3, 60, now=130) == (True, 0)
+
+
+def test_keys_are_limited_independently():
+    limiter = SlidingWindowLimiter()
+    limiter.hit("a", 1, 60, now=0)
+
+    assert limiter.hit("a", 1, 60, now=1)[0] is False
+    assert limiter.hit("b", 1, 60, now=1)[0] is True
+
+
+def test_the_least_recently_used_key_is_evicted():
+    limiter = SlidingWindowLimiter(max_keys=2)
+    limiter.hit("a", 1, 60, now=0)
+    limiter.hit("b", 1, 60, now=0)
+    limiter.hit("a", 1, 60, now=1)  # refused, but makes "a" the most recently used
+    limiter.hit("c", 1, 60, now=2)
+
+    assert limiter.hit("a", 1, 60, now=3)[0] is False
+    assert limiter.hit("b", 1, 60, now=3)[0] is True
+
+
+def test_login_attempts_share_one_limit_across_both_login_forms(client):
+    def attempt(path, email):
+        return client.post(path, data={"email": email, "password": "wrong"}).status_code
+
+    statuses = [
+        attempt("/" if i % 2 else "/auth/login", f"user{i}@example.com") for i in range(11)
+    ]
+
+    assert 429 not in statuses[:10]
+    assert statuses[10] == 429
+
+
+def test_a_forged_forwarded_for_header_does_not_reset_the_limit(client):
+    # With no PROXY_FIX_HOPS configured the header comes from the client and is ignored
+    statuses = [
+        client.post(
+            "/auth/login",
+            data={"email": f"user{i}@example.com", "password": "wrong"},
+            headers={"X-Forwarded-For": f"10.0.0.{i}"},
+        ).status_code
+        for i in range(11)
+    ]
+
+    assert statuses[10] == 429
@@ -0,0 +1,119 @@
+"""
+test_reconcile_reminders.py
+---------------------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_reconcile_reminders.py
+
+Purpose:    reconcile_reminders(), which applies the edit medicine form's reminders to the
+            database by reminder id, writing only what changed.
+"""
+
+from datetime import time
+
+import pytest
+
+from app.models import MedicationReminder, UserMedicine
+
+
+@pytest.fixture
+def reconcile_reminders(app):
+    # The route modules read the app's config at import, so import once it exists
+    from app.medicines.routes import reconcile_reminders
+
+    return reconcile_reminders
+
+
+@pytest.fixture
+def user_medicine(make_user, app_context, db):
+    user_id = make_user(medicines=[("Aspirin", [(8, 0), (14, 0)])])
+    return UserMedicine.query.filter_by(user_id=user_id).one()
+
+
+def submitted_as_stored(user_medicine):
+    reminders = sorted(user_medicine.reminders, key=lambda reminder: reminder.id)
+    return [
+        (reminder.id, f"{reminder.reminder_time:%H:%M}", reminder.reminder_message, "pending")
+        for reminder in reminders
+    ]
+
+
+def stored(user_medicine_id):
+    return [
+        (reminder.reminder_time, reminder.reminder_message, reminder.status)
+        for reminder in MedicationReminder.query.filter_by(user_medicine_id=user_medicine_id)
+        .order_by(MedicationReminder.id)
+    ]
+
+
+def test_unchanged_reminders_are_not_written(reconcile_reminders, user_medicine, db):
+    submitted = submitted_as_stored(user_medicine)
+
+    counts = reconcile_reminders(user_medicine, submitted)
+
+    assert counts == {"created": 0, "updated": 0, "deleted": 0}
+    assert not db.session.dirty
+
+
+def test_reminders_are_matched_by_id_not_position(reconcile_reminders, user_medicine):
+    submitted = list(reversed(submitted_as_stored(user_medicine)))
+
+    assert reconcile_reminders(user_medicine, submitted) == {
+        "created": 0,
+        "updated": 0,
+        "deleted": 0,
+    }
+
+
+def test_only_the_changed_reminder_is_updated(reconcile_reminders, user_medicine, db):
+    (first_id, *first), (second_id, _, message, status) = submitted_as_stored(user_medicine)
+
+    counts = reconcile_reminders(
+        user_medicine, [(first_id, *first), (second_id, "15:30", message, status)]
+    )
+    db.session.commit()
+
+    assert counts == {"created": 0, "updated": 1, "deleted": 0}
+    assert [row[0] for row in stored(user_medicine.id)] == [time(8, 0), time(15, 30)]
+
+
+def test_new_rows_are_created_and_missing_ones_deleted(reconcile_reminders, user_medicine, db):
+    first, _ = submitted_as_stored(user_medicine)
+
+    counts = reconcile_reminders(user_medicine, [first, (None, "21:00", "Night dose", "pending")])
+    db.session.commit()
+
+    assert counts == {"created": 1, "updated": 0, "deleted": 1}
+    assert stored(user_medicine.id) == [
+        (time(8, 0), "Take Aspirin", "pending"),
+        (time(21, 0), "Night dose", "pending"),
+    ]
+
+
+def test_a_repeated_id_is_only_matched_once(reconcile_reminders, user_medicine, db):
+    first, _ = submitted_as_stored(user_medicine)
+    duplicate = (first[0], "09:00", "Copy", "pending")
+
+    counts = reconcile_reminders(user_medicine, [first, duplicate])
+
+    assert counts == {"created": 1, "updated": 0, "deleted": 1}
+
+
+def test_invalid_times_are_skipped(reconcile_reminders, user_medicine):
+    first, second = submitted_as_stored(user_medicine)
+
+    counts = reconcile_reminders(user_medicine, [first, (second[0], "", "No time", "pending")])
+
+    assert counts == {"created": 0, "updated": 0, "deleted": 1}
+
+
+def test_the_daily_resets_status_is_not_a_change(reconcile_reminders, user_medicine, db):
+    # The daily reset writes "Pending", the form "pending"
+    for reminder in user_medicine.reminders:
+        reminder.status = "Pending"
+    db.session.flush()
+
+    counts = reconcile_reminders(user_medicine, submitted_as_stored(user_medicine))
+
+    assert counts["updated"] == 0
@@ -0,0 +1,145 @@
+"""
+test_schedules.py
+-----------------
+
+Author:     David Rogers
+Email:      dave@djrogers.net.au
+Path:       /path/to/project/tests/test_schedules.py
+
+Purpose:    Parsing, formatting and compiling structured medication schedules.
+"""
+
+from datetime import date, time, timedelta
+
+import pytest
+
+from app.schedules import (
+    ScheduleError,
+    compile_day,
+    dump_schedule,
+    first_occurrence,
+    format_schedule,
+    parse_schedule,
+)
+
+
+MONDAY = date(2026, 10, 19)
+
+
+def minutes(*clocks):
+    return tuple(int(clock[:2]) * 60 + int(clock[3:]) for clock in clocks)
+
+
+def test_parse_schedule_reads_every_rule_form():
+    rules = parse_schedule(
+        """
+        daily 08:00,20:00
+        # Comments and blank lines are skipped
+
+        every 8h 06:00-22:00
+        Mon/Wed/Fri 09:00
+        2026-10-01..2026-10-07 08:00 dose 40 mg
+        2026-10-01.. every 2 days 07:30
+        """
+    )
+
+    assert rules == [
+        {"times": ["08:00", "20:00"]},
+        {"every_hours": 8, "from": "06:00", "until": "22:00"},
+        {"weekdays": [0, 2, 4], "times": ["09:00"]},
+        {"start": "2026-10-01", "end": "2026-10-07", "times": ["08:00"], "dose": "40 mg"},
+        {"start": "2026-10-01", "every_days": 2, "times": ["07:30"]},
+    ]
+
+
+def test_format_schedule_round_trips():
+    text = "daily 08:00\nmon,fri every 6h 06:00-18:00\n..2026-12-31 daily 12:00 dose 5 mg"
+    rules = parse_schedule(text)
+
+    assert parse_schedule(format_schedule(rules)) == rules
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("", "The schedule has no rules"),
+        ("daily", "Line 1: expected the times"),
+        ("daily 08:00\nfunday 08:00", "Line 2: expected the times"),
+        ("25:00", "Line 1: 25:00 is not a valid time"),
+        ("every 2 days 08:00", "Line 1: 'every N days' needs a start date"),
+        ("2026-10-09..2026-10-01 08:00", "Line 1: the date range ends before it starts"),
+        ("every 30h", "Line 1: 'every Nh' needs N from 1 to 24"),
+        ("08:00 dose", "Line 1: 'dose' needs the amount"),
+        ("08:00 extra", "Line 1: didn't understand 'extra'"),
+    ],
+)
+def test_parse_schedule_rejects_invalid_lines(text, message):
+    with pytest.raises(ScheduleError, match=message):
+        parse_schedule(text)
+
+
+def test_compile_day_applies_weekdays_and_date_ranges():
+    stored = dump_schedule(
+        parse_schedule("mon,wed 09:00\n2026-10-20..2026-10-21 daily 13:00\n..2026-10-19 07:00")
+    )
+
+    assert compile_day(stored, MONDAY) == (minutes("07:00", "09:00"), (None, None))
+    assert compile_day(stored, MONDAY + timedelta(days=1)) == (minutes("13:00"), (None,))
+    assert compile_day(stored, MONDAY + timedelta(days=2))[0] == minutes("09:00", "13:00")
+    assert compile_day(stored, MONDAY + timedelta(days=3)) == ((), ())
+
+
+def test_compile_day_counts_every_n_days_from_the_start_date():
+    stored = dump_schedule(parse_schedule("2026-10-19.. every 3 days 07:30"))
+
+    days = [MONDAY + timedelta(days=offset) for offset in range(10)]
+    assert [day.day for day in days if compile_day(stored, day)[0]] == [19, 22, 25, 28]
+    assert compile_day(stored, MONDAY - timedelta(days=3)) == ((), ())
+
+
+def test_compile_day_expands_hourly_rules_within_their_window():
+    stored = dump_schedule(parse_schedule("every 8h 06:00-22:00\nevery 12h"))
+
+    assert compile_day(stored, MONDAY)[0] == minutes("00:00", "06:00", "12:00", "14:00", "22:00")
+
+
+def test_compile_day_uses_the_first_rules_dose_where_rules_overlap():
+    stored = dump_schedule(parse_schedule("08:00,20:00 dose 40 mg\n08:00,12:00 dose 20 mg"))
+
+    assert compile_day(stored, MONDAY) == (
+        minutes("08:00", "12:00", "20:00"),
+        ("40 mg", "20 mg", "40 mg"),
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "daily 08:00",
+        "fri 07:00\nmon,wed 09:00",
+        "2026-11-01.. every 3 days 07:30",
+        "..2026-10-01 08:00",
+        "2026-10-20..2026-10-22 sun 08:00",
+        "sat every 6h 02:00-20:00\ntue 01:00",
+        "2027-10-01.. 08:00",
+        "2026-01-01..2026-12-31 every 5 days 10:00\nthu 11:00",
+    ],
+)
+def test_first_occurrence_matches_stepping_through_the_days(text):
+    rules = parse_schedule(text)
+    stored = dump_schedule(rules)
+    for start in (date(2026, 9, 30), MONDAY, date(2026, 10, 24), date(2026, 12, 31)):
+        expected = None
+        for offset in range(366):
+            day_minutes, _ = compile_day(stored, start + timedelta(days=offset))
+            if day_minutes:
+                expected = time(day_minutes[0] // 60, day_minutes[0] % 60)
+                break
+        assert first_occurrence(rules, start) == expected, start
+
+
+def test_first_occurrence_leaves_the_day_cache_alone():
+    compile_day.cache_clear()
+
+    assert first_occurrence(parse_schedule("2027-09-01.. 08:00"), MONDAY) == time(8, 0)
+    assert compile_day.cache_info().currsize == 0